@@ -0,0 +1,345 @@
+"""
+Generator of synthetic 888poker cash game hand histories (NLHE and PLO4) for benchmarks.
+Hands are consistent: bets, uncalled bets, dead blinds, rake and collected amounts add up,
+so tracker_utils.hand_parser parses every generated hand.
+Usage:
+    python -m benchmarks.generate_hh FOLDER --files 10 --hands 1000 --game PLO4
+"""
+
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+NLHE = "NLHE"
+PLO4 = "PLO4"
+MIXED = "mixed"
+GAME_NAMES = {NLHE: "No Limit Holdem", PLO4: "Pot Limit Omaha"}
+HOLE_CARDS = {NLHE: 2, PLO4: 4}
+# big blind in cents: (stakes in header, small blind, big blind)
+STAKES = {
+    2: ("$0.01/$0.02", 1, 2),
+    5: ("$0.02/$0.05", 2, 5),
+    10: ("$0.05/$0.10", 5, 10),
+    25: ("$0.12/$0.25", 10, 25),
+    50: ("$0.25/$0.50", 25, 50),
+    100: ("$0.50/$1", 50, 100),
+}
+RANKS = "23456789TJQKA"
+SUITS = "cdhs"
+DECK = [rank + suit for rank in RANKS for suit in SUITS]
+SEATS = range(1, 11)
+TABLES = ("Cheonan", "Cusco", "Lima", "Osaka", "Tbilisi", "Quito", "Porto", "Riga")
+# rake is 5% of pot taken only if flop is dealt, limited by cap in big blinds
+RAKE_PERCENT = 5
+RAKE_CAP_BB = 12
+DEFAULT_HERO = "0xferr"
+
+
+def money(cents: int) -> str:
+    """888poker amount format: $0.25, $1, $18.20"""
+    dollars, cents = divmod(cents, 100)
+    return f"${dollars}" if cents == 0 else f"${dollars}.{cents:02d}"
+
+
+class HandGenerator:
+    """
+    Generates hands of one table, every hand is text in 888poker format.
+    Input:
+        game: NLHE or PLO4
+        seats: number of players at table (2-10)
+        big_blind: big blind in cents, one of STAKES
+        showdowns: share of hands that are played to showdown (0-1)
+        dead_blinds: share of hands with a player posting dead blind (0-1)
+        hero: name of player whose cards are dealt face up
+        rnd: random generator, seeded for repeatable files
+        start: datetime of the first hand
+        first_id: ID of the first hand, next hands get following IDs
+    """
+
+    def __init__(
+        self,
+        game: str = PLO4,
+        seats: int = 6,
+        big_blind: int = 25,
+        showdowns: float = 0.3,
+        dead_blinds: float = 0.05,
+        hero: str = DEFAULT_HERO,
+        rnd: random.Random = None,
+        start: datetime = None,
+        first_id: int = 900000000,
+    ) -> None:
+        self.game = game
+        self.big_blind = big_blind
+        self.stakes, self.sb, self.bb = STAKES[big_blind]
+        self.showdowns = showdowns
+        self.dead_blinds = dead_blinds
+        self.rnd = rnd or random.Random()
+        self.time = start or datetime(2024, 1, 1)
+        self.next_id = first_id
+        self.table = f"{self.rnd.choice(TABLES)} {max(seats, 6)} Max"
+        self.seats = sorted(self.rnd.sample(SEATS, seats))
+        self.names = [hero] + [f"Player{self.rnd.randrange(10**6):06d}" for _ in SEATS]
+        self.names = self.names[:seats]
+        self.rnd.shuffle(self.names)
+        self.stacks = {name: self._buy_in() for name in self.names}
+        self.button = 0
+        self.hero = hero
+
+    def _buy_in(self) -> int:
+        return self.rnd.randrange(60, 250) * self.bb
+
+    def hand(self) -> str:
+        """Returns next hand history"""
+        rnd = self.rnd
+        n = len(self.names)
+        self.button = (self.button + 1) % n
+        # players leaving the table with short stack are replaced by new buy-in
+        for name, stack in self.stacks.items():
+            if stack < 20 * self.bb:
+                self.stacks[name] = self._buy_in()
+        deck = rnd.sample(DECK, len(DECK))
+        cards = {
+            name: [deck.pop() for _ in range(HOLE_CARDS[self.game])]
+            for name in self.names
+        }
+        board = [deck.pop() for _ in range(5)]
+        # players in order of action preflop: from seat after big blind
+        order = [self.names[(self.button + i) % n] for i in range(1, n + 1)]
+        sb_player, bb_player = (order[-1], order[0]) if n == 2 else order[:2]
+        lines = self._header(n)
+        bets = dict.fromkeys(self.names, 0)
+        street = dict.fromkeys(self.names, 0)
+        dead, poster = 0, None
+        lines.append(f"{sb_player} posts small blind [{money(self.sb)}]")
+        lines.append(f"{bb_player} posts big blind [{money(self.bb)}]")
+        street[sb_player], street[bb_player] = self.sb, self.bb
+        if n > 3 and rnd.random() < self.dead_blinds:
+            poster = rnd.choice(order[2:])
+            lines.append(
+                f"{poster} posts dead blind [{money(self.sb)} + {money(self.bb)}]"
+            )
+            street[poster] = self.bb
+            dead = self.sb
+        lines.append("** Dealing down cards **")
+        lines.append(f"Dealt to {self.hero} [ {', '.join(cards[self.hero])} ]")
+        showdown = rnd.random() < self.showdowns
+        preflop_order = order[2:] + order[:2] if n > 2 else order[::-1]
+        active = self._betting(
+            lines, preflop_order, street, bets, self.bb, showdown, preflop=True
+        )
+        flop_dealt = False
+        postflop_order = [p for p in order if p in active]
+        for name, cards_on_board in (("flop", 3), ("turn", 4), ("river", 5)):
+            if len(active) < 2:
+                break
+            flop_dealt = True
+            new_cards = board[:3] if name == "flop" else [board[cards_on_board - 1]]
+            lines.append(f"** Dealing {name} ** [ {', '.join(new_cards)} ]")
+            street = dict.fromkeys(self.names, 0)
+            active = self._betting(
+                lines,
+                [p for p in postflop_order if p in active],
+                street,
+                bets,
+                0,
+                showdown,
+                river=name == "river",
+            )
+        lines.append("** Summary **")
+        # uncalled part of the biggest bet is returned
+        contributions = sorted(bets.values())
+        top = max(bets, key=bets.get)
+        if contributions[-1] != contributions[-2]:
+            bets[top] = contributions[-2]
+        pot = sum(bets.values()) + dead
+        rake = 0
+        if flop_dealt:
+            rake = min(pot * RAKE_PERCENT // 100, RAKE_CAP_BB * self.bb)
+        winners = self._winners(lines, active, cards)
+        share, remainder = divmod(pot - rake, len(winners))
+        for i, winner in enumerate(winners):
+            won = share + (remainder if i == 0 else 0)
+            lines.append(f"{winner} collected [ {money(won)} ]")
+            self.stacks[winner] += won
+        for name in self.names:
+            self.stacks[name] -= bets[name]
+        if poster is not None:
+            self.stacks[poster] -= dead
+        return "\n".join(lines)
+
+    def _header(self, n: int) -> list[str]:
+        hand_id = self.next_id
+        self.next_id += 1
+        self.time += timedelta(seconds=self.rnd.randrange(25, 90))
+        return [
+            f"***** 888poker Hand History for Game {hand_id} *****",
+            f"{self.stakes} Blinds {GAME_NAMES[self.game]} - *** "
+            + self.time.strftime("%d %m %Y %H:%M:%S"),
+            f"Table {self.table} (Real Money)",
+            f"Seat {self.seats[self.button]} is the button",
+            f"Total number of players : {n}",
+        ] + [
+            f"Seat {seat}: {name} ( {money(self.stacks[name])} )"
+            for seat, name in zip(self.seats, self.names)
+        ]
+
+    def _betting(
+        self,
+        lines: list[str],
+        order: list[str],
+        street: dict[str, int],
+        bets: dict[str, int],
+        to_call: int,
+        showdown: bool,
+        preflop: bool = False,
+        river: bool = False,
+    ) -> list[str]:
+        """
+        Plays betting round, writes actions and adds chips put in pot to bets.
+        In showdown hands nobody folds after flop, other hands end on river by a bet nobody calls.
+        Returns players left in hand.
+        """
+        rnd = self.rnd
+        active = list(order)
+        raises = 0
+        acted = set()
+        i = 0
+        while len(active) > 1:
+            player = active[i % len(active)]
+            if player in acted and street[player] == to_call:
+                break
+            acted.add(player)
+            # the smallest stack limits bets, so nobody is all-in and there are no side pots
+            cap = min(self.stacks[p] - bets[p] for p in active)
+            owe = to_call - street[player]
+            roll = rnd.random()
+            if river and not showdown:
+                roll = 0.0 if owe > 0 else 1.0
+            can_fold = owe > 0 and (preflop or not showdown)
+            if can_fold and roll < (0.55 if preflop else 0.4):
+                lines.append(f"{player} folds")
+                active.remove(player)
+                continue
+            if raises < 2 and roll > 0.85 and cap > to_call:
+                pot = sum(bets.values()) + sum(street.values())
+                size = to_call * 3 if preflop else max(pot // 2, self.bb)
+                amount = min(max(size, to_call + self.bb), cap) - street[player]
+                action = "raises" if to_call else "bets"
+                lines.append(f"{player} {action} [{money(amount)}]")
+                street[player] += amount
+                to_call = street[player]
+                raises += 1
+                acted = {player}
+            elif owe > 0:
+                lines.append(f"{player} calls [{money(owe)}]")
+                street[player] += owe
+            else:
+                lines.append(f"{player} checks")
+            i = active.index(player) + 1
+        for player, amount in street.items():
+            bets[player] += amount
+        return active
+
+    def _winners(
+        self, lines: list[str], active: list[str], cards: dict[str, list[str]]
+    ) -> list[str]:
+        """Shows cards at showdown, returns winners of pot (sometimes split)"""
+        if len(active) == 1:
+            lines.append(f"{active[0]} did not show his hand")
+            return active
+        for player in active:
+            lines.append(f"{player} shows [ {', '.join(cards[player])} ]")
+        winners = self.rnd.sample(active, 2 if self.rnd.random() < 0.05 else 1)
+        return winners
+
+
+def generate(
+    folder: str,
+    files: int = 10,
+    hands: int = 1000,
+    game: str = PLO4,
+    seats: int = 6,
+    big_blind: int = 25,
+    showdowns: float = 0.3,
+    dead_blinds: float = 0.05,
+    hero: str = DEFAULT_HERO,
+    seed: int = 1,
+) -> list[str]:
+    """
+    Writes files with hands of one table each, game MIXED alternates NLHE and PLO4 tables.
+    Files are the same for the same arguments. Returns paths of written files.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rnd = random.Random(seed)
+    paths = []
+    for i in range(files):
+        table_game = game if game != MIXED else (NLHE, PLO4)[i % 2]
+        generator = HandGenerator(
+            table_game,
+            seats,
+            big_blind,
+            showdowns,
+            dead_blinds,
+            hero,
+            rnd,
+            start=datetime(2024, 1, 1) + timedelta(hours=6 * i),
+            first_id=900000000 + i * hands,
+        )
+        path = os.path.join(folder, f"{generator.table.split()[0]}_{i:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for _ in range(hands):
+                f.write("\n\n" + generator.hand())
+        paths.append(path)
+    return paths
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Generator options, shared with benchmarks runner"""
+    parser.add_argument("--files", type=int, default=10, help="Number of files")
+    parser.add_argument("--hands", type=int, default=1000, help="Hands per file")
+    parser.add_argument(
+        "--game", choices=(NLHE, PLO4, MIXED), default=MIXED, help="Game of tables"
+    )
+    parser.add_argument("--seats", type=int, default=6, help="Players at table")
+    parser.add_argument(
+        "--big-blind",
+        type=int,
+        choices=list(STAKES),
+        default=25,
+        help="Big blind in cents",
+    )
+    parser.add_argument(
+        "--showdowns", type=float, default=0.3, help="Share of hands with showdown"
+    )
+    parser.add_argument(
+        "--dead-blinds",
+        type=float,
+        default=0.05,
+        help="Share of hands with posted dead blind",
+    )
+    parser.add_argument("--hero", default=DEFAULT_HERO, help="Player name of hero")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+
+
+def generator_options(args: argparse.Namespace) -> dict:
+    return {
+        "files": args.files,
+        "hands": args.hands,
+        "game": args.game,
+        "seats": args.seats,
+        "big_blind": args.big_blind,
+        "showdowns": args.showdowns,
+        "dead_blinds": args.dead_blinds,
+        "hero": args.hero,
+        "seed": args.seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate 888poker hand histories")
+    parser.add_argument("folder", help="Folder files are written to")
+    add_arguments(parser)
+    args = parser.parse_args()
+    paths = generate(args.folder, **generator_options(args))
+    print(f"{len(paths)} files, {args.files * args.hands} hands in {args.folder}")
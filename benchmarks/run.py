@@ -0,0 +1,289 @@
+"""
+Benchmarks of parsing, import and reports on synthetic hand histories.
+Every run generates hands with benchmarks.generate_hh, imports them to a separate benchmark
+database (SQLite file in temporary folder, or PostgreSQL database given by --postgresql),
+measures every benchmark and saves results to benchmarks/results/ for comparison between runs.
+Usage:
+    python -m benchmarks.run --files 20 --hands 1000
+    python -m benchmarks.run --postgresql py_hh_bench --compare
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generate_hh import add_arguments, generator_options, generate
+from tracker_utils import calc
+from tracker_utils.config import read_config
+from benchmarks import baseline_parser
+from tracker_utils.hand_parser import iter_hands, parse_hand, parse_hh_file
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BENCHMARKS = (
+    "parse_hand",
+    "baseline_parse_hand",
+    "parse_file",
+    "parse_hh_file",
+    "import_hh",
+    "get_profit",
+    "get_rake",
+    "cumulate_profit",
+    "sum_by_weeks",
+    "sum_by_month",
+    "sum_cents_by_weeks",
+)
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """Runs func repeat times, setup is called before every run and isn't measured"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "median": statistics.median(times)}
+
+
+def run_benchmarks(args: argparse.Namespace, folder: str) -> dict:
+    """Runs benchmarks in folder with generated files, returns results by benchmark name"""
+    results = {}
+    files = sorted(glob.glob(os.path.join(folder, "*.txt")))
+    size = sum(os.path.getsize(path) for path in files)
+
+    def add(name: str, timing: dict, items: int, unit: str = "hands") -> None:
+        timing.update(items=items, unit=unit, rate=items / timing["best"])
+        results[name] = timing
+        print(
+            f"{name:<20}{timing['best']:>10.4f} s{timing['median']:>10.4f} s"
+            f"{timing['rate']:>14,.0f} {unit}/s"
+        )
+
+    print(f"{'benchmark':<20}{'best':>12}{'median':>12}{'rate':>20}")
+    if selected(args, "parse_hand"):
+        hands = [hand for path in files for hand in iter_hands(path)]
+        add(
+            "parse_hand",
+            measure(lambda: [parse_hand(id, hh) for id, hh in hands], args.repeat),
+            len(hands),
+        )
+    if selected(args, "baseline_parse_hand"):
+        hands = [hand for path in files for hand in iter_hands(path)]
+        timing = measure(
+            lambda: [baseline_parser.parse_hand(id, hh) for id, hh in hands],
+            args.repeat,
+        )
+        add("baseline_parse_hand", timing, len(hands))
+    if selected(args, "parse_file"):
+        texts = []
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                texts.append(f.read())
+        timing = measure(
+            lambda: [baseline_parser.parse_file(text, set()) for text in texts],
+            args.repeat,
+        )
+        add("parse_file", timing, size, "bytes")
+    if selected(args, "parse_hh_file"):
+        timing = measure(
+            lambda: [parse_hh_file(path, set()) for path in files], args.repeat
+        )
+        add("parse_hh_file", timing, size, "bytes")
+
+    if not any(
+        selected(args, name) for name in BENCHMARKS[BENCHMARKS.index("import_hh") :]
+    ):
+        return results
+    # the rest use benchmark database, configured in config.ini of work folder
+    from tracker_utils.tracker import Tracker
+
+    hands_count = args.files * args.hands
+    tracker = None
+
+    def clear() -> None:
+        nonlocal tracker
+        if tracker is not None:
+            tracker.close()
+        tracker = Tracker(player=args.hero, clear_tables=True)
+
+    def import_hh() -> None:
+        tracker.import_hh(folder, workers=args.workers)
+
+    if selected(args, "import_hh"):
+        add("import_hh", measure(import_hh, args.repeat, setup=clear), hands_count)
+    else:
+        clear()
+        import_hh()
+    db = tracker.db
+    profit = db.get_profit(args.hero)
+    rows = len(profit)
+    if selected(args, "get_profit"):
+        add("get_profit", measure(lambda: db.get_profit(args.hero), args.repeat), rows)
+    if selected(args, "get_rake"):
+        add("get_rake", measure(lambda: db.get_rake(args.hero), args.repeat), rows)
+    if selected(args, "cumulate_profit"):
+        values = [value for _, value in profit]
+        timing = measure(lambda: calc.cumulate_profit(values), args.repeat)
+        add("cumulate_profit", timing, rows)
+    for name in ("sum_by_weeks", "sum_by_month"):
+        if selected(args, name):
+            func = getattr(calc, name)
+            add(name, measure(lambda: func(profit), args.repeat), rows)
+    if selected(args, "sum_cents_by_weeks"):
+        arrays = calc.to_arrays(profit)
+        timing = measure(lambda: calc.sum_cents_by_weeks(*arrays), args.repeat)
+        add("sum_cents_by_weeks", timing, rows)
+    tracker.close()
+    return results
+
+
+def selected(args: argparse.Namespace, name: str) -> bool:
+    return not args.only or name in args.only
+
+
+def write_config(folder: str, postgresql: str = None) -> None:
+    """
+    Writes config.ini of benchmark work folder: SQLite file in it, or PostgreSQL database
+    with connection parameters of project's config.ini. Database is created if it doesn't exist.
+    """
+    lines = ["[tracker]", "player_name=", "import_folder=", "[storage]"]
+    if postgresql is None:
+        lines += ["backend=sqlite", f"path={os.path.join(folder, 'bench.sqlite')}"]
+    else:
+        params = read_config(section="postgresql")
+        create_database(params, postgresql)
+        params["database"] = postgresql
+        lines += ["backend=postgresql", "[postgresql]"]
+        lines += [f"{key}={value}" for key, value in params.items()]
+    with open(os.path.join(folder, "config.ini"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def create_database(params: dict, database: str) -> None:
+    import psycopg2
+
+    if database == params.get("database"):
+        sys.exit("Benchmark clears its database, use a database other than tracker's")
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database,))
+    if cur.fetchone() is None:
+        cur.execute(f'CREATE DATABASE "{database}"')
+    conn.close()
+
+
+def save_results(args: argparse.Namespace, results: dict) -> str:
+    """Saves results with run parameters to RESULTS_DIR, returns path of file"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    data = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": "postgresql" if args.postgresql else "sqlite",
+        "workers": args.workers,
+        "generator": generator_options(args),
+        "results": results,
+    }
+    path = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    return path
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(RESULTS_DIR),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def previous_results(exclude: str) -> str | None:
+    """Path of the latest saved results other than exclude"""
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    paths = [path for path in paths if path != exclude]
+    return paths[-1] if paths else None
+
+
+def compare(args: argparse.Namespace, path: str, results: dict) -> None:
+    """Prints best times of this run against results saved in path, ratio > 1 is slower"""
+    with open(path) as f:
+        old = json.load(f)
+    print(f"\nCompared to {os.path.basename(path)} (commit {old.get('commit')}):")
+    if old["generator"] != generator_options(args):
+        print("Warning: hands were generated with different options")
+    print(f"{'benchmark':<20}{'old':>12}{'new':>12}{'ratio':>10}")
+    for name, timing in results.items():
+        if name not in old["results"]:
+            continue
+        before = old["results"][name]["best"]
+        print(
+            f"{name:<20}{before:>10.4f} s{timing['best']:>10.4f} s"
+            f"{timing['best'] / before:>10.2f}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Tracker benchmarks")
+    add_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every benchmark")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Parsing processes of import_hh"
+    )
+    parser.add_argument(
+        "--postgresql",
+        metavar="DATABASE",
+        help="Benchmark PostgreSQL database (created and cleared), SQLite if not set",
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks"
+    )
+    parser.add_argument(
+        "--compare",
+        nargs="?",
+        const="latest",
+        help="Compare with saved results file, latest by default",
+    )
+    parser.add_argument(
+        "--no-save", dest="save", action="store_false", help="Don't save results"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    with tempfile.TemporaryDirectory(prefix="tracker_bench_") as work:
+        folder = os.path.join(work, "hh")
+        generate(folder, **generator_options(ARGS))
+        write_config(work, ARGS.postgresql)
+        cwd = os.getcwd()
+        # tracker reads config.ini of current folder
+        os.chdir(work)
+        try:
+            results = run_benchmarks(ARGS, folder)
+        finally:
+            os.chdir(cwd)
+    path = save_results(ARGS, results) if ARGS.save else None
+    if path:
+        print(f"\nResults are saved to {path}")
+    if ARGS.compare:
+        old = previous_results(path) if ARGS.compare == "latest" else ARGS.compare
+        if old is None:
+            print("No saved results to compare with")
+        else:
+            compare(ARGS, old, results)
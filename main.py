@@ -2,7 +2,8 @@ from datetime import datetime, timezone
 from tracker_utils.logger import logger
 from tracker_utils.tracker import Tracker
 from tracker_utils.config import read_config, update_config
-from tracker_utils.io import parser, print_results
+from tracker_utils.io import parser, print_results, print_profile, print_hands
+from tracker_utils.profiler import ImportProfile
 
 
 PERIODS_NAMES = {
@@ -18,6 +19,33 @@ def str_to_dt(date: str):
     return res.replace(tzinfo=timezone.utc)
 
 
+def parse_period(text: str):
+    """Returns (period, start_date, end_date) of period in the format of --results"""
+    start_date = None
+    end_date = None
+    period = None
+    parts = text.split("=")
+    if len(parts) == 2:
+        query_type, date_range = parts
+        if query_type == "since":
+            start_date = str_to_dt(date_range)
+        elif query_type == "before":
+            end_date = str_to_dt(date_range)
+        elif query_type == "between":
+            start_date, end_date = map(lambda x: str_to_dt(x), date_range.split("-"))
+    elif text in PERIODS_NAMES.keys():
+        period = text
+    elif text != "all":
+        lg.error(f"Wrong period '{text}'. Expecting one of these: {PERIODS_NAMES.keys}")
+    return period, start_date, end_date
+
+
+def read_ids(path: str) -> list[int]:
+    """Reads hand IDs from file, one per line"""
+    with open(path) as f:
+        return [int(line) for line in f if line.strip()]
+
+
 def main():
     config = read_config(section="tracker")
 
@@ -27,51 +55,107 @@ def main():
     args = parser()
     lg.debug(args)
 
-    tr = Tracker(player=player, chart=bool(args.chart))
+    tr = Tracker(player=player, chart=bool(args.chart), headless=args.headless)
     # Import HH to DB
     if args.import_hh is not None:
         if args.import_hh != "":
             folder = args.import_hh
         print(f"Importing HHs from folder: {folder}")
-        tr.import_hh(folder)
+        profile = None
+        if args.profile or args.profile_json or args.profile_cprofile:
+            profile = ImportProfile(cprofile=bool(args.profile_cprofile))
+        tr.import_hh(folder, workers=args.workers, profile=profile)
+        if profile is not None:
+            print_profile(profile)
+            if args.profile_json:
+                profile.save_json(args.profile_json)
+            if args.profile_cprofile:
+                profile.save_cprofile(args.profile_cprofile)
+
+    if args.rebuild_stats:
+        print("Rebuilding daily stats")
+        tr.db.rebuild_daily_stats()
+
+    if args.rebuild_cache:
+        print("Rebuilding column cache")
+        tr.rebuild_cache()
 
     # setting player_name
     if args.player:
         tr.player = args.player
         player = args.player
 
+    if args.check_plans:
+        plans = tr.db.check_query_plans(player)
+        for query, tables in plans.items():
+            if tables:
+                lg.error(f"Query '{query}' reads without index: {', '.join(tables)}")
+            else:
+                print(f"Query '{query}' uses indexes only")
+
     # display results
+    start_date = None
+    end_date = None
+    period = None
     if args.results:
-        start_date = None
-        end_date = None
-        period = None
-        parts = args.results.split("=")
-        if len(parts) == 2:
-            query_type, date_range = parts
-            if query_type == "since":
-                start_date = str_to_dt(date_range)
-            elif query_type == "before":
-                end_date = str_to_dt(date_range)
-            elif query_type == "between":
-                start_date, end_date = map(
-                    lambda x: str_to_dt(x), date_range.split("-")
-                )
-        elif args.results:
-            if args.results in PERIODS_NAMES.keys():
-                period = args.results
-            elif args.results != "all":
-                lg.error(
-                    f"Wrong period '{args.results}'. Expecting one of these: {PERIODS_NAMES.keys}"
+        period, start_date, end_date = parse_period(args.results)
+        profit, rake = tr.get_results(
+            period=period, start_date=start_date, end_date=end_date
+        )
+        print_results(profit, rake)
+
+    # search hands by cards
+    if args.cards:
+        try:
+            hands = tr.find_hands(args.cards, game=args.game)
+        except ValueError as error:
+            lg.error(error)
+        else:
+            print_hands(hands)
+
+    # export hand histories to file
+    if args.export:
+        ids = args.ids
+        if args.ids_file:
+            ids = (ids or []) + read_ids(args.ids_file)
+        export_period, export_start, export_end = parse_period(args.export_period)
+        print(f"Exporting HHs to file: {args.export}")
+        tr.export_hh(
+            args.export,
+            all_players=args.all_players,
+            game=args.game,
+            stake=round(args.stake * 100) if args.stake else None,
+            ids=ids,
+            period=export_period,
+            start_date=export_start,
+            end_date=export_end,
+        )
+
+    # import new hands while they are written
+    if args.watch:
+        # watcher is loaded only for watch mode
+        from tracker_utils.watcher import Watcher
+
+        if args.import_hh:
+            folder = args.import_hh
+
+        def on_import(hands_imported: int) -> None:
+            print(f"{hands_imported} new hands imported")
+            if args.results:
+                profit, rake = tr.get_results(
+                    period=period, start_date=start_date, end_date=end_date
                 )
+                print_results(profit, rake)
 
-        profit = tr.get_profit(period=period, start_date=start_date, end_date=end_date)
-        rake = tr.get_rake(period=period, start_date=start_date, end_date=end_date)
-        print_results(profit, rake)
+        print(f"Watching HHs in folder: {folder}")
+        Watcher(tr, folder, workers=args.workers, interval=args.watch_interval).run(
+            on_import
+        )
 
     if args.save:
         update_config("player_name", player)
         update_config("import_folder", folder)
-    tr.db.close()
+    tr.close()
 
 
 if __name__ == "__main__":
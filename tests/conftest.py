@@ -0,0 +1,79 @@
+import os
+import shutil
+
+import pytest
+
+from tracker_utils.config import read_config
+from tracker_utils.tracker import Tracker
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_HHS = os.path.join(REPO, "test_hhs")
+# hands in test_hhs and results of player 0xferr
+TEST_HANDS = 88
+PLAYER = "0xferr"
+# name of PostgreSQL database tests may clear, connection parameters are taken from
+# [postgresql] section of project's config.ini. PostgreSQL tests are skipped if it isn't set
+TEST_POSTGRESQL = "PY_HH_TEST_POSTGRESQL"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Working folder with config.ini of SQLite storage and column cache, and a copy of test_hhs"""
+    shutil.copytree(TEST_HHS, tmp_path / "hhs")
+    (tmp_path / "config.ini").write_text(
+        "[tracker]\n"
+        f"player_name={PLAYER}\n"
+        "[storage]\n"
+        "backend=sqlite\n"
+        f"path={tmp_path / 'hands.sqlite'}\n"
+        "[cache]\n"
+        f"path={tmp_path / 'cache'}\n"
+    )
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def tracker(workdir):
+    tracker = Tracker(player=PLAYER, headless=True)
+    yield tracker
+    tracker.close()
+
+
+@pytest.fixture
+def pg_tracker(tmp_path, monkeypatch):
+    """Tracker with cleared PostgreSQL test database, skipped if server or config isn't available"""
+    database = os.environ.get(TEST_POSTGRESQL)
+    if not database:
+        pytest.skip(f"set {TEST_POSTGRESQL} to name of a test database")
+    psycopg2 = pytest.importorskip("psycopg2")
+    try:
+        params = read_config(os.path.join(REPO, "config.ini"), section="postgresql")
+    except Exception:
+        pytest.skip("config.ini with [postgresql] section isn't found")
+    if database == params.get("database"):
+        pytest.skip("tests clear their database, use a database other than tracker's")
+    try:
+        conn = psycopg2.connect(**params)
+    except psycopg2.OperationalError as exc:
+        pytest.skip(f"PostgreSQL isn't available: {exc}")
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database,))
+    if cur.fetchone() is None:
+        cur.execute(f'CREATE DATABASE "{database}"')
+    conn.close()
+
+    shutil.copytree(TEST_HHS, tmp_path / "hhs")
+    params["database"] = database
+    (tmp_path / "config.ini").write_text(
+        "[tracker]\n"
+        f"player_name={PLAYER}\n"
+        "[storage]\n"
+        "backend=postgresql\n"
+        "[postgresql]\n" + "".join(f"{key}={value}\n" for key, value in params.items())
+    )
+    monkeypatch.chdir(tmp_path)
+    tracker = Tracker(player=PLAYER, clear_tables=True, headless=True)
+    yield tracker
+    tracker.close()
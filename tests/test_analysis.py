@@ -0,0 +1,56 @@
+import json
+from decimal import Decimal
+
+import tracker_utils.analysis as analysis
+from tracker_utils.analysis import RakeCalc
+from conftest import PLAYER, TEST_HHS
+
+
+def test_results_match_tracker(tracker, workdir):
+    tracker.import_hh(str(workdir / "hhs"))
+    calc = RakeCalc(PLAYER, cache_path=None)
+    (hands, rake, profit), weekly, monthly = calc.summary(calc.analyze([TEST_HHS]))
+    assert isinstance(rake, Decimal)
+    assert Decimal(profit) / 100 == tracker.get_profit()[0] == Decimal("6.62")
+    assert (rake / 100).quantize(Decimal("1e-12")) == tracker.get_rake()[0].quantize(
+        Decimal("1e-12")
+    )
+    assert hands == sum(week[0] for week in weekly.values())
+    assert list(monthly) == ["2023-03", "2023-06"]
+    assert {key: value[2] for key, value in weekly.items()} == {
+        "2023-13": 917,
+        "2023-23": -255,
+    }
+
+
+def test_cache_parses_only_changed_files(workdir, monkeypatch):
+    parsed = []
+
+    def analyze_file(filepath, hero):
+        parsed.append(filepath)
+        return real_analyze_file(filepath, hero)
+
+    real_analyze_file = analysis.analyze_file
+    monkeypatch.setattr(analysis, "analyze_file", analyze_file)
+    cache_path = str(workdir / "cache.json")
+    folder = workdir / "hhs"
+    calc = RakeCalc(PLAYER, cache_path=cache_path)
+    daily = calc.analyze([str(folder)])
+    files = len(parsed)
+    assert files > 0
+    with open(cache_path) as f:
+        assert json.load(f)["version"] == analysis.CACHE_VERSION
+
+    # cached results are the same, nothing is parsed
+    assert calc.analyze([str(folder)]) == daily
+    assert len(parsed) == files
+
+    # changed file is parsed again
+    kalamaria = folder / "Kalamaria.txt"
+    kalamaria.write_bytes(kalamaria.read_bytes() + b"\n")
+    assert calc.analyze([str(folder)]) == daily
+    assert parsed[files:] == [str(kalamaria)]
+
+    # cache of other player isn't used
+    RakeCalc("someone", cache_path=cache_path).analyze([str(folder)])
+    assert len(parsed) == 2 * files + 1
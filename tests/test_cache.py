@@ -0,0 +1,36 @@
+from tracker_utils.hand_parser import parse_hh_file
+from tracker_utils.column_cache import ColumnCache
+from conftest import PLAYER, TEST_HANDS
+
+
+def assert_cache_matches_db(tracker):
+    assert tracker.cache.is_valid()
+    assert tracker.cache.get_summary(PLAYER) == tracker.db.get_summary(PLAYER)
+
+
+def test_cache_is_updated_on_import(tracker, workdir):
+    assert tracker.import_hh(str(workdir / "hhs")) == TEST_HANDS
+    assert_cache_matches_db(tracker)
+
+
+def test_partial_import_rebuilds_cache(tracker, workdir):
+    files = tracker._files_to_import(str(workdir / "hhs"), {})
+    # some hands are already in database, but not in IDs given to import
+    hands, _ = parse_hh_file(files[0][0])
+    assert tracker.db.import_hands(hands[:5]) == 5
+    tracker.cache.rebuild(tracker.db)
+    assert tracker.import_files(files, set()) == TEST_HANDS - 5
+    assert_cache_matches_db(tracker)
+
+
+def test_invalid_cache_is_rebuilt(tracker, workdir):
+    tracker.import_hh(str(workdir / "hhs"))
+    tracker.cache.invalidate()
+    tracker.import_files([], set())
+    assert_cache_matches_db(tracker)
+    # cache left invalid by interrupted import is rebuilt when it is opened
+    tracker.cache.set_valid(False)
+    assert ColumnCache(str(workdir / "cache")).is_valid() is False
+    tracker.close()
+    tracker._cache_opened = False
+    assert_cache_matches_db(tracker)
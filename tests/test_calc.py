@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from tracker_utils import calc
+
+TBILISI = timezone(timedelta(hours=4))
+# ISO years 2020 and 2026 have 53 weeks, 2021-01-03 is in week 53 of 2020,
+# 2024-12-30 is in week 1 of 2025. Dates are grouped in UTC: 2025-12-29 01:00 in Tbilisi
+# is still in week 52 of 2025, not in week 1 of 2026
+DATES = [
+    datetime(2020, 12, 27, 23, 59, 59, tzinfo=timezone.utc),
+    datetime(2020, 12, 31, 12, tzinfo=timezone.utc),
+    datetime(2021, 1, 1, 2, tzinfo=TBILISI),
+    datetime(2021, 1, 3, 23, 59, 59, tzinfo=timezone.utc),
+    datetime(2021, 1, 4, 3, tzinfo=TBILISI),
+    datetime(2021, 1, 4, tzinfo=timezone.utc),
+    datetime(2024, 2, 29, 12, tzinfo=timezone.utc),
+    datetime(2024, 12, 29, 23, tzinfo=timezone.utc),
+    datetime(2024, 12, 30, tzinfo=timezone.utc),
+    datetime(2025, 1, 1, 3, 59, tzinfo=TBILISI),
+    datetime(2025, 12, 29, 1, tzinfo=TBILISI),
+    datetime(2026, 12, 31, 23, tzinfo=timezone.utc),
+    datetime(2027, 1, 3, 12, tzinfo=timezone.utc),
+    datetime(2027, 1, 4, 12, tzinfo=timezone.utc),
+]
+
+
+def rows(values: list[str]) -> list[tuple[datetime, Decimal]]:
+    return [(date, Decimal(value)) for date, value in zip(DATES, values)]
+
+
+@pytest.mark.parametrize(
+    "cents_sum, key",
+    [
+        (calc.sum_cents_by_weeks, calc.week_key),
+        (calc.sum_cents_by_month, calc.month_key),
+    ],
+)
+def test_cents_sums_match_decimal_loop(cents_sum, key):
+    data = rows(["0.01", "-1.5", "2", "0.25", "-0.07", "13.13", "100"] * 2)
+    expected = calc._sum_decimals_by_keys(data, key)
+    result = cents_sum(*calc.to_arrays(data))
+    assert result == expected
+    assert list(result) == list(expected)
+
+
+def test_iso_year_boundaries():
+    weeks = calc.sum_by_weeks(rows(["1"] * len(DATES)))
+    assert weeks == {
+        "2020-52": 1,
+        "2020-53": 4,
+        "2021-01": 1,
+        "2024-09": 1,
+        "2024-52": 1,
+        "2025-01": 2,
+        "2025-52": 1,
+        "2026-53": 2,
+        "2027-01": 1,
+    }
+    months = calc.sum_by_month(rows(["1"] * len(DATES)))
+    assert months == {
+        "2020-12": 3,
+        "2021-01": 3,
+        "2024-02": 1,
+        "2024-12": 3,
+        "2025-12": 1,
+        "2026-12": 1,
+        "2027-01": 2,
+    }
+
+
+def test_fractions_of_cent_are_summed_as_decimals():
+    data = rows(["0.005", "1.001", "2"])
+    assert calc.decimals_to_cents([value for _, value in data]) is None
+    assert calc.to_arrays(data) is None
+    assert calc.sum_by_weeks(data) == {
+        "2020-52": Decimal("0.005"),
+        "2020-53": Decimal("3.001"),
+    }
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from tracker_utils.cards import (
+    FEATURES,
+    card_features,
+    conditions_sql,
+    parse_pattern,
+)
+
+HANDS = {
+    1: "As Ks 5d 6d",
+    2: "As Ks 5d 6h",
+    3: "As Kd 5c 6h",
+    4: "Ac 4s 5d 6h",
+    5: "Ac 2s 3d 4h",
+    6: "9c 8s 7d 6h",
+    7: "9c 8s 6d 5h",
+    8: "Ac Ad Ks 2d",
+    9: "Ac Ad Kc Kd",
+    10: "Ac Ad As 2d",
+    11: "Ac Kc",
+    12: "Ac Kd",
+    13: None,
+}
+
+
+def features(cards: str) -> dict:
+    return dict(zip(FEATURES, card_features(cards)))
+
+
+@pytest.mark.parametrize(
+    "cards, suits",
+    [
+        ("As Ks 5d 6d", 22),
+        ("As Ks 5d 6h", 211),
+        ("As Kd 5c 6h", 1111),
+        ("Ac Kc", 2),
+        ("Ac Kd", 11),
+    ],
+)
+def test_suit_shape(cards, suits):
+    assert features(cards)["suits"] == suits
+
+
+@pytest.mark.parametrize(
+    "cards, gaps",
+    [
+        ("9c 8s 7d 6h", 0),
+        ("Ac 2s 3d 4h", 0),
+        ("Ac Ks Qd Jh", 0),
+        # ace plays low: A-4-5-6 misses 2 and 3
+        ("Ac 4s 5d 6h", 2),
+        ("9c 8s 6d 5h", 1),
+        ("As Ks 5d 6d", 6),
+    ],
+)
+def test_gaps(cards, gaps):
+    assert features(cards)["gaps"] == gaps
+
+
+def test_masks():
+    assert features("Ac Ad Ks 2d")["pair_mask"] == 1 << 12
+    assert features("Ac Ad Kc Kd")["pair_mask"] == 1 << 12 | 1 << 11
+    # three of a rank are a pair too, pair_mask doesn't count cards
+    assert features("Ac Ad As 2d")["pair_mask"] == 1 << 12
+    assert features("2c")["card_mask"] == 1
+    assert features("As")["card_mask"] == 1 << 51
+    assert card_features(None) == card_features("Xx Yy") == (None,) * len(FEATURES)
+
+
+def test_unknown_token():
+    with pytest.raises(ValueError):
+        parse_pattern("AAxx double")
+
+
+@pytest.mark.parametrize(
+    "pattern, ids",
+    [
+        ("ds", {1, 9}),
+        ("ss", {2, 8, 10}),
+        ("rainbow", {3, 4, 5, 6, 7, 12}),
+        ("suited", {1, 2, 8, 9, 10, 11}),
+        ("rundown", {5, 6, 11, 12}),
+        ("gap1", {7}),
+        ("gap2", {4}),
+        ("AAxx", {8, 9, 10}),
+        ("AAKK", {9}),
+        ("AAxx ds", {9}),
+        ("pair", {8, 9, 10}),
+        ("unpaired rainbow", {3, 4, 5, 6, 7, 12}),
+        ("AK", {1, 2, 3, 8, 9, 11, 12}),
+        ("AsKs", {1, 2}),
+        ("Ac", {4, 5, 8, 9, 10, 11, 12}),
+        ("KQJT", set()),
+    ],
+)
+def test_conditions_sql_on_sqlite(pattern, ids):
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE hp (hand_id INTEGER, {', '.join(FEATURES)})")
+    conn.executemany(
+        "INSERT INTO hp VALUES (?, ?, ?, ?, ?, ?)",
+        [(id, *card_features(cards)) for id, cards in HANDS.items()],
+    )
+    sql = conditions_sql(parse_pattern(pattern), "hp")
+    found = {row[0] for row in conn.execute(f"SELECT hand_id FROM hp WHERE {sql}")}
+    assert found == ids
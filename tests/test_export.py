@@ -0,0 +1,92 @@
+import gzip
+
+import pytest
+
+from main import read_ids
+from tracker_utils.export import SEPARATOR, open_output, write_hands
+from tracker_utils.tracker import Tracker
+from conftest import PLAYER
+
+HANDS = [(1, "first hand\nline"), (2, "second hand")]
+TEXT = "first hand\nline\n\nsecond hand\n\n"
+
+
+def test_write_hands_plain_and_gzip(tmp_path):
+    plain, packed = str(tmp_path / "hands.txt"), str(tmp_path / "hands.txt.gz")
+    assert write_hands(iter(HANDS), plain) == 2
+    assert write_hands(iter(HANDS), packed) == 2
+    with open(plain, encoding="utf-8") as f:
+        assert f.read() == TEXT
+    with gzip.open(packed, "rt", encoding="utf-8") as f:
+        assert f.read() == TEXT
+    assert write_hands(iter([]), plain) == 0
+    assert (tmp_path / "hands.txt").read_text() == ""
+
+
+@pytest.mark.parametrize(
+    "name, compress, gzipped",
+    [
+        ("out.txt", None, False),
+        ("out.gz", None, True),
+        ("out.txt", True, True),
+        ("out.gz", False, False),
+    ],
+)
+def test_open_output(tmp_path, name, compress, gzipped):
+    path = tmp_path / name
+    with open_output(str(path), compress) as f:
+        f.write(SEPARATOR)
+    assert path.read_bytes().startswith(b"\x1f\x8b") == gzipped
+
+
+def test_export_selected_ids_and_import_them_back(tracker, workdir):
+    tracker.import_hh(str(workdir / "hhs"))
+    texts = dict(tracker.db.iter_hand_texts(PLAYER))
+    selected = list(texts)[:5]
+    (workdir / "ids.txt").write_text("\n".join(map(str, selected)) + "\n\n")
+    ids = read_ids(str(workdir / "ids.txt"))
+    assert ids == selected
+
+    path = str(workdir / "export" / "hands.txt.gz")
+    (workdir / "export").mkdir()
+    assert tracker.export_hh(path, ids=ids) == len(ids)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert f.read() == "".join(texts[id] + SEPARATOR for id in ids)
+
+    plain = workdir / "export" / "hands.txt"
+    assert tracker.export_hh(str(plain), ids=ids, compress=False) == len(ids)
+    assert plain.read_text(encoding="utf-8").startswith(texts[ids[0]])
+    # exported file is imported as client's hand history
+    (workdir / "export" / "hands.txt.gz").unlink()
+    reimported = Tracker(player=PLAYER, clear_tables=True, headless=True)
+    try:
+        reimported.import_hh(str(workdir / "export"))
+        assert dict(reimported.db.iter_hand_texts()) == {id: texts[id] for id in ids}
+    finally:
+        reimported.close()
+
+
+def test_unfinished_export_ends_cursor(tracker, workdir):
+    tracker.import_hh(str(workdir / "hhs"))
+    hands = tracker.db.iter_hand_texts(batch_size=2)
+    next(hands)
+    hands.close()
+    # the same export runs again after generator is closed before the end
+    assert len(list(tracker.db.iter_hand_texts())) > 1
+
+
+def test_unfinished_export_ends_postgresql_transaction(pg_tracker):
+    from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+    pg_tracker.import_hh("hhs")
+    conn = pg_tracker.db.conn
+    hands = pg_tracker.db.iter_hand_texts(batch_size=2)
+    next(hands)
+    hands.close()
+    assert conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+    # named cursor is closed, export with the same cursor name works
+    with pytest.raises(ZeroDivisionError):
+        for _ in pg_tracker.db.iter_hand_texts():
+            1 / 0
+    assert conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+    assert len(list(pg_tracker.db.iter_hand_texts())) > 1
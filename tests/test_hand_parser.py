@@ -0,0 +1,47 @@
+import os
+
+from tracker_utils.hand_parser import parse_hh_file, prefetch_hh_file
+from conftest import TEST_HHS
+
+CHEONAN = os.path.join(TEST_HHS, "3", "5", "Cheonan.txt")
+# block of Cheonan.txt with split pot, collected by two lines
+SPLIT_POT = 60
+
+
+def test_prefetch_reads_requested_part_of_file():
+    size = os.path.getsize(CHEONAN)
+    assert prefetch_hh_file(CHEONAN) == size
+    # blocks smaller than the file, offset and size inside it
+    assert prefetch_hh_file(CHEONAN, 100, size - 50, bytearray(64)) == size - 150
+    # file shorter than requested size, offset past its end
+    assert prefetch_hh_file(CHEONAN, 0, size + 1000, bytearray(4096)) == size
+    assert prefetch_hh_file(CHEONAN, size + 10) == 0
+
+
+def split_pot_cut() -> tuple[list[bytes], bytes]:
+    """
+    Blocks of Cheonan.txt and its hand 60 without the last line: the second pot isn't written yet,
+    but the hand parses, with wrong result of the winner
+    """
+    with open(CHEONAN, "rb") as f:
+        blocks = f.read().split(b"\n\n")
+    return blocks, blocks[SPLIT_POT].rsplit(b"\n", 1)[0]
+
+
+def test_complete_only_leaves_the_last_block(tmp_path):
+    blocks, cut = split_pot_cut()
+    path = tmp_path / "partial.txt"
+    written = b"\n\n".join(blocks[:SPLIT_POT]) + b"\n\n"
+    path.write_bytes(written + cut)
+    all_hands, _ = parse_hh_file(str(path))
+    hands, resume = parse_hh_file(str(path), complete_only=True)
+    # the cut hand parses, but only hands followed by separator are returned
+    assert len(all_hands) == len(hands) + 1
+    assert resume == len(written)
+
+    # resumed parsing of grown file starts from the tail
+    path.write_bytes(written + blocks[SPLIT_POT] + b"\n\n" + blocks[SPLIT_POT + 1])
+    (hand,), _ = parse_hh_file(str(path), offset=resume, complete_only=True)
+    assert hand[0] == all_hands[-1][0]
+    assert hand[8:] != all_hands[-1][8:]
+    assert hand[8:] == parse_hh_file(CHEONAN)[0][SPLIT_POT - 1][8:]
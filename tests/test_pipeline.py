@@ -0,0 +1,62 @@
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from tracker_utils.pipeline import ImportPipeline
+from conftest import TEST_HANDS
+
+
+def count_hands(tracker) -> int:
+    return tracker.db.conn.execute("SELECT COUNT(*) FROM hands").fetchone()[0]
+
+
+def test_import_and_reimport(tracker, workdir):
+    assert tracker.import_hh(str(workdir / "hhs")) == TEST_HANDS
+    assert tracker.import_hh(str(workdir / "hhs")) == 0
+    assert tracker.get_profit()[0] == Decimal("6.62")
+    assert count_hands(tracker) == TEST_HANDS
+
+
+def test_failed_write_is_imported_again(tracker, workdir):
+    path = str(workdir / "hhs")
+    files = tracker._files_to_import(path, {})
+    ids, manifest = tracker.db.get_all_ids(compact=True), {}
+    # another connection holds the write lock, so import fails
+    lock = sqlite3.connect(workdir / "hands.sqlite")
+    lock.execute("BEGIN EXCLUSIVE")
+    tracker.db.conn.execute("PRAGMA busy_timeout=100")
+    with pytest.raises(sqlite3.OperationalError):
+        tracker.import_files(files, ids, manifest=manifest)
+    lock.rollback()
+    lock.close()
+    # nothing is marked as imported, in memory or in database
+    assert len(ids) == 0 and manifest == {}
+    assert tracker.db.get_manifest() == {}
+    assert count_hands(tracker) == 0
+
+    assert tracker.import_files(files, ids, manifest=manifest) == TEST_HANDS
+    assert len(ids) == TEST_HANDS
+    assert manifest == tracker.db.get_manifest()
+    assert tracker._files_to_import(path, manifest) == []
+
+
+def test_only_committed_batches_advance(tracker, workdir, monkeypatch):
+    files = tracker._files_to_import(str(workdir / "hhs"), {})
+    ids, manifest = set(), {}
+    import_hands = tracker.db.import_hands
+    calls = []
+
+    def fail_second_batch(hands, files=None):
+        calls.append(len(hands))
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("disk I/O error")
+        return import_hands(hands, files)
+
+    monkeypatch.setattr(tracker.db, "import_hands", fail_second_batch)
+    pipeline = ImportPipeline(tracker.db, ids, batch_size=1, manifest=manifest)
+    with pytest.raises(sqlite3.OperationalError):
+        pipeline.run(files)
+    assert len(ids) == calls[0] == count_hands(tracker)
+    assert manifest == tracker.db.get_manifest()
+    assert len(manifest) == 1
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import PLAYER
+
+
+PERIODS = pytest.mark.parametrize(
+    "start_date, finish_date",
+    [
+        (None, None),
+        (datetime(2023, 5, 1, tzinfo=timezone.utc), None),
+        (None, datetime(2023, 6, 7, tzinfo=timezone.utc)),
+        (
+            datetime(2023, 3, 1, tzinfo=timezone.utc),
+            datetime(2023, 7, 1, tzinfo=timezone.utc),
+        ),
+    ],
+)
+
+
+@PERIODS
+def test_report_queries_use_indexes(tracker, workdir, start_date, finish_date):
+    tracker.import_hh(str(workdir / "hhs"))
+    tracker.db.conn.execute("ANALYZE")
+    plans = tracker.db.check_query_plans(PLAYER, start_date, finish_date)
+    assert set(plans) == {"rake", "profit", "cards"}
+    # no report query reads a table by sequential scan
+    assert plans == {name: [] for name in plans}
+
+
+@PERIODS
+def test_postgresql_report_queries_use_indexes(pg_tracker, start_date, finish_date):
+    pg_tracker.import_hh("hhs")
+    plans = pg_tracker.db.check_query_plans(PLAYER, start_date, finish_date)
+    assert set(plans) == {"rake", "profit", "summary", "daily_summary", "cards"}
+    # no report query reads a table by sequential scan or full index scan
+    assert plans == {name: [] for name in plans}
@@ -0,0 +1,28 @@
+import random
+
+from tracker_utils.storage import IdArray
+
+
+def test_id_array_merges_added_ids(monkeypatch):
+    monkeypatch.setattr(IdArray, "MERGE_MIN", 10)
+    ids = IdArray(sorted(random.sample(range(10**12), 1000)))
+    expected = set(ids.ids)
+    for _ in range(30):
+        new = random.sample(range(10**12), 7)
+        ids.update(new)
+        expected.update(new)
+        assert len(ids) == len(expected)
+        assert all(id in ids for id in expected)
+        # added set stays below threshold
+        assert len(ids.added) < max(IdArray.MERGE_MIN, len(ids.ids) // 16)
+    ids.merge(force=True)
+    assert not ids.added
+    assert list(ids.ids) == sorted(expected)
+    assert -1 not in ids and 10**12 not in ids
+
+
+def test_id_array_duplicates():
+    ids = IdArray([1, 2, 3])
+    ids.update([3, 4, 4])
+    ids.merge(force=True)
+    assert list(ids.ids) == [1, 2, 3, 4]
@@ -0,0 +1,78 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from tracker_utils.hand_parser import parse_hh_file
+from tracker_utils.sqlite_db import sqlite_db
+from tracker_utils.watcher import Watcher
+from conftest import TEST_HHS
+from test_hand_parser import SPLIT_POT, split_pot_cut
+
+# hands in Cheonan.txt
+CHEONAN_HANDS = 81
+
+
+def test_failed_check_imports_the_same_bytes_again(tracker, workdir):
+    folder = workdir / "watch"
+    folder.mkdir()
+    filepath = str(folder / "Cheonan.txt")
+    shutil.copy(os.path.join(TEST_HHS, "3", "5", "Cheonan.txt"), filepath)
+    watcher = Watcher(tracker, str(folder), settle=0, inotify=False)
+    assert watcher.pending == {filepath}
+
+    lock = sqlite3.connect(workdir / "hands.sqlite")
+    lock.execute("BEGIN EXCLUSIVE")
+    tracker.db.conn.execute("PRAGMA busy_timeout=100")
+    with pytest.raises(sqlite3.OperationalError):
+        watcher.check()
+    lock.rollback()
+    lock.close()
+    # file is still pending and nothing is marked as imported
+    assert watcher.pending == {filepath}
+    assert watcher.manifest == {} and len(watcher.ids) == 0
+
+    # the last hand isn't followed by separator, it waits for the next hand
+    assert watcher.check() == CHEONAN_HANDS - 1
+    assert not watcher.pending
+    assert len(watcher.ids) == CHEONAN_HANDS - 1
+    assert watcher.manifest == tracker.db.get_manifest()
+    # file is saved with parsed size, the last hand is imported by regular import
+    size, _, offset = watcher.manifest[filepath]
+    assert size == offset < os.path.getsize(filepath)
+    assert watcher.check() == 0
+    watcher._scan()
+    assert not watcher.pending
+    assert tracker.import_hh(str(folder)) == 1
+
+
+def test_hand_that_is_written_is_imported_when_complete(tracker, workdir):
+    folder = workdir / "watch"
+    folder.mkdir()
+    blocks, cut = split_pot_cut()
+    filepath = folder / "Cheonan.txt"
+    written = b"\n\n".join(blocks[:SPLIT_POT]) + b"\n\n"
+    # poker client flushed the hand without its last line, it parses with wrong result
+    filepath.write_bytes(written + cut)
+    watcher = Watcher(tracker, str(folder), settle=0, inotify=False)
+    assert watcher.check() == len(watcher.ids) == SPLIT_POT - 1
+    assert watcher.manifest[str(filepath)][2] == len(written)
+
+    # the rest of the hand and the next one are written
+    filepath.write_bytes(written + blocks[SPLIT_POT] + b"\n\n" + blocks[SPLIT_POT + 1])
+    watcher._scan()
+    assert watcher.check() == 1
+    assert tracker.import_hh(str(folder)) == 1
+    tracker.import_hh(os.path.join(TEST_HHS, "3", "5"))
+    # results are the same as of whole file imported at once
+    assert tracker.db.get_summary("Thomthumb23") == expected_summary(workdir)
+
+
+def expected_summary(workdir):
+    db = sqlite_db(path=str(workdir / "expected.sqlite"))
+    hands, _ = parse_hh_file(os.path.join(TEST_HHS, "3", "5", "Cheonan.txt"))
+    db.import_hands(hands)
+    summary = db.get_summary("Thomthumb23")
+    db.close()
+    return summary
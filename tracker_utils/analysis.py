@@ -0,0 +1,162 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from itertools import repeat
+
+from tracker_utils.hand_parser import iter_hands, parse_hand
+from tracker_utils.logger import logger
+
+lg = logger("Analysis")
+
+DEFAULT_CACHE = "./rake_calc_cache.json"
+# cached aggregates of previous version are recalculated
+CACHE_VERSION = 2
+
+
+def analyze_file(filepath: str, hero: str) -> dict[str, list]:
+    """
+    Parses hand history file and sums hero's hands by UTC days.
+    Returns {day 'YYYY-MM-DD': [hands, rake in cents, profit in cents]}, rake is hero's share
+    of hand rake: rake * (hero's bets / total pot), as Decimal like in tracker's reports.
+    Hands rejected by parser (incomplete, negative rake, rake without flop) are skipped.
+    """
+    days = {}
+    for id, hh in iter_hands(filepath):
+        hand = parse_hand(id, hh)
+        if hand is None:
+            continue
+        # players are [name, cards, bets, wins] from 8th item
+        for i in range(8, len(hand), 4):
+            if hand[i] != hero:
+                continue
+            bets, result = hand[i + 2], hand[i + 3]
+            day = datetime.fromisoformat(hand[1]).astimezone(timezone.utc).date()
+            stats = days.setdefault(day.isoformat(), [0, Decimal(0), 0])
+            stats[0] += 1
+            if hand[6]:
+                stats[1] += Decimal(hand[7] * bets) / hand[6]
+            stats[2] += result - bets
+            break
+    return days
+
+
+class RakeCalc:
+    """
+    Calculates hero's rake and profit straight from hand history files, without database.
+    Files are parsed by hand_parser in a pool of processes, daily aggregates of every file
+    are cached by path, size and modification time, so repeated runs parse only new and
+    changed files. Results are the same as tracker's reports: hands are hero's hands
+    that parser accepts, rake is Decimal and profit integer cents.
+    Input:
+        hero: player name
+        workers: number of processes parsing files
+        cache_path: JSON file of cached aggregates, None disables cache
+    Methods:
+        analyze: returns daily aggregates of all files in folders
+        summary: sums daily aggregates for whole period, by ISO weeks and by months
+    """
+
+    def __init__(
+        self, hero: str, workers: int = 1, cache_path: str | None = DEFAULT_CACHE
+    ) -> None:
+        self.hero = hero
+        self.workers = workers
+        self.cache_path = cache_path
+
+    def analyze(self, folders: list[str]) -> dict[str, list]:
+        """Returns {UTC day: [hands, rake in cents, profit in cents]} of all files in folders"""
+        cache = self._load_cache()
+        files = self._files(folders)
+        changed = [
+            (path, size, mtime)
+            for path, size, mtime in files
+            if cache.get(path, {}).get("stat") != [size, mtime]
+        ]
+        lg.info(f"{len(files)} files, {len(changed)} of them are new or changed")
+        paths = [path for path, _, _ in changed]
+        if self.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(analyze_file, paths, repeat(self.hero)))
+        else:
+            results = [analyze_file(path, self.hero) for path in paths]
+        for (path, size, mtime), days in zip(changed, results):
+            # Decimal rake is kept in JSON as string
+            days = {
+                day: [hands, str(rake), profit]
+                for day, (hands, rake, profit) in days.items()
+            }
+            cache[path] = {"stat": [size, mtime], "days": days}
+        if changed:
+            self._save_cache(cache)
+        daily = {}
+        for path, _, _ in files:
+            for day, (hands, rake, profit) in cache[path]["days"].items():
+                stats = daily.setdefault(day, [0, Decimal(0), 0])
+                stats[0] += hands
+                stats[1] += Decimal(rake)
+                stats[2] += profit
+        return dict(sorted(daily.items()))
+
+    @staticmethod
+    def summary(
+        daily: dict[str, list]
+    ) -> tuple[list, dict[str, list], dict[str, list]]:
+        """
+        Sums [hands, rake, profit] of days for whole period, by ISO weeks ('2023-05')
+        and by months ('2023-11')
+        """
+        total, weekly, monthly = [0, Decimal(0), 0], {}, {}
+        for day, stats in daily.items():
+            year, week, _ = datetime.strptime(day, "%Y-%m-%d").isocalendar()
+            for sums in (
+                total,
+                weekly.setdefault(f"{year}-{week:02d}", [0, Decimal(0), 0]),
+                monthly.setdefault(day[:7], [0, Decimal(0), 0]),
+            ):
+                for i, value in enumerate(stats):
+                    sums[i] += value
+        return total, dict(sorted(weekly.items())), dict(sorted(monthly.items()))
+
+    @staticmethod
+    def _files(folders: list[str]) -> list[tuple[str, int, int]]:
+        """(path, size, mtime) of hand history files in folders and their subfolders"""
+        output = []
+        for folder in folders:
+            for subdir, dirs, files in os.walk(folder):
+                for file in files:
+                    if not file.endswith(".txt") or "ID #" in file:
+                        continue
+                    filepath = os.path.abspath(os.path.join(subdir, file))
+                    stat = os.stat(filepath)
+                    output.append((filepath, stat.st_size, stat.st_mtime_ns))
+        return output
+
+    def _load_cache(self) -> dict[str, dict]:
+        """Cached aggregates by file path, empty if cache is for other hero or version"""
+        if self.cache_path is None:
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if data.get("version") != CACHE_VERSION or data.get("hero") != self.hero:
+            return {}
+        return data["files"]
+
+    def _save_cache(self, files: dict[str, dict]) -> None:
+        """Writes cache atomically, files that don't exist anymore are dropped"""
+        if self.cache_path is None:
+            return
+        data = {
+            "version": CACHE_VERSION,
+            "hero": self.hero,
+            "files": {
+                path: entry for path, entry in files.items() if os.path.exists(path)
+            },
+        }
+        with open(self.cache_path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
@@ -1,7 +1,7 @@
 from datetime import datetime, timezone, timedelta
 from typing import Literal
 from decimal import Decimal
-import pytz
+import numpy as np
 
 CUR_WEEK = "cw"
 PREV_WEEK = "pw"
@@ -42,9 +42,64 @@ def period_to_dates(period: PERIODS) -> tuple[datetime, datetime]:
     return start_date, end_date
 
 
+# checks if datetime can be answered with daily stats
+def is_day_start(date: datetime | None) -> bool:
+    """True if date is None or UTC midnight (timezone aware datetime only)"""
+    if date is None:
+        return True
+    if date.tzinfo is None:
+        return False
+    date = date.astimezone(timezone.utc)
+    return date == date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# convert timestamps to epoch seconds
+def to_epoch(value: str | datetime) -> int:
+    """Parsed hand timestamp (or datetime, naive is UTC) to UTC epoch seconds"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+# convert fetched rows to arrays for vectorized calculations
+def to_arrays(
+    data: list[tuple[datetime, Decimal]]
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Converts (datetime, value) rows to UTC datetime64[s] and int64 cents arrays.
+    Returns None if some value is not a whole number of cents and can't be summed exactly as int.
+    """
+    cents = decimals_to_cents([item[1] for item in data])
+    if cents is None:
+        return None
+    dates = np.fromiter((item[0].timestamp() for item in data), np.int64, len(data))
+    return dates.astype("datetime64[s]"), cents
+
+
+def decimals_to_cents(values: list[Decimal]) -> np.ndarray | None:
+    """Converts values to int64 cents array, None if some value has fractions of cent"""
+    cents = [value * 100 for value in values]
+    int_cents = list(map(int, cents))
+    if int_cents != cents:
+        return None
+    return np.array(int_cents, dtype=np.int64)
+
+
+def from_cents(cents: np.ndarray) -> list[Decimal]:
+    """Converts int64 cents array back to Decimal values"""
+    return [Decimal(value).scaleb(-2) for value in cents.tolist()]
+
+
 # calculate cumulative profit
-def cumulate_profit(data: list[Decimal]) -> list[Decimal]:
-    """transform profit to cumulative profit (next=current + sum(previous))"""
+def cumulate_profit(data: list[Decimal] | np.ndarray) -> list[Decimal] | np.ndarray:
+    """
+    transform profit to cumulative profit (next=current + sum(previous))
+    int64 cents array (see to_arrays) is cumulated by numpy and returned as array
+    """
+    if isinstance(data, np.ndarray):
+        return np.cumsum(data)
     cumulative_values = []
     cumulative_sum = 0
     for value in data:
@@ -56,23 +111,93 @@ def cumulate_profit(data: list[Decimal]) -> list[Decimal]:
 # split list of tuples to several list for each week
 def sum_by_weeks(data: list[tuple[datetime, Decimal]]) -> dict[Decimal]:
     """Split and sum data by week. Returns dict where key=#week value=sum(values in this week)"""
-    result = {}
-    for item in data:
-        date = item[0].astimezone(tz=pytz.utc)
-        year, week, _ = date.isocalendar()
-        week = f"0{week}" if week < 10 else str(week)
-        key = f"{year}-{week}"
-        result[key] = result.get(key, 0) + item[1]
-    return dict(sorted(result.items()))
+    arrays = to_arrays(data)
+    if arrays is not None:
+        return sum_cents_by_weeks(*arrays)
+    return _sum_decimals_by_keys(data, week_key)
 
 
 # split list of tuples to several list for each week
 def sum_by_month(data: list[tuple[datetime, Decimal]]) -> dict[Decimal]:
     """Split and sum data by month. Returns dict where key=#month value=sum(values in this month)"""
+    arrays = to_arrays(data)
+    if arrays is not None:
+        return sum_cents_by_month(*arrays)
+    return _sum_decimals_by_keys(data, month_key)
+
+
+def week_key(date: datetime) -> str:
+    """'year-week' of ISO week of UTC date"""
+    year, week, _ = date.astimezone(tz=timezone.utc).isocalendar()
+    return f"{year}-{week:02d}"
+
+
+def month_key(date: datetime) -> str:
+    """'year-month' of UTC date"""
+    date = date.astimezone(tz=timezone.utc)
+    return f"{date.year}-{date.month:02d}"
+
+
+def _sum_decimals_by_keys(data: list[tuple[datetime, Decimal]], key) -> dict[Decimal]:
+    """Sums values of rows by key(date) one by one. Returns dict sorted by key"""
     result = {}
-    for item in data:
-        date = item[0].astimezone(tz=pytz.utc)
-        month = f"0{date.month}" if date.month < 10 else str(date.month)
-        key = f"{date.year}-{month}"
-        result[key] = result.get(key, 0) + item[1]
+    for date, value in data:
+        period = key(date)
+        result[period] = result.get(period, 0) + value
     return dict(sorted(result.items()))
+
+
+def sum_cents_by_weeks(dates: np.ndarray, cents: np.ndarray) -> dict[Decimal]:
+    """The same as sum_by_weeks for datetime64 and int64 cents arrays"""
+    days = dates.astype("datetime64[D]")
+    # ISO week belongs to the year of its Thursday, 1970-01-01 is Thursday
+    thursdays = days - (days.astype(np.int64) + 3) % 7 + 3
+    years = thursdays.astype("datetime64[Y]")
+    weeks = (thursdays - years).astype(np.int64) // 7 + 1
+    return _sum_by_keys((years.astype(np.int64) + 1970) * 100 + weeks, cents)
+
+
+def sum_cents_by_month(dates: np.ndarray, cents: np.ndarray) -> dict[Decimal]:
+    """The same as sum_by_month for datetime64 and int64 cents arrays"""
+    months = dates.astype("datetime64[M]").astype(np.int64)
+    return _sum_by_keys((months // 12 + 1970) * 100 + months % 12 + 1, cents)
+
+
+def _sum_by_keys(keys: np.ndarray, cents: np.ndarray) -> dict[Decimal]:
+    """Sums cents by year*100+period keys. Returns dict where key='year-period' sorted by key"""
+    if len(keys) == 0:
+        return {}
+    order = np.argsort(keys, kind="stable")
+    keys, starts = np.unique(keys[order], return_index=True)
+    sums = np.add.reduceat(cents[order], starts)
+    return dict(
+        zip(
+            (f"{key // 100}-{key % 100:02d}" for key in keys.tolist()),
+            from_cents(sums),
+        )
+    )
+
+
+# reduce number of points of long curves for charts
+def downsample(values: np.ndarray, points: int) -> np.ndarray:
+    """
+    Returns sorted indexes of values to draw instead of all values. Values are split to points/2
+    buckets, and minimum and maximum of every bucket are kept, so peaks and drawdowns stay on chart.
+    """
+    size = len(values)
+    buckets = max(points // 2, 1)
+    if size <= points:
+        return np.arange(size)
+    bucket_size = -(-size // buckets)
+    # last bucket is padded with the last value, its indexes are clipped below
+    padded = np.pad(values, (0, buckets * bucket_size - size), mode="edge")
+    padded = padded.reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    indexes = np.concatenate(
+        (
+            [0, size - 1],
+            padded.argmin(axis=1) + offsets,
+            padded.argmax(axis=1) + offsets,
+        )
+    )
+    return np.unique(np.minimum(indexes, size - 1))
@@ -0,0 +1,126 @@
+import re
+from functools import lru_cache
+
+RANKS = "23456789TJQKA"
+SUITS = "cdhs"
+# columns of hand_players filled from player's cards, see card_features
+FEATURES = ("card_mask", "rank_mask", "pair_mask", "suits", "gaps")
+NO_FEATURES = (None,) * len(FEATURES)
+
+CARDS_RE = re.compile(r"^(?:[2-9TJQKA][cdhs])+$")
+RANKS_RE = re.compile(r"^[2-9TJQKAX]{1,4}$")
+GAP_RE = re.compile(r"^gap([1-9])$")
+
+# suit shapes: counts of cards of every suit, sorted and written as digits
+SUIT_PATTERNS = {
+    "ds": (22,),
+    "double-suited": (22,),
+    "ss": (211,),
+    "single-suited": (211,),
+    "rainbow": (11, 1111),
+    "offsuit": (11,),
+    "suited": (2, 22, 211, 31, 4),
+    "monotone": (4,),
+}
+
+
+@lru_cache(maxsize=65536)
+def card_features(cards: str | None) -> tuple:
+    """
+    Features of player's cards ('Ac 4s 5d 6h') stored with hand_players rows:
+    card_mask: 52-bit mask of cards, bit of card is rank * 4 + suit
+    rank_mask: 13-bit mask of ranks, pair_mask: ranks held two or more times
+    suits: suit shape, counts of suits sorted and written as digits (22 - double suited,
+    211 - single suited, 1111 - rainbow, 2 - suited holdem hand)
+    gaps: missing ranks between the lowest and the highest distinct ranks, ace plays low
+    if it gives less gaps (0 - rundown like 9876 or A234)
+    Returns None for every feature if cards are unknown.
+    """
+    if not cards:
+        return NO_FEATURES
+    card_mask = rank_mask = pair_mask = 0
+    suit_counts = [0, 0, 0, 0]
+    for card in cards.split():
+        if len(card) != 2 or card[0] not in RANKS or card[1] not in SUITS:
+            return NO_FEATURES
+        rank, suit = RANKS.index(card[0]), SUITS.index(card[1])
+        card_mask |= 1 << (rank * 4 + suit)
+        if rank_mask & 1 << rank:
+            pair_mask |= 1 << rank
+        rank_mask |= 1 << rank
+        suit_counts[suit] += 1
+    suits = int(
+        "".join(str(count) for count in sorted(suit_counts, reverse=True) if count)
+    )
+    return card_mask, rank_mask, pair_mask, suits, _gaps(rank_mask)
+
+
+def _gaps(rank_mask: int) -> int:
+    """Gaps between distinct ranks of rank_mask, ace counts as high or low card"""
+    ranks = [rank for rank in range(len(RANKS)) if rank_mask & 1 << rank]
+    gaps = ranks[-1] - ranks[0] + 1 - len(ranks)
+    if ranks[-1] == len(RANKS) - 1 and len(ranks) > 1:
+        # ace below deuce
+        low = [-1] + ranks[:-1]
+        gaps = min(gaps, low[-1] - low[0] + 1 - len(low))
+    return gaps
+
+
+def rank_bits(ranks: str) -> int:
+    return sum(1 << RANKS.index(rank) for rank in set(ranks))
+
+
+def parse_pattern(pattern: str) -> list[tuple[str, str, int | tuple]]:
+    """
+    Translates card pattern to conditions (feature column, operator, value), all of them must match.
+    Pattern is space separated tokens:
+        ds / ss / rainbow / offsuit / suited / monotone - suit shape
+        pair, unpaired - at least one pair, no pairs
+        rundown - unpaired cards without gaps, gap1..gap9 - unpaired cards with that many gaps
+        AAxx, KQJT, AK - ranks the cards include, repeated rank is a pair, x is any rank.
+            pair_mask doesn't count cards, so pair is two or more cards of rank: AAxx matches AAAx too
+        As, AsKs - exact cards
+    Raises ValueError for unknown token.
+    """
+    conditions = []
+    for token in pattern.replace(",", " ").split():
+        keyword = token.lower()
+        if keyword in SUIT_PATTERNS:
+            conditions.append(("suits", "in", SUIT_PATTERNS[keyword]))
+        elif keyword in ("pair", "paired"):
+            conditions.append(("pair_mask", ">", 0))
+        elif keyword == "unpaired":
+            conditions.append(("pair_mask", "=", 0))
+        elif keyword == "rundown" or GAP_RE.match(keyword):
+            gaps = 0 if keyword == "rundown" else int(keyword[3:])
+            conditions.append(("gaps", "=", gaps))
+            conditions.append(("pair_mask", "=", 0))
+        elif CARDS_RE.match(token):
+            cards = " ".join(token[i : i + 2] for i in range(0, len(token), 2))
+            conditions.append(("card_mask", "&", card_features(cards)[0]))
+        elif RANKS_RE.match(token.upper()):
+            ranks = token.upper().replace("X", "")
+            if ranks:
+                conditions.append(("rank_mask", "&", rank_bits(ranks)))
+            paired = [rank for rank in set(ranks) if ranks.count(rank) > 1]
+            if paired:
+                conditions.append(("pair_mask", "&", rank_bits(paired)))
+        else:
+            raise ValueError(f"Unknown card pattern '{token}'")
+    return conditions
+
+
+def conditions_sql(conditions: list[tuple[str, str, int | tuple]], table: str) -> str:
+    """
+    SQL filter of table's feature columns for conditions of parse_pattern, the same for
+    PostgreSQL and SQLite. Values are ints made by parser, so they are written to SQL as they are.
+    """
+    output = f"{table}.card_mask IS NOT NULL"
+    for column, operator, value in conditions:
+        if operator == "&":
+            output += f" AND ({table}.{column} & {value}) = {value}"
+        elif operator == "in":
+            output += f" AND {table}.{column} IN ({', '.join(map(str, value))})"
+        else:
+            output += f" AND {table}.{column} {operator} {value}"
+    return output
@@ -0,0 +1,249 @@
+import os
+import json
+import numpy as np
+from datetime import datetime, timezone
+from decimal import Decimal
+from tracker_utils.calc import (
+    sum_by_weeks,
+    sum_by_month,
+    sum_cents_by_weeks,
+    sum_cents_by_month,
+    to_epoch,
+)
+from tracker_utils.config import read_config
+from tracker_utils.logger import logger
+from tracker_utils.storage import Storage
+
+lg = logger("Cache")
+
+# fixed-width columns, one row for every player with bets in hand, amounts in cents
+COLUMNS = {
+    "hand_id": np.int64,
+    "datetime": np.int64,
+    "game": np.uint8,
+    "blind_level": np.int32,
+    "player": np.int32,
+    "bets": np.int64,
+    "result": np.int64,
+    "rake": np.int64,
+    "total_pot": np.int64,
+}
+# game is stored as index in this tuple, 0 is unknown game
+GAMES = ("", "NLHE", "PLO4")
+META_FILE = "meta.json"
+PLAYERS_FILE = "players.json"
+
+
+class ColumnCache:
+    """
+    On-disk columnar copy of hands data used by reports: every column is a file of fixed-width
+    numbers read with np.memmap, so reports scan it without database and without copies.
+    Rows are appended on import. Number of valid rows is kept in meta file written after columns,
+    so rows of interrupted append are ignored. Cache that missed some hands is marked invalid
+    and has to be rebuilt from database.
+    Input:
+        path: folder of cache files, created if it doesn't exist
+    Methods:
+        is_valid: True if cache contains all hands from database
+        append_hands: adds parsed hands
+        rebuild: fills cache with all hands from database
+        set_valid: marks cache as complete or not
+        invalidate: marks cache as missing some hands
+        clear: deletes all rows
+        get_profit_arrays: returns dates and profit in cents of player's hands
+        get_summary: returns total, weekly and monthly profit and rake, as Storage.get_summary does
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = self._read_json(META_FILE, {"rows": 0, "valid": False})
+        self.players = {
+            name: i for i, name in enumerate(self._read_json(PLAYERS_FILE, []))
+        }
+
+    def is_valid(self) -> bool:
+        return self.meta["valid"]
+
+    def append_hands(self, hands: list) -> None:
+        """Adds rows of players with bets from parsed hands"""
+        self._append_rows(row for hand in hands for row in self._hand_rows(hand))
+
+    @staticmethod
+    def _hand_rows(hand: list) -> list[tuple]:
+        """Rows of parsed hand: players are [name, cards, bets, wins] from 8th item"""
+        epoch = to_epoch(hand[1])
+        return [
+            (hand[0], epoch, hand[3], hand[4], hand[i], hand[i + 2], hand[i + 3])
+            + (hand[7], hand[6])
+            for i in range(8, len(hand), 4)
+            if hand[i + 2] > 0
+        ]
+
+    def rebuild(self, db: Storage) -> None:
+        """Fills cache with all hands from database"""
+        self.clear()
+        for batch in db.iter_hand_players():
+            self._append_rows(batch)
+        self._write_meta(valid=True)
+        lg.info(f"Cache is rebuilt, {self.meta['rows']} rows")
+
+    def set_valid(self, valid: bool) -> None:
+        """Marks cache as complete or not, e.g. while hands are written to database and cache"""
+        if self.meta["valid"] != valid:
+            self._write_meta(valid=valid)
+
+    def invalidate(self) -> None:
+        """Marks cache as missing some hands, reports don't use it until rebuild"""
+        self.set_valid(False)
+        lg.warning(
+            "Cache is out of date and has to be rebuilt: python main.py --rebuild-cache"
+        )
+
+    def clear(self) -> None:
+        """Deletes all rows, empty cache is valid for empty database"""
+        for name in COLUMNS:
+            open(self._column_path(name), "wb").close()
+        self.players = {}
+        self._write_json(PLAYERS_FILE, [])
+        self.meta["rows"] = 0
+        self._write_meta(valid=True)
+
+    def _append_rows(self, rows) -> None:
+        """
+        Appends (hand id, epoch, game, blind level, player name, bets, result, rake, total pot) rows.
+        Rows beyond counted ones (left by interrupted append) are overwritten.
+        """
+        values = [[] for _ in COLUMNS]
+        players_count = len(self.players)
+        for row in rows:
+            row = list(row)
+            row[2] = GAMES.index(row[2]) if row[2] in GAMES else 0
+            row[4] = self.players.setdefault(row[4], len(self.players))
+            for column, value in zip(values, row):
+                column.append(value)
+        if not values[0]:
+            return
+        if len(self.players) > players_count:
+            self._write_json(PLAYERS_FILE, list(self.players))
+        for (name, dtype), column in zip(COLUMNS.items(), values):
+            with open(
+                self._column_path(name), "r+b" if self._exists(name) else "wb"
+            ) as f:
+                f.seek(self.meta["rows"] * np.dtype(dtype).itemsize)
+                f.write(np.array(column, dtype=dtype).tobytes())
+                f.truncate()
+        self.meta["rows"] += len(values[0])
+        self._write_meta(valid=self.meta["valid"])
+
+    def _player_rows(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> np.ndarray:
+        """Returns indexes of rows of player's hands in period"""
+        if player not in self.players or self.meta["rows"] == 0:
+            return np.array([], dtype=np.int64)
+        mask = self._column("player") == self.players[player]
+        dates = self._column("datetime")
+        if start_date:
+            mask &= dates >= to_epoch(start_date)
+        if finish_date:
+            mask &= dates < to_epoch(finish_date)
+        return np.flatnonzero(mask)
+
+    def get_profit_arrays(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns UTC datetime64[s] array of player's hands and int64 array of profit in cents"""
+        return self._profit_arrays(self._player_rows(player, start_date, finish_date))
+
+    def _profit_arrays(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Dates and profit in cents of rows"""
+        dates = self._column("datetime")[rows].astype("datetime64[s]")
+        return dates, self._column("result")[rows] - self._column("bets")[rows]
+
+    def get_summary(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        Return profit and rake for specified player and period: totals, sums by ISO weeks (UTC)
+        and by months (UTC). Profit is summed in cents by numpy, rake shares as Decimals.
+        """
+        rows = self._player_rows(player, start_date, finish_date)
+        dates, cents = self._profit_arrays(rows)
+        if len(dates) == 0:
+            return (0, {}, {}), (0, {}, {})
+        profit = (
+            Decimal(int(cents.sum())).scaleb(-2),
+            sum_cents_by_weeks(dates, cents),
+            sum_cents_by_month(dates, cents),
+        )
+        rows = rows[self._column("rake")[rows] > 0]
+        if len(rows) == 0:
+            return profit, (0, {}, {})
+        raked = [
+            (
+                datetime.fromtimestamp(ts, timezone.utc),
+                Decimal(rake * bets) / total_pot / 100,
+            )
+            for ts, rake, bets, total_pot in zip(
+                *(
+                    self._column(name)[rows].tolist()
+                    for name in ("datetime", "rake", "bets", "total_pot")
+                )
+            )
+        ]
+        rake = (
+            sum(value for _, value in raked),
+            sum_by_weeks(raked),
+            sum_by_month(raked),
+        )
+        return profit, rake
+
+    def _column(self, name: str) -> np.ndarray:
+        """Memory-mapped column, only counted rows"""
+        if self.meta["rows"] == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(
+            self._column_path(name),
+            dtype=COLUMNS[name],
+            mode="r",
+            shape=(self.meta["rows"],),
+        )
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, name + ".bin")
+
+    def _exists(self, name: str) -> bool:
+        return os.path.exists(self._column_path(name))
+
+    def _write_meta(self, valid: bool) -> None:
+        self.meta["valid"] = valid
+        self._write_json(META_FILE, self.meta)
+
+    def _read_json(self, file: str, default):
+        try:
+            with open(os.path.join(self.path, file)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _write_json(self, file: str, data) -> None:
+        """Writes file atomically: to temporary file, which replaces the old one"""
+        path = os.path.join(self.path, file)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+
+def open_cache() -> ColumnCache | None:
+    """Opens column cache if its folder is set by 'path' option of [cache] section in config.ini"""
+    try:
+        config = read_config(section="cache")
+    except Exception:
+        return None
+    if not config.get("path"):
+        return None
+    return ColumnCache(config["path"])
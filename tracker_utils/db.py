@@ -1,32 +1,102 @@
 import psycopg2
+import numpy as np
 from psycopg2.extras import execute_values
-from datetime import datetime
+from datetime import datetime, date
 from decimal import Decimal
+from typing import Iterator
+from tracker_utils.cards import FEATURES, card_features, conditions_sql
 from tracker_utils.config import read_config
+from tracker_utils.hand_parser import compress_hh, decompress_hh
 from tracker_utils.logger import logger
+from tracker_utils.storage import Storage, IdArray
 
 lg = logger("DB")
 
+# escaping of special characters for COPY text format
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+COPY_NULL = "\\N"
+# version of tables layout, saved as comment of hands table after tables are checked
+SCHEMA_VERSION = "py_hh schema 2"
 
-class tracker_db:
+
+class CopyStream:
+    """
+    File-like object for COPY ... FROM STDIN. Formats rows in COPY text format
+    while COPY reads them, so the whole payload is never built in memory.
+    """
+
+    def __init__(self, rows) -> None:
+        self.rows = map(self._format_row, rows)
+        self.buffer = ""
+
+    @staticmethod
+    def _format_row(row: tuple | list) -> str:
+        """Format single row in COPY text format"""
+        values = [
+            COPY_NULL if value is None
+            # bytea in hex format, its backslash is escaped for COPY
+            else "\\\\x" + value.hex()
+            if isinstance(value, bytes)
+            else str(value).translate(COPY_ESCAPES)
+            for value in row
+        ]
+        return "\t".join(values) + "\n"
+
+    def read(self, size: int = -1) -> str:
+        """Return next chunk of COPY data, empty string when all rows are read"""
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += row
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+class tracker_db(Storage):
     """
-    Connects to PostgreSQL Database. It can creates, drop, clear table.
+    PostgreSQL storage backend. It can creates, drop, clear tables.
     Import parsed Hand history. Returns rake and profit data.
+    Hands are stored in normalized layout: hands table, hand_players table with a row
+    for every player in hand, and players table with interned players names.
+    Hand history text is compressed and kept apart in hand_text table, so report queries
+    don't read it. Old wide main table (p1..p10 columns) is migrated to this layout on connect.
     Input:
-        clear_tables: if True delete all data in main table.
+        clear_tables: if True delete all data in tables.
     Methods:
         close: close connection with DB
-        import_hand: imports single parsed hand in DB
         import_hands: imports multiple hands
         get_rake: returns rake for each hand for the indicated period
         get_profit: returns profit/loss for each hand for the indicated period
-        get_all_ids: returns all IDs for hands stored in DB
+        get_profit_arrays: the same as get_profit as numpy arrays of dates and cents
+        get_summary: returns total, weekly and monthly profit and rake for the indicated period
+        get_daily_summary: the same as get_summary, calculated from daily stats for periods aligned to days
+        rebuild_daily_stats: recalculates daily stats for all hands in DB
+        check_query_plans: returns tables that report queries can't read by index
+        get_hand_texts: returns hand history text of hands with given IDs
+        find_hands: returns player's hands with cards matching card pattern conditions
+        iter_hand_texts: yields hand history text of hands matching filters, for export
+        get_all_ids: returns all IDs for hands stored in DB, optionally as compact IdArray
+        get_manifest: returns size, mtime and parsed offset of every imported file
+        update_manifest: saves size, mtime and parsed offset of imported files
     """
 
     def __init__(self, clear_tables=False):
         self.params = read_config(section="postgresql")
         self.conn = self._connect()
+        # old wide table, only migrated to normalized tables
         self.MAIN_TABLE = "main"
+        self.HANDS_TABLE = "hands"
+        self.HAND_TEXT_TABLE = "hand_text"
+        self.PLAYERS_TABLE = "players"
+        self.HAND_PLAYERS_TABLE = "hand_players"
+        self.DAILY_STATS_TABLE = "player_daily_stats"
+        self.MANIFEST_TABLE = "import_manifest"
+        self.STAGING_HANDS_TABLE = "staging_hands"
+        self.STAGING_PLAYERS_TABLE = "staging_players"
+        self.staging_created = False
         self._check_tables(clear_tables)
 
     ### Service methods:
@@ -48,7 +118,73 @@ class tracker_db:
             self.conn.close()
 
     def _check_tables(self, clear_tables=False) -> None:
-        """Checks the existance of main table. If clear_tables=True drops and create main table"""
+        """
+        Checks the existance of tables. Migrates old main table to normalized tables.
+        If clear_tables=True drops and create tables.
+        Full check is skipped if tables are marked with current SCHEMA_VERSION by previous check.
+        """
+        if not clear_tables and self._schema_version() == SCHEMA_VERSION:
+            lg.debug("Tables are up to date")
+            return
+        if not self._table_exists(self.HANDS_TABLE):
+            self._create_tables()
+            res = "Tables are created now"
+        elif clear_tables:
+            self._drop_tables()
+            self._create_tables()
+            res = "Tables are cleared"
+        else:
+            res = "Tables already exist"
+        # hands created by previous versions keep hand history in hh column
+        if not self._table_exists(self.HAND_TEXT_TABLE):
+            self._create_hand_text_table()
+        if self._column_exists(self.HANDS_TABLE, "hh"):
+            self._move_hh_column()
+            res = "Hand history is moved to hand_text table"
+        # old main table is dropped after migration, it exists only if migration is not done
+        if self._table_exists(self.MAIN_TABLE):
+            if clear_tables:
+                self._drop_main_table()
+            else:
+                self._migrate_main_table()
+                self._fill_card_features()
+                self.rebuild_daily_stats()
+                res = "Main table is migrated"
+        # tables created by previous versions don't have daily stats
+        if not self._table_exists(self.DAILY_STATS_TABLE):
+            self._create_daily_stats_table()
+            self.rebuild_daily_stats()
+        # players' rows imported by previous versions don't have card features
+        if not self._column_exists(self.HAND_PLAYERS_TABLE, "card_mask"):
+            self._add_card_columns()
+            self._fill_card_features()
+            res = "Card features are added"
+        self._create_indexes()
+        self._create_manifest_table()
+        if clear_tables:
+            self._clear_manifest()
+        self._set_schema_version()
+        lg.debug(res)
+
+    def _schema_version(self) -> str | None:
+        """Returns schema version saved as comment of hands table, None if there is no table"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT obj_description(to_regclass('{self.HANDS_TABLE}'), 'pg_class')"
+        )
+        version = cur.fetchone()[0]
+        cur.close()
+        return version
+
+    def _set_schema_version(self) -> None:
+        """Marks checked tables with SCHEMA_VERSION"""
+        cur = self.conn.cursor()
+        cur.execute(f"COMMENT ON TABLE {self.HANDS_TABLE} IS '{SCHEMA_VERSION}'")
+        self.conn.commit()
+        cur.close()
+
+    def _table_exists(self, table: str) -> bool:
+        """Checks the existance of table"""
         cur = self.conn.cursor()
         cur.execute(
             f"""
@@ -56,138 +192,436 @@ class tracker_db:
                     SELECT 1 FROM information_schema.tables
                     WHERE table_catalog='{self.params['database']}' AND
                     table_schema='public' AND
-                    table_name='{self.MAIN_TABLE}'
+                    table_name='{table}'
                     )
             """
         )
         table_exists = cur.fetchone()[0]
         cur.close()
-        if not table_exists:
-            self._create_table()
-            res = "Table is created now"
-        elif clear_tables:
-            self._drop_table()
-            self._create_table()
-            res = "Table is cleared"
-        else:
-            res = "Table already exists"
-        lg.debug(res)
+        return table_exists
 
-    def _create_table(self) -> None:
-        """Create the main table"""
+    def _column_exists(self, table: str, column: str) -> bool:
+        """Checks the existance of column in table"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+                SELECT EXISTS(
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_catalog='{self.params['database']}' AND
+                    table_schema='public' AND
+                    table_name='{table}' AND
+                    column_name='{column}'
+                    )
+            """
+        )
+        column_exists = cur.fetchone()[0]
+        cur.close()
+        return column_exists
+
+    def _create_tables(self) -> None:
+        """Create hands, hand_text, players and hand_players tables"""
         command = f"""
-                    CREATE TABLE {self.MAIN_TABLE} 
+                    CREATE TABLE {self.HANDS_TABLE}
                     (
-                        id INTEGER PRIMARY KEY,
+                        id BIGINT PRIMARY KEY,
                         datetime TIMESTAMP WITH TIME ZONE,
-                        hh TEXT,
                         game VARCHAR(4),
                         blind_level INTEGER,
                         players_in_hand INTEGER,
                         total_pot DECIMAL(10, 2),
-                        rake DECIMAL(10, 2),
+                        rake DECIMAL(10, 2)
+                    );
+                    CREATE TABLE {self.PLAYERS_TABLE}
+                    (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(30) UNIQUE NOT NULL
+                    );
+                    CREATE TABLE {self.HAND_PLAYERS_TABLE}
+                    (
+                        hand_id BIGINT REFERENCES {self.HANDS_TABLE} (id) ON DELETE CASCADE,
+                        player_id INTEGER REFERENCES {self.PLAYERS_TABLE} (id),
+                        seat SMALLINT,
+                        cards VARCHAR(17),
+                        bets DECIMAL(10, 2),
+                        result DECIMAL(10, 2),
+                        card_mask BIGINT,
+                        rank_mask SMALLINT,
+                        pair_mask SMALLINT,
+                        suits SMALLINT,
+                        gaps SMALLINT,
+                        PRIMARY KEY (hand_id, seat)
+                    );
                 """
-        command += (
-            ",".join(
-                f"p{x} VARCHAR(30), p{x}_cards VARCHAR(17), p{x}_bets DECIMAL(10, 2), p{x}_result DECIMAL(10, 2)"
-                for x in range(1, 11)
-            )
-            + ")"
-        )
         cur = self.conn.cursor()
         cur.execute(command)
         cur.close()
         self.conn.commit()
+        self._create_hand_text_table()
+        self._create_daily_stats_table()
 
-    def clear_table(self) -> None:
-        """Delete all data in main table"""
+    def _create_hand_text_table(self) -> None:
+        """
+        Create hand_text table: zlib compressed hand history of every hand.
+        Text is already compressed, so postgres stores it without trying to compress it again.
+        """
+        command = f"""
+                    CREATE TABLE {self.HAND_TEXT_TABLE}
+                    (
+                        hand_id BIGINT PRIMARY KEY REFERENCES {self.HANDS_TABLE} (id) ON DELETE CASCADE,
+                        hh BYTEA
+                    );
+                    ALTER TABLE {self.HAND_TEXT_TABLE} ALTER COLUMN hh SET STORAGE EXTERNAL;
+                """
+        cur = self.conn.cursor()
+        cur.execute(command)
+        cur.close()
+        self.conn.commit()
+
+    def _create_daily_stats_table(self) -> None:
+        """
+        Create player_daily_stats table: number of hands, profit and rake for every player
+        summed by UTC days, game and blind level. It is updated on every import.
+        """
+        command = f"""
+                    CREATE TABLE {self.DAILY_STATS_TABLE}
+                    (
+                        player_id INTEGER REFERENCES {self.PLAYERS_TABLE} (id),
+                        day DATE,
+                        game VARCHAR(4),
+                        blind_level INTEGER,
+                        hands INTEGER,
+                        raked_hands INTEGER,
+                        profit NUMERIC,
+                        rake NUMERIC,
+                        PRIMARY KEY (player_id, day, game, blind_level)
+                    )
+                """
+        cur = self.conn.cursor()
+        cur.execute(command)
+        cur.close()
+        self.conn.commit()
+
+    def _create_indexes(self) -> None:
+        """
+        Create indexes used by report queries if they don't exist (tables created by previous versions
+        get them on connect). Player's rows of hand_players are read by index only, hands are
+        joined by primary key or searched by datetime. Daily stats are read by primary key.
+        Card pattern search reads player's rows with known cards by partial index of card features.
+        """
+        command = f"""
+                    DROP INDEX IF EXISTS {self.HAND_PLAYERS_TABLE}_player_id_idx;
+                    CREATE INDEX IF NOT EXISTS {self.HAND_PLAYERS_TABLE}_player_idx
+                    ON {self.HAND_PLAYERS_TABLE} (player_id) INCLUDE (hand_id, bets, result);
+                    CREATE INDEX IF NOT EXISTS {self.HANDS_TABLE}_datetime_idx
+                    ON {self.HANDS_TABLE} (datetime);
+                    CREATE INDEX IF NOT EXISTS {self.HAND_PLAYERS_TABLE}_cards_idx
+                    ON {self.HAND_PLAYERS_TABLE} (player_id, suits, gaps, pair_mask)
+                    INCLUDE (hand_id, card_mask, rank_mask, cards)
+                    WHERE card_mask IS NOT NULL;
+                """
         cur = self.conn.cursor()
-        cur.execute(f"DELETE FROM {self.MAIN_TABLE}")
+        cur.execute(command)
         cur.close()
         self.conn.commit()
 
-    def _drop_table(self) -> None:
-        """Delete the main table"""
+    def _migrate_main_table(self) -> None:
+        """
+        Move hands from old main table (p1..p10 columns) to normalized tables and drop it.
+        Hand history text is compressed on the way to hand_text table.
+        """
+        seats = ",".join(
+            f"({x}, m.p{x}, m.p{x}_cards, m.p{x}_bets, m.p{x}_result)"
+            for x in range(1, 11)
+        )
+        seats = f"CROSS JOIN LATERAL (VALUES {seats}) AS s (seat, name, cards, bets, result)"
+        command = f"""
+                    INSERT INTO {self.HANDS_TABLE}
+                    SELECT id, datetime, game, blind_level, players_in_hand, total_pot, rake
+                    FROM {self.MAIN_TABLE}
+                    ON CONFLICT (id) DO NOTHING;
+                    INSERT INTO {self.PLAYERS_TABLE} (name)
+                    SELECT DISTINCT s.name FROM {self.MAIN_TABLE} m {seats}
+                    WHERE s.name IS NOT NULL
+                    ON CONFLICT (name) DO NOTHING;
+                    INSERT INTO {self.HAND_PLAYERS_TABLE}
+                    SELECT m.id, p.id, s.seat, s.cards, s.bets, s.result
+                    FROM {self.MAIN_TABLE} m {seats}
+                    JOIN {self.PLAYERS_TABLE} p ON p.name = s.name
+                    ON CONFLICT (hand_id, seat) DO NOTHING;
+                """
         cur = self.conn.cursor()
+        cur.execute(command)
+        self._copy_hand_texts(cur, self.MAIN_TABLE)
         cur.execute(f"DROP TABLE {self.MAIN_TABLE}")
         cur.close()
         self.conn.commit()
 
-    ### Data Methods:
-    def hand_exist(self, id: int) -> bool:
-        """Check if hand with ID is already exist"""
+    def _move_hh_column(self) -> None:
+        """Move hand history text of hands table created by previous versions to hand_text table"""
+        cur = self.conn.cursor()
+        self._copy_hand_texts(cur, self.HANDS_TABLE)
+        cur.execute(f"ALTER TABLE {self.HANDS_TABLE} DROP COLUMN hh")
+        cur.close()
+        self.conn.commit()
+
+    def _copy_hand_texts(self, cur, source_table: str, batch_size: int = 10000) -> None:
+        """
+        Compress hh column of source_table to hand_text table in batches, inside the caller's transaction.
+        Texts are read by server side cursor, so the whole column is never held in memory.
+        """
+        reader = self.conn.cursor(name="hand_texts")
+        reader.execute(
+            f"SELECT id, hh FROM {source_table} WHERE hh IS NOT NULL"
+            f" AND id NOT IN (SELECT hand_id FROM {self.HAND_TEXT_TABLE})"
+        )
+        while batch := reader.fetchmany(batch_size):
+            execute_values(
+                cur,
+                f"INSERT INTO {self.HAND_TEXT_TABLE} VALUES %s ON CONFLICT (hand_id) DO NOTHING",
+                [(id, compress_hh(hh)) for id, hh in batch],
+                page_size=1000,
+            )
+        reader.close()
+
+    def _add_card_columns(self) -> None:
+        """Add card features columns to hand_players table created by previous versions"""
         cur = self.conn.cursor()
         cur.execute(
             f"""
-                SELECT EXISTS(
-                    SELECT 1 FROM {self.MAIN_TABLE}
-                    WHERE 
-                    id={id}                    
-                    )
+                ALTER TABLE {self.HAND_PLAYERS_TABLE}
+                ADD COLUMN card_mask BIGINT,
+                ADD COLUMN rank_mask SMALLINT,
+                ADD COLUMN pair_mask SMALLINT,
+                ADD COLUMN suits SMALLINT,
+                ADD COLUMN gaps SMALLINT
             """
         )
-        hand_exists = cur.fetchone()[0]
         cur.close()
-        return hand_exists
+        self.conn.commit()
 
-    def import_hand(self, hand: tuple | list) -> bool:
-        """Import sigle parsed hand to database"""
-        sql = f"INSERT INTO {self.MAIN_TABLE} VALUES %s"
-        # check if hand has already been imported
-        if self.hand_exist(hand[0]):
-            return False
+    def _fill_card_features(self, batch_size: int = 10000) -> None:
+        """
+        Calculate card features of players' rows that have cards but no features.
+        Rows are read by server side cursor and updated in batches.
+        """
         cur = self.conn.cursor()
-        # fill the table
-        command = sql % hand
-        cur.execute(command)
+        reader = self.conn.cursor(name="hand_cards")
+        reader.execute(
+            f"SELECT hand_id, seat, cards FROM {self.HAND_PLAYERS_TABLE}"
+            " WHERE cards IS NOT NULL AND card_mask IS NULL"
+        )
+        columns = ", ".join(FEATURES)
+        while batch := reader.fetchmany(batch_size):
+            rows = [(id, seat, *card_features(cards)) for id, seat, cards in batch]
+            execute_values(
+                cur,
+                f"UPDATE {self.HAND_PLAYERS_TABLE} hp"
+                f" SET ({columns}) = ({', '.join('v.' + x for x in FEATURES)})"
+                f" FROM (VALUES %s) AS v (hand_id, seat, {columns})"
+                " WHERE hp.hand_id = v.hand_id AND hp.seat = v.seat",
+                # unknown cards have no features
+                [row for row in rows if row[2] is not None],
+                page_size=1000,
+            )
+        reader.close()
         cur.close()
         self.conn.commit()
-        return True
 
-    def import_hands(self, hands: tuple | list) -> int:
-        """Import multiple parsed hand to database"""
-        # removing from list hands that already exist in DB
-        hands_to_import = list(filter(lambda x: not self.hand_exist(x[0]), hands))
+    def _create_manifest_table(self) -> None:
+        """Create the table of imported files if it doesn't exist"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+                CREATE TABLE IF NOT EXISTS {self.MANIFEST_TABLE}
+                (
+                    path TEXT PRIMARY KEY,
+                    size BIGINT,
+                    mtime_ns BIGINT,
+                    parsed_offset BIGINT
+                )
+            """
+        )
+        cur.close()
+        self.conn.commit()
+
+    def clear_table(self) -> None:
+        """Delete all data in tables"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"TRUNCATE {self.DAILY_STATS_TABLE}, {self.HAND_PLAYERS_TABLE},"
+            f" {self.HAND_TEXT_TABLE}, {self.HANDS_TABLE}, {self.PLAYERS_TABLE}"
+        )
+        cur.close()
+        self.conn.commit()
+        self._clear_manifest()
+
+    def _clear_manifest(self) -> None:
+        """Forget imported files, so they will be parsed again on next import"""
+        cur = self.conn.cursor()
+        cur.execute(f"DELETE FROM {self.MANIFEST_TABLE}")
+        cur.close()
+        self.conn.commit()
+
+    def _drop_tables(self) -> None:
+        """Delete hands, hand_text, players, hand_players and player_daily_stats tables"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"DROP TABLE IF EXISTS {self.DAILY_STATS_TABLE}, {self.HAND_PLAYERS_TABLE},"
+            f" {self.HAND_TEXT_TABLE}, {self.HANDS_TABLE}, {self.PLAYERS_TABLE}"
+        )
+        cur.close()
+        self.conn.commit()
+
+    def _drop_main_table(self) -> None:
+        """Delete the old main table"""
+        cur = self.conn.cursor()
+        cur.execute(f"DROP TABLE {self.MAIN_TABLE}")
+        cur.close()
+        self.conn.commit()
+
+    ### Data Methods:
+    def import_hands(
+        self, hands: tuple | list, files: list[tuple[str, int, int, int]] = None
+    ) -> int:
+        """
+        Import multiple parsed hand to database. Hands that already exist in DB
+        are skipped by the merge in copy_hands, without a query per hand.
+        files are saved to import manifest in the same transaction as hands.
+        """
         # check if there hands to import
-        if len(hands_to_import) == 0:
+        if len(hands) == 0:
+            self.update_manifest(files)
             return 0
+        return self.copy_hands(hands, files)
 
-        # bringing the all hands to the same size, otherwise psycopg2 won't work
-        hands_to_import.sort(key=len, reverse=True)
-        max_len = len(hands_to_import[0])
-        unified_hands = tuple(
-            map(lambda x: x + (max_len - len(x)) * [None], hands_to_import)
-        )
-        # fill the table
+    def copy_hands(
+        self, hands: tuple | list, files: list[tuple[str, int, int, int]] = None
+    ) -> int:
+        """
+        Bulk import of parsed hands. Hands and their players are streamed with COPY to staging tables
+        and merged to hands, players and hand_players tables, hands that are already in DB are skipped.
+        Daily stats of players are updated in the same transaction.
+        Hand history text goes to hand_text table, compressed unless parser has already done it.
+        Hands can have any number of players. Returns number of imported hands, hands that
+        are already in DB are the only ones skipped: errors roll the transaction back and are raised.
+        Import manifest rows of files are written in the same transaction, so a file is marked
+        as imported only when its hands are committed.
+        """
+        cur = self.conn.cursor()
         try:
-            cur = self.conn.cursor()
-            sql = f"INSERT INTO {self.MAIN_TABLE} VALUES %s"
-            execute_values(cur, sql, unified_hands)
-            cur.close()
+            if not self.staging_created:
+                self._create_staging_tables(cur)
+            cur.copy_expert(
+                f"COPY {self.STAGING_HANDS_TABLE} FROM STDIN",
+                CopyStream(
+                    (
+                        *hand[:2],
+                        *hand[3:8],
+                        hand[2] if isinstance(hand[2], bytes) else compress_hh(hand[2]),
+                    )
+                    for hand in hands
+                ),
+            )
+            cur.copy_expert(
+                f"COPY {self.STAGING_PLAYERS_TABLE} FROM STDIN",
+                CopyStream(
+                    (hand[0], seat, *hand[i : i + 4], *card_features(hand[i + 1]))
+                    for hand in hands
+                    for seat, i in enumerate(range(8, len(hand), 4), 1)
+                ),
+            )
+            # hands that are already in DB are removed from staging
+            cur.execute(
+                f"DELETE FROM {self.STAGING_HANDS_TABLE} s"
+                f" USING {self.HANDS_TABLE} h WHERE s.id = h.id"
+            )
+            cur.execute(
+                f"""
+                    INSERT INTO {self.HANDS_TABLE}
+                    SELECT id, datetime, game, blind_level, players_in_hand,
+                    total_pot / 100.0, rake / 100.0
+                    FROM {self.STAGING_HANDS_TABLE}
+                    ON CONFLICT (id) DO NOTHING
+                """
+            )
+            imported = cur.rowcount
+            cur.execute(
+                f"""
+                    INSERT INTO {self.PLAYERS_TABLE} (name)
+                    SELECT DISTINCT name FROM {self.STAGING_PLAYERS_TABLE}
+                    WHERE hand_id IN (SELECT id FROM {self.STAGING_HANDS_TABLE})
+                    ON CONFLICT (name) DO NOTHING;
+                    INSERT INTO {self.HAND_TEXT_TABLE}
+                    SELECT id, hh FROM {self.STAGING_HANDS_TABLE}
+                    ON CONFLICT (hand_id) DO NOTHING;
+                    INSERT INTO {self.HAND_PLAYERS_TABLE}
+                    SELECT s.hand_id, p.id, s.seat, s.cards, s.bets / 100.0, s.result / 100.0,
+                    s.card_mask, s.rank_mask, s.pair_mask, s.suits, s.gaps
+                    FROM {self.STAGING_PLAYERS_TABLE} s
+                    JOIN {self.PLAYERS_TABLE} p ON p.name = s.name
+                    WHERE s.hand_id IN (SELECT id FROM {self.STAGING_HANDS_TABLE})
+                    ON CONFLICT (hand_id, seat) DO NOTHING;
+                    INSERT INTO {self.DAILY_STATS_TABLE} AS stats
+                    {self._daily_stats_query(f"hp.hand_id IN (SELECT id FROM {self.STAGING_HANDS_TABLE})")}
+                    ON CONFLICT (player_id, day, game, blind_level) DO UPDATE SET
+                    hands = stats.hands + EXCLUDED.hands,
+                    raked_hands = stats.raked_hands + EXCLUDED.raked_hands,
+                    profit = stats.profit + EXCLUDED.profit,
+                    rake = stats.rake + EXCLUDED.rake;
+                """
+            )
+            self._update_manifest(cur, files)
             self.conn.commit()
-            return len(hands_to_import)
-        except Exception as exc:
-            print(exc)
-            return 0
+        except Exception:
+            # nothing of the batch is written, the error goes to the caller, so failed import
+            # doesn't look like hands that are already in DB
+            self.conn.rollback()
+            self.staging_created = False
+            raise
+        finally:
+            cur.close()
+        return imported
+
+    def _create_staging_tables(self, cur) -> None:
+        """
+        Create temporary tables that receive COPY data, they live until connection is closed.
+        Parser amounts are integer cents, they are converted to dollars when staging is merged.
+        Staging hands have compressed hand history as the last column, staging players
+        have card features calculated from their cards.
+        """
+        cur.execute(
+            f"""
+                CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_HANDS_TABLE}
+                (LIKE {self.HANDS_TABLE}, hh BYTEA) ON COMMIT DELETE ROWS;
+                ALTER TABLE {self.STAGING_HANDS_TABLE} ALTER COLUMN total_pot TYPE BIGINT,
+                ALTER COLUMN rake TYPE BIGINT;
+                CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_PLAYERS_TABLE}
+                (
+                    hand_id BIGINT,
+                    seat SMALLINT,
+                    name VARCHAR(30),
+                    cards VARCHAR(17),
+                    bets BIGINT,
+                    result BIGINT,
+                    card_mask BIGINT,
+                    rank_mask SMALLINT,
+                    pair_mask SMALLINT,
+                    suits SMALLINT,
+                    gaps SMALLINT
+                ) ON COMMIT DELETE ROWS;
+            """
+        )
+        self.staging_created = True
 
     def get_rake(
         self, player: str, start_date=None, finish_date=None
     ) -> list[tuple[datetime, Decimal]]:
         """Return rake for each hand for specified player and period"""
-        output = []
-        # creating date filter
-        date_fltr = self._generate_date_filter(start_date, finish_date)
-        # generating query
-        for i in range(1, 11):
-            sql = (
-                f"SELECT datetime, (rake * p{i}_bets / total_pot) FROM {self.MAIN_TABLE}"
-                f" WHERE p{i}='{player}' AND p{i}_bets>0 AND rake>0"
-            )
-            sql = sql + date_fltr
-            cur = self.conn.cursor()
-            cur.execute(sql)
-            output.extend(cur.fetchall())
-            cur.close()
+        sql = self._rake_sql(start_date, finish_date)
+        cur = self.conn.cursor()
+        cur.execute(sql, (player,))
+        output = cur.fetchall()
+        cur.close()
         return output
 
     # returns the list containing profit data for specified player and period
@@ -195,38 +629,399 @@ class tracker_db:
         self, player: str, start_date: datetime = None, finish_date: datetime = None
     ) -> list[tuple[datetime, Decimal]]:
         """Return rake for each hand for specified player and period"""
+        sql = self._profit_sql(start_date, finish_date)
+        cur = self.conn.cursor()
+        cur.execute(sql, (player,))
+        output = cur.fetchall()
+        cur.close()
+        return output
+
+    def get_profit_arrays(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The same as get_profit, but returns UTC datetime64[s] array of hands and int64 array
+        of profit in cents, converted by query so rows are never turned into Python objects
+        """
+        sql = (
+            "SELECT EXTRACT(EPOCH FROM datetime)::BIGINT, (profit * 100)::BIGINT"
+            f" FROM ({self._profit_sql(start_date, finish_date)}) AS p (datetime, profit)"
+        )
+        cur = self.conn.cursor()
+        cur.execute(sql, (player,))
+        output = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 2)
+        cur.close()
+        return output[:, 0].astype("datetime64[s]"), output[:, 1]
+
+    def get_summary(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        Return profit and rake for specified player and period: totals, sums by ISO weeks (UTC)
+        and by months (UTC). Everything is aggregated by a single query in DB.
+        """
+        sql = self._summary_sql(start_date, finish_date)
+        cur = self.conn.cursor()
+        cur.execute(sql, (player,))
+        result = cur.fetchall()
+        cur.close()
+        return self._summary_from_groups(result)
+
+    @staticmethod
+    def _summary_from_groups(
+        result: list[tuple],
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        Transform rows grouped by GROUPING SETS ((week), (month), ()) to profit and rake:
+        (total, {week: sum}, {month: sum})
+        """
+        profit = [0, {}, {}]
+        rake = [0, {}, {}]
+        for grouping, week, month, profit_sum, rake_sum, raked_hands in result:
+            # no hands in period
+            if profit_sum is None:
+                continue
+            # GROUPING bits: 1 - month is aggregated, 2 - week is aggregated
+            if grouping == 3:
+                profit[0] = profit_sum
+                if raked_hands:
+                    rake[0] = rake_sum
+                continue
+            idx, key = (1, week) if grouping == 1 else (2, month)
+            profit[idx][key] = profit_sum
+            if raked_hands:
+                rake[idx][key] = rake_sum
+        for output in (profit, rake):
+            output[1] = dict(sorted(output[1].items()))
+            output[2] = dict(sorted(output[2].items()))
+        return tuple(profit), tuple(rake)
+
+    def get_daily_summary(
+        self, player: str, start_date: date = None, finish_date: date = None
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        The same as get_summary, but calculated from player_daily_stats, so it doesn't depend
+        on number of hands. Period is [start_date, finish_date) in UTC days.
+        """
+        sql = self._daily_summary_sql(start_date, finish_date)
+        cur = self.conn.cursor()
+        cur.execute(sql, (player,))
+        result = cur.fetchall()
+        cur.close()
+        return self._summary_from_groups(result)
+
+    def rebuild_daily_stats(self) -> None:
+        """Recalculate player_daily_stats table from all hands in DB"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+                TRUNCATE {self.DAILY_STATS_TABLE};
+                INSERT INTO {self.DAILY_STATS_TABLE} {self._daily_stats_query()};
+            """
+        )
+        cur.close()
+        self.conn.commit()
+
+    def _daily_stats_query(self, hands_fltr: str = "TRUE") -> str:
+        """Generate query summing players' hands by UTC days, game and blind level"""
+        return (
+            "SELECT hp.player_id, (h.datetime AT TIME ZONE 'UTC')::date, h.game, h.blind_level,"
+            " COUNT(*), COUNT(*) FILTER (WHERE h.rake>0), SUM(hp.result - hp.bets),"
+            " COALESCE(SUM(h.rake * hp.bets / h.total_pot) FILTER (WHERE h.rake>0), 0)"
+            f" FROM {self.HAND_PLAYERS_TABLE} hp JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" WHERE hp.bets>0 AND {hands_fltr} GROUP BY 1, 2, 3, 4"
+        )
+
+    def check_query_plans(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> dict[str, list[str]]:
+        """
+        Runs EXPLAIN for report queries with sequential scans disabled, so planner uses index whenever
+        there is a suitable one (on small tables it would prefer Seq Scan anyway).
+        Returns tables that every query reads without index, empty lists mean all reports use indexes.
+        """
+        queries = {
+            "rake": self._rake_sql(start_date, finish_date),
+            "profit": self._profit_sql(start_date, finish_date),
+            "summary": self._summary_sql(start_date, finish_date),
+            "daily_summary": self._daily_summary_sql(
+                start_date.date() if start_date else None,
+                finish_date.date() if finish_date else None,
+            ),
+            "cards": self._cards_sql([("suits", "in", (22,))], start_date, finish_date),
+        }
+        output = {}
+        cur = self.conn.cursor()
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for name, sql in queries.items():
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, (player,))
+            output[name] = self._unindexed_scans(cur.fetchone()[0][0]["Plan"])
+        cur.close()
+        self.conn.rollback()
+        return output
+
+    def _unindexed_scans(self, plan: dict) -> list[str]:
+        """
+        Return tables read by Seq Scan in EXPLAIN (FORMAT JSON) plan, and player's tables
+        (hand_players, player_daily_stats) read by full index scan, without index condition
+        """
         output = []
-        date_fltr = self._generate_date_filter(start_date, finish_date)
-        # generating query
-        for i in range(1, 11):
-            sql = (
-                f"SELECT datetime, (p{i}_result - p{i}_bets) FROM {self.MAIN_TABLE}"
-                f" WHERE p{i}='{player}' AND p{i}_bets>0"
-            )
-            sql = sql + date_fltr
-            cur = self.conn.cursor()
-            cur.execute(sql)
-            output.extend(cur.fetchall())
+        table = plan.get("Relation Name")
+        if plan["Node Type"] == "Seq Scan":
+            output.append(table)
+        elif (
+            plan["Node Type"] in ("Index Scan", "Index Only Scan")
+            and table in (self.HAND_PLAYERS_TABLE, self.DAILY_STATS_TABLE)
+            and "Index Cond" not in plan
+        ):
+            output.append(table)
+        for subplan in plan.get("Plans", []):
+            output.extend(self._unindexed_scans(subplan))
         return output
 
-    def _generate_date_filter(self, start_date: datetime, finish_date: datetime) -> str:
-        """Generate date filter for SQL query"""
+    def _rake_sql(self, start_date: datetime, finish_date: datetime) -> str:
+        """Generate query for get_rake, player name is its parameter"""
+        date_fltr = self._generate_date_filter(start_date, finish_date)
+        return (
+            f"SELECT h.datetime, (h.rake * hp.bets / h.total_pot) FROM {self.HAND_PLAYERS_TABLE} hp"
+            f" JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" WHERE hp.player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = %s)"
+            f" AND hp.bets>0 AND h.rake>0{date_fltr}"
+        )
+
+    def _profit_sql(self, start_date: datetime, finish_date: datetime) -> str:
+        """Generate query for get_profit, player name is its parameter"""
+        date_fltr = self._generate_date_filter(start_date, finish_date)
+        return (
+            f"SELECT h.datetime, (hp.result - hp.bets) FROM {self.HAND_PLAYERS_TABLE} hp"
+            f" JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" WHERE hp.player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = %s)"
+            f" AND hp.bets>0{date_fltr}"
+        )
+
+    def _summary_sql(self, start_date: datetime, finish_date: datetime) -> str:
+        """Generate query for get_summary, player name is its parameter"""
+        date_fltr = self._generate_date_filter(start_date, finish_date)
+        return (
+            "SELECT GROUPING(week, month), week, month, SUM(profit), SUM(rake), COUNT(rake) FROM ("
+            "SELECT to_char(h.datetime AT TIME ZONE 'UTC', 'IYYY-IW') AS week,"
+            " to_char(h.datetime AT TIME ZONE 'UTC', 'YYYY-MM') AS month,"
+            " (hp.result - hp.bets) AS profit,"
+            " CASE WHEN h.rake>0 THEN (h.rake * hp.bets / h.total_pot) END AS rake"
+            f" FROM {self.HAND_PLAYERS_TABLE} hp"
+            f" JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" WHERE hp.player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = %s)"
+            f" AND hp.bets>0{date_fltr}"
+            ") AS player_hands GROUP BY GROUPING SETS ((week), (month), ())"
+        )
+
+    def _daily_summary_sql(self, start_date: date, finish_date: date) -> str:
+        """Generate query for get_daily_summary, player name is its parameter"""
+        date_fltr = self._generate_date_filter(start_date, finish_date, "day")
+        return (
+            "SELECT GROUPING(week, month), week, month, SUM(profit), SUM(rake), SUM(raked_hands) FROM ("
+            "SELECT to_char(day, 'IYYY-IW') AS week, to_char(day, 'YYYY-MM') AS month,"
+            f" profit, rake, raked_hands FROM {self.DAILY_STATS_TABLE}"
+            f" WHERE player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = %s){date_fltr}"
+            ") AS player_days GROUP BY GROUPING SETS ((week), (month), ())"
+        )
+
+    def _generate_date_filter(
+        self,
+        start_date: datetime | date,
+        finish_date: datetime | date,
+        column: str = "datetime",
+    ) -> str:
+        """Generate date filter for SQL query. Period includes start_date and excludes finish_date"""
         date_fltr = ""
         # creating date filter
-        if start_date and finish_date:
-            date_fltr = f" AND datetime BETWEEN '{start_date}' and '{finish_date}'"
-        elif start_date:
-            date_fltr = f" AND datetime > '{start_date}'"
-        elif finish_date:
-            date_fltr = f" AND datetime < '{finish_date}'"
+        if start_date:
+            date_fltr += f" AND {column} >= '{start_date}'"
+        if finish_date:
+            date_fltr += f" AND {column} < '{finish_date}'"
         return date_fltr
 
-    def get_all_ids(self) -> set[int]:
-        """Return the IDs of all hands in database"""
-        sql = f"SELECT id FROM {self.MAIN_TABLE}"
+    def find_hands(
+        self,
+        player: str,
+        conditions: list[tuple],
+        game: str = None,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+    ) -> list[tuple[int, datetime, str]]:
+        """
+        Return (hand id, datetime, cards) of player's hands with known cards matching conditions
+        of cards.parse_pattern, ordered by datetime
+        """
+        sql = self._cards_sql(conditions, start_date, finish_date, game)
+        cur = self.conn.cursor()
+        cur.execute(sql, (player, game) if game else (player,))
+        output = cur.fetchall()
+        cur.close()
+        return output
+
+    def _cards_sql(
+        self,
+        conditions: list[tuple],
+        start_date: datetime,
+        finish_date: datetime,
+        game: str = None,
+    ) -> str:
+        """Generate query for find_hands, player name and game are its parameters"""
+        date_fltr = self._generate_date_filter(start_date, finish_date)
+        game_fltr = " AND h.game = %s" if game else ""
+        return (
+            f"SELECT h.id, h.datetime, hp.cards FROM {self.HAND_PLAYERS_TABLE} hp"
+            f" JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" WHERE hp.player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = %s)"
+            f" AND {conditions_sql(conditions, 'hp')}{game_fltr}{date_fltr}"
+            " ORDER BY h.datetime"
+        )
+
+    def iter_hand_texts(
+        self,
+        player: str = None,
+        game: str = None,
+        blind_level: int = None,
+        ids: list[int] = None,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+        batch_size: int = 2000,
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Yields (hand id, hand history) of hands matching all filters that are set, ordered by datetime.
+        Rows are read by server-side cursor batch_size at a time and decompressed one by one,
+        so memory doesn't depend on number of exported hands. Export only reads, so its transaction
+        is rolled back when cursor is closed.
+        """
+        fltr, params = "", []
+        if player is not None:
+            fltr += (
+                f" AND h.id IN (SELECT hand_id FROM {self.HAND_PLAYERS_TABLE}"
+                f" WHERE player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = %s))"
+            )
+            params.append(player)
+        if game is not None:
+            fltr += " AND h.game = %s"
+            params.append(game)
+        if blind_level is not None:
+            fltr += " AND h.blind_level = %s"
+            params.append(blind_level)
+        if ids is not None:
+            fltr += " AND h.id = ANY(%s)"
+            params.append(list(ids))
+        fltr += self._generate_date_filter(start_date, finish_date, "h.datetime")
+        cur = self.conn.cursor(name="export_hands")
+        cur.itersize = batch_size
+        cur.execute(
+            f"SELECT h.id, t.hh FROM {self.HANDS_TABLE} h"
+            f" JOIN {self.HAND_TEXT_TABLE} t ON t.hand_id = h.id"
+            f" WHERE TRUE{fltr} ORDER BY h.datetime, h.id",
+            params,
+        )
+        # generator can be closed or fail before the end, cursor and transaction are ended anyway
+        try:
+            for id, hh in cur:
+                yield id, decompress_hh(bytes(hh))
+        finally:
+            cur.close()
+            self.conn.rollback()
+
+    def get_hand_texts(self, ids) -> dict[int, str]:
+        """Returns hand history text of hands with given IDs, hands that are not in DB are missing"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT hand_id, hh FROM {self.HAND_TEXT_TABLE} WHERE hand_id = ANY(%s)",
+            (list(ids),),
+        )
+        texts = {id: decompress_hh(bytes(hh)) for id, hh in cur.fetchall()}
+        cur.close()
+        return texts
+
+    def get_all_ids(self, compact: bool = False) -> set[int] | IdArray:
+        """
+        Return the IDs of all hands in database.
+        compact: if True IDs are returned as IdArray (8 bytes per ID), for huge tables
+        where set of ints doesn't fit in memory.
+        """
+        if compact:
+            sql = f"SELECT id FROM {self.HANDS_TABLE} ORDER BY id"
+            # server-side cursor, IDs are never fetched all at once
+            cur = self.conn.cursor(name="all_ids")
+            cur.itersize = 100000
+            cur.execute(sql)
+            output = IdArray(row[0] for row in cur)
+            cur.close()
+            self.conn.commit()
+            return output
+        sql = f"SELECT id FROM {self.HANDS_TABLE}"
         cur = self.conn.cursor()
         cur.execute(sql)
         result = cur.fetchall()
         output = set(map(lambda x: x[0], result))
         cur.close()
         return output
+
+    def iter_hand_players(self, batch_size: int = 100000) -> Iterator[list[tuple]]:
+        """
+        Yields batches of (hand id, epoch seconds, game, blind level, player name, bets, result,
+        hand rake, total pot) rows for every player with bets in every hand, amounts in cents.
+        Rows are read by server-side cursor.
+        """
+        cur = self.conn.cursor(name="hand_players")
+        cur.itersize = batch_size
+        cur.execute(
+            "SELECT h.id, EXTRACT(EPOCH FROM h.datetime)::BIGINT, h.game, h.blind_level, p.name,"
+            " (hp.bets * 100)::BIGINT, (hp.result * 100)::BIGINT,"
+            " (h.rake * 100)::BIGINT, (h.total_pot * 100)::BIGINT"
+            f" FROM {self.HAND_PLAYERS_TABLE} hp JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" JOIN {self.PLAYERS_TABLE} p ON p.id = hp.player_id"
+            " WHERE hp.bets>0 ORDER BY h.id, hp.seat"
+        )
+        while batch := cur.fetchmany(batch_size):
+            yield batch
+        cur.close()
+        self.conn.commit()
+
+    def get_manifest(self) -> dict[str, tuple[int, int, int]]:
+        """Return size, mtime (ns) and parsed offset for every imported file"""
+        sql = f"SELECT path, size, mtime_ns, parsed_offset FROM {self.MANIFEST_TABLE}"
+        cur = self.conn.cursor()
+        cur.execute(sql)
+        output = {row[0]: row[1:] for row in cur.fetchall()}
+        cur.close()
+        return output
+
+    def update_manifest(self, files: list[tuple[str, int, int, int]]) -> None:
+        """Save (path, size, mtime (ns), parsed offset) of imported files"""
+        if not files:
+            return
+        cur = self.conn.cursor()
+        try:
+            self._update_manifest(cur, files)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def _update_manifest(self, cur, files: list[tuple[str, int, int, int]]) -> None:
+        """Writes manifest rows of files by cursor, transaction is committed by caller"""
+        if not files:
+            return
+        sql = (
+            f"INSERT INTO {self.MANIFEST_TABLE} VALUES %s ON CONFLICT (path) DO UPDATE"
+            " SET size=EXCLUDED.size, mtime_ns=EXCLUDED.mtime_ns,"
+            " parsed_offset=EXCLUDED.parsed_offset"
+        )
+        execute_values(cur, sql, files)
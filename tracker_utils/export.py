@@ -0,0 +1,40 @@
+import gzip
+from typing import Iterator, TextIO
+
+from tracker_utils.logger import logger
+
+lg = logger(__name__)
+
+# size of output buffer, hands are written to file by large blocks
+BUFFER_SIZE = 1 << 20
+# the same empty line poker client separates hands with, so exported files can be imported
+SEPARATOR = "\n\n"
+
+
+def open_output(path: str, compress: bool = None) -> TextIO:
+    """
+    Opens export file for writing: gzip-compressed if compress is True
+    (or if it is None and path ends with .gz), otherwise plain text with a large buffer
+    """
+    if compress is None:
+        compress = path.endswith(".gz")
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    return open(path, "w", encoding="utf-8", buffering=BUFFER_SIZE)
+
+
+def write_hands(
+    hands: Iterator[tuple[int, str]], path: str, compress: bool = None
+) -> int:
+    """
+    Writes (hand id, hand history) of hands iterator to file one hand at a time, so memory
+    doesn't depend on number of hands. Returns number of written hands.
+    """
+    count = 0
+    with open_output(path, compress) as f:
+        for _, hh in hands:
+            f.write(hh)
+            f.write(SEPARATOR)
+            count += 1
+    lg.debug(f"{count} hands are exported to {path}")
+    return count
@@ -1,24 +1,129 @@
 from datetime import datetime
+import os
 import re
-import pytz
-from decimal import Decimal
+import mmap
+import zlib
+import locale
+from collections import Counter
+from functools import cache
+from time import perf_counter
+from typing import Iterator
 
-from tracker_utils.logger import logger
+from tracker_utils.logger import logger, SkipCounter
+from tracker_utils.profiler import (
+    ParseStats,
+    SPLIT,
+    ID_DEDUPE,
+    PARSE_HAND,
+    COMPRESS,
+    TOURNAMENT as TOURNAMENT_SKIP,
+    ALREADY_IMPORTED,
+)
 
 lg = logger(__name__)
+# hands skipped by parser, counted by reason
+skipped = SkipCounter(lg)
 
+# IDs already stored in database, set once in every worker of import process pool
+_pool_ids_in_db = None
+# True if pool workers measure parsing stages for import profile
+_pool_profile = False
+# True if pool workers parse only hands followed by separator, see parse_hh_file
+_pool_complete_only = False
 
-def find_digits(num: str) -> Decimal:
+# Hand history markers
+BLINDS = " posts "
+ANTE = "posts dead blind"
+BET = " bets "
+CALL = " calls "
+RAISE = " raises "
+COLLECT = " collected "
+SEAT = "Seat "
+DEALT_TO = "Dealt to "
+SHOWN = " shows [ "
+FLOP = "** Dealing flop **"
+PLO4 = "Pot Limit Omaha"
+NLHE = "No Limit Holdem"
+LOCAL_TZ = "Asia/Tbilisi"
+TOURNAMENT = b"Tournament #"
+# the same encoding open() uses by default, so decoded hands match text-mode reads
+ENCODING = locale.getpreferredencoding(False)
+# block read by prefetch_hh_file
+PREFETCH_BLOCK = 1 << 20
+
+# Precompiled patterns
+NAMES_RE = re.compile(r"Seat \d{1,2}: (\S+) ")
+DEALT_RE = re.compile(r"Dealt to (\S+) \[ (.+?) ]")
+SHOWS_RE = re.compile(r"(\S+) shows \[ (.+?) ]")
+DT_RE = re.compile(r"\d\d \d\d \d{4} \d\d:\d\d:\d\d")
+LIMITS_RE = re.compile(r"\$\d{1,3}\.*\d{0,2}/\$(\d{1,3}\.*\d{0,2})")
+DECIMAL_RE = re.compile(r"\d+\.\d+")
+INTEGER_RE = re.compile(r"\d+")
+HAND_ID_RE = re.compile(rb"888poker Hand History for Game (\d{7,12})")
+
+# Preset dictionary for hand history compression: phrases every 888poker hand repeats,
+# the most frequent ones at the end. Stored hands can't be decompressed without
+# the same dictionary, so it must never be changed.
+HH_ZDICT = (
+    b" did not show his hand\n"
+    b" is the button\nTotal number of players : "
+    b"Tournament #"
+    b"Pot Limit Omaha - *** "
+    b" Blinds No Limit Holdem - *** "
+    b"Table  9 Max (Real Money)\n 6 Max (Real Money)\n"
+    b"***** 888poker Hand History for Game "
+    b"** Dealing turn ** [ \n** Dealing river ** [ \n"
+    b"** Dealing flop ** [ "
+    b" posts dead blind [$ posts small blind [$ posts big blind [$"
+    b" checks\n bets [$ calls [$ raises [$"
+    b"** Summary **\n"
+    b" shows [ collected [ $"
+    b"\n** Dealing down cards **\nDealt to "
+    b" folds\nSeat 1: Seat 2: Seat 3: Seat 4: Seat 5: Seat 6: Seat 7: Seat 8: Seat 9: Seat 10: "
+)
+
+
+def to_cents(amount: str) -> int:
+    """Converts dollar amount with up to 2 decimal places to integer cents"""
+    whole, _, fraction = amount.partition(".")
+    return int(whole or 0) * 100 + int(fraction.ljust(2, "0"))
+
+
+def find_digits(num: str) -> int:
     """
-    It looks for digits in sting, and returns it as a Decimal
+    It looks for digits in sting, and returns it as integer cents
     """
-    res = re.findall("\d+\.\d+", num)
+    res = DECIMAL_RE.findall(num)
     if len(res) == 0:
-        res = re.findall("\d+", num)
+        res = INTEGER_RE.findall(num)
         if len(res) == 0:
-            lg.warning(f"Error: Diffrent format of hand")
+            skipped.skip("different format of amount", "Error: Diffrent format of hand")
             return None
-    return Decimal(res[-1])
+    # amounts are in cents, more decimal places can't be stored exactly
+    if len(res[-1].partition(".")[2]) > 2:
+        skipped.skip("different format of amount", "Error: Diffrent format of hand")
+        return None
+    return to_cents(res[-1])
+
+
+@cache
+def local_tz():
+    """Time zone of hand histories, pytz is imported only when hands are parsed"""
+    import pytz
+
+    return pytz.timezone(LOCAL_TZ)
+
+
+def compress_hh(hh: str) -> bytes:
+    """Compress hand history text for storage with zlib and preset dictionary"""
+    compressor = zlib.compressobj(zlib.Z_BEST_COMPRESSION, zdict=HH_ZDICT)
+    return compressor.compress(hh.encode("utf-8")) + compressor.flush()
+
+
+def decompress_hh(data: bytes) -> str:
+    """Decompress hand history text compressed by compress_hh"""
+    decompressor = zlib.decompressobj(zdict=HH_ZDICT)
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
 
 
 def parse_hand(hand_id: int, hh: str) -> list:
@@ -26,28 +131,12 @@ def parse_hand(hand_id: int, hh: str) -> list:
     Parse single hand history for date, players names, their bets, dealt cards and result of the hand.
     Returns list containing [hand id, timestamp, hand history, game_type, game_limit, number of players, pot, rake,
     and for every player in hand: name, player cards, players bets incl. ante, wins
+    All amounts are integer cents, game_limit is big blind in cents.
+    The hand text is scanned once, line by line: header, seats, dealt/shown cards, actions, collects and
+    flop marker are all picked up in the same pass.
     """
-    # Constants
-    NAMES = "Seat \d{1,2}: (\S+) "
-    BLINDS = " posts "
-    ANTE = "posts dead blind"
-    BET = " bets "
-    CALL = " calls "
-    RAISE = " raises "
-    COLLECT = " collected "
-    FLOP = "** Dealing flop **"
-    DT = "\d\d \d\d \d{4} \d\d:\d\d:\d\d"
-    DEALT = "Dealt to (\S+) \[ (.+?) ]"
-    SHOWS = "(\S+) shows \[ (.+?) ]"
-    LIMITS = "\$\d{1,3}\.*\d{0,2}/\$(\d{1,3}\.*\d{0,2})"
-    PLO4 = "Pot Limit Omaha"
-    NLHE = "No Limit Holdem"
-    LOCAL_TZ = "Asia/Tbilisi"
-    DT_FORMAT = "%d %m %Y %H:%M:%S"
-
-    no_names = " posts"
-
     # vars
+    players = []
     players_bets = {}
     players_cards = {}
     wins = {}
@@ -55,49 +144,9 @@ def parse_hand(hand_id: int, hh: str) -> list:
     timestamp = None
     game_limit = 0
     game_type = ""
+    flop_dealt = False
 
-    # Detecting game type
-    if PLO4 in hh:
-        game_type = "PLO4"
-    elif NLHE in hh:
-        game_type = "NLHE"
-    else:
-        lg.warning(f"Error: Unsopported game type. Skipping hand# {hand_id}")
-        return None
-    # Detect blinds level
-    srch = re.findall(LIMITS, hh)
-    if srch and len(srch) == 1:
-        game_limit = 100 * Decimal(srch[0])
-
-    # collect all players' names
-    players = re.findall(NAMES, hh)
-
-    for player in players:
-        # check player name is not empty
-        if player == " ":
-            lg.warning(f"Hand doesn't contain Names. Skipping hand# {hand_id} ...")
-            return None
-        players_bets[player] = 0
-    # collect dealt cards
-    srch = re.findall(DEALT, hh)
-    for res in srch:
-        players_cards[res[0]] = " ".join(res[1].split(", "))
-    # collect shown cards
-    srch = re.findall(SHOWS, hh)
-    for res in srch:
-        players_cards[res[0]] = " ".join(res[1].split(", "))
-    # find the datetime
-    srch = re.findall(DT, hh)
-    if srch:
-        dt = datetime.strptime(srch[0], DT_FORMAT)
-        timestamp = str(pytz.timezone(LOCAL_TZ).localize(dt))
-    else:
-        lg.warning(f"Hand doesn't contain datetime. Skipping hand# {hand_id} ...")
-        return None
-
-    # Extracting actions
-    lines = re.split("\n", hh)
-    for line in lines:
+    for line in hh.split("\n"):
         # search and extract bets for players in pot
         if BLINDS in line or CALL in line or BET in line or RAISE in line:
             words = line.split()
@@ -110,7 +159,7 @@ def parse_hand(hand_id: int, hh: str) -> list:
                 dead = find_digits(words[-3])
                 if dead is None:
                     return None
-                ante.update({player: find_digits(words[-3])})
+                ante[player] = dead
         # search and extract hand result
         elif COLLECT in line:
             words = line.split()
@@ -118,13 +167,73 @@ def parse_hand(hand_id: int, hh: str) -> list:
             sidepot = find_digits(words[-2])
             if sidepot is None:
                 return None
-            won = sidepot + wins.get(player, 0)
-            wins.update({player: won})
+            wins[player] = sidepot + wins.get(player, 0)
+        # collect players' names
+        elif line.startswith(SEAT):
+            for player in NAMES_RE.findall(line):
+                # check player name is not empty
+                if player == " ":
+                    skipped.skip(
+                        "no player names",
+                        "Hand doesn't contain Names. Skipping hand# %s ...",
+                        hand_id,
+                    )
+                    return None
+                players.append(player)
+                players_bets[player] = 0
+        # collect dealt cards
+        elif line.startswith(DEALT_TO):
+            for res in DEALT_RE.findall(line):
+                players_cards[res[0]] = " ".join(res[1].split(", "))
+        # collect shown cards
+        elif SHOWN in line:
+            for res in SHOWS_RE.findall(line):
+                players_cards[res[0]] = " ".join(res[1].split(", "))
+        elif line.startswith(FLOP):
+            flop_dealt = True
+        # header: game type, blinds level and datetime
+        elif timestamp is None:
+            srch = DT_RE.search(line)
+            if not srch:
+                continue
+            if PLO4 in line:
+                game_type = "PLO4"
+            elif NLHE in line:
+                game_type = "NLHE"
+            else:
+                skipped.skip(
+                    "unsupported game",
+                    "Error: Unsopported game type. Skipping hand# %s",
+                    hand_id,
+                )
+                return None
+            limits = LIMITS_RE.findall(line)
+            if len(limits) == 1:
+                game_limit = to_cents(limits[0])
+            dt = srch.group()
+            # fixed "%d %m %Y %H:%M:%S" layout, sliced instead of strptime
+            dt = datetime(
+                int(dt[6:10]),
+                int(dt[3:5]),
+                int(dt[0:2]),
+                int(dt[11:13]),
+                int(dt[14:16]),
+                int(dt[17:19]),
+            )
+            timestamp = str(local_tz().localize(dt))
+
+    if timestamp is None:
+        skipped.skip(
+            "no datetime",
+            "Hand doesn't contain datetime. Skipping hand# %s ...",
+            hand_id,
+        )
+        return None
 
     # Calculating rake paid
     won = sum(wins.values())
     if won == 0:
-        lg.warning(f"Hand #{hand_id} probably incomlete")
+        skipped.skip("incomplete hand", "Hand #%s probably incomlete", hand_id)
         return None
     all_bets = sorted(players_bets.values())
     # detecting uncalled bets and fixing dict
@@ -139,15 +248,29 @@ def parse_hand(hand_id: int, hh: str) -> list:
 
     # Cheking rake rules
     if rake < 0:
-        lg.warning(f" ERROR: Negative Rake @ hand {hand_id}")
+        skipped.skip("negative rake", " ERROR: Negative Rake @ hand %s", hand_id)
         lg.debug(
-            f"ERROR: Negative Rake @ hand#{hand_id}\nRake={rake}\nPot={pot}\nWon={won}\nbets{players_bets}\nWins={wins}\nAnte={ante}"
+            "ERROR: Negative Rake @ hand#%s\nRake=%s\nPot=%s\nWon=%s\nbets%s\nWins=%s\nAnte=%s",
+            hand_id,
+            rake,
+            pot,
+            won,
+            players_bets,
+            wins,
+            ante,
         )
         return None
-    if rake > 0 and not (FLOP in hh):
-        lg.warning(f" ERROR Rake at No flop @ hand #{hand_id}")
+    if rake > 0 and not flop_dealt:
+        skipped.skip("rake without flop", " ERROR Rake at No flop @ hand #%s", hand_id)
         lg.debug(
-            f"ERROR: Rake at No flop @ hand {hand_id}\nRake={rake}\nPot={pot}\nWon={won}\nbets{players_bets}\nWins={wins}\nAnte={ante}"
+            "ERROR: Rake at No flop @ hand %s\nRake=%s\nPot=%s\nWon=%s\nbets%s\nWins=%s\nAnte=%s",
+            hand_id,
+            rake,
+            pot,
+            won,
+            players_bets,
+            wins,
+            ante,
         )
         return None
 
@@ -175,53 +298,217 @@ def parse_hand(hand_id: int, hh: str) -> list:
     return output
 
 
-# parse HH file. IDs can be designated to faster import
-def parse_file(file: str, ids_in_db: set = None) -> list:
+def iter_hands(
+    filepath: str, ids_in_db: set = None, offset: int = 0, size: int = None
+) -> Iterator[tuple[int, str]]:
     """
-    Parses hand history file. Collects their IDs. Checks if they are alredy imporded to database, and if not
-    takes history of each hand and sends it to parse_hand func.
-    Returns quantity of succesfully parsed hands.
+    Walks memory-mapped hand history file and yields (hand id, hand history) one hand at a time.
+    Hand IDs are checked against ids_in_db before hand text is decoded, so known hands cost no copies.
+    offset, size: only bytes between them are read (used to resume parsing of grown files).
     """
-    NEW_HAND_TEXT = "888poker Hand History for Game (\d{7,12})"
-    TOURNAMENT = "Tournament #"
+    with open(filepath, "rb") as f:
+        size = _mapped_size(f, size)
+        if size <= offset:
+            return
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            yield from iter_hands_in_buffer(mm, ids_in_db, offset, size)
 
-    output = []
-    hands_to_import = 0
 
+def iter_hands_in_buffer(
+    buffer: bytes | mmap.mmap,
+    ids_in_db: set = None,
+    offset: int = 0,
+    size: int = None,
+    stats: ParseStats = None,
+) -> Iterator[tuple[int, str]]:
+    """
+    The same as iter_hands for hand history in memory-mapped file (or bytes).
+    stats: if set, time of splitting and ID dedupe, and skipped hands are added to it.
+    """
+    size = len(buffer) if size is None else size
     # Skipping Tournaments
-    if TOURNAMENT in file:
-        return output
-
-    ids = re.findall(NEW_HAND_TEXT, file)
-    ids_in_file = set(map(lambda x: int(x), ids))
-    ids_in_file.difference_update(ids_in_db)
-    if not ids_in_file:
-        return output
-
-    hands = file.split("\n\n")
-    for hand in hands:
-        if len(hand) < 20:
+    if buffer.find(TOURNAMENT, offset, size) != -1:
+        if stats is not None:
+            stats.skipped[TOURNAMENT_SKIP] += len(
+                HAND_ID_RE.findall(buffer, offset, size)
+            )
+        return
+    separator = _hands_separator(buffer)
+    crlf = len(separator) == 4
+    start = offset
+    while start < size:
+        if stats is not None:
+            split_start = perf_counter()
+        end = buffer.find(separator, start, size)
+        if end == -1:
+            end = size
+        hand_start, start = start, end + len(separator)
+        if end - hand_start < 20:
             continue
-        # looking fo ids in file
-        id = re.findall(NEW_HAND_TEXT, hand)
+        # looking fo ids in hand
+        id = HAND_ID_RE.findall(buffer, hand_start, end)
         # skipping text w\o id
         if not id:
-            lg.warning(f"Strange piece of text:\n{hand}")
-            lg.debug(f"Strange piece of text:\n{hand}")
+            skipped.skip(
+                "text without hand ID",
+                "Strange piece of text:\n%s",
+                buffer[hand_start:end].decode(ENCODING),
+            )
             continue
         # check if more than one hand in text
         if len(id) != 1:
-            lg.warning(f"More than one hand in text: ID: {id}")
-            lg.debug(f"More than one hand in text: ID: {id}\nHH:\n{hand}")
+            skipped.skip(
+                "several hands in text", "More than one hand in text: ID: %s", id
+            )
             continue
         id = int(id[0])
+        if stats is not None:
+            dedupe_start = perf_counter()
         # skipping hands that already exist in DB
-        if id in ids_in_db:
+        known = ids_in_db and id in ids_in_db
+        if stats is not None:
+            dedupe_end = perf_counter()
+            stats.add(ID_DEDUPE, dedupe_end - dedupe_start)
+            split_time = dedupe_start - split_start
+        if known:
+            if stats is not None:
+                stats.add(SPLIT, split_time)
+                stats.skipped[ALREADY_IMPORTED] += 1
             continue
+        hand = buffer[hand_start:end].decode(ENCODING)
+        if crlf:
+            hand = hand.replace("\r\n", "\n")
+        if stats is not None:
+            stats.add(SPLIT, split_time + perf_counter() - dedupe_end)
+        yield id, hand
+
+
+def resume_offset_in_buffer(
+    buffer: bytes | mmap.mmap, offset: int = 0, size: int = None
+) -> int:
+    """
+    Returns offset of the last hand in the part of buffer (bytes or mmap) between offset and size.
+    The last hand can still be written by poker client, so parsing of grown file is resumed from it.
+    """
+    size = len(buffer) if size is None else size
+    if size <= offset:
+        return offset
+    separator = _hands_separator(buffer)
+    last = buffer.rfind(separator, offset, size)
+    return offset if last == -1 else last + len(separator)
+
+
+def _mapped_size(f, size: int = None) -> int:
+    """Returns size of file part to map, file can be shorter than size requested"""
+    file_size = os.fstat(f.fileno()).st_size
+    return file_size if size is None else min(size, file_size)
+
+
+def _hands_separator(buffer: bytes | mmap.mmap) -> bytes:
+    """Hands are separated by empty line, files saved on Windows use CRLF"""
+    return b"\r\n\r\n" if buffer.find(b"\r\n", 0, 1024) != -1 else b"\n\n"
+
+
+def prefetch_hh_file(
+    filepath: str, offset: int = 0, size: int = None, buffer: bytearray = None
+) -> int:
+    """
+    Reads part of file between offset and size by blocks of buffer and drops the data, so pages
+    of the file are in page cache when parse_hh_file maps it. Used by import reader stage
+    to overlap disk (or network share) reads with parsing, memory doesn't depend on file size.
+    Returns number of bytes read.
+    """
+    buffer = bytearray(PREFETCH_BLOCK) if buffer is None else buffer
+    view = memoryview(buffer)
+    read = 0
+    with open(filepath, "rb", buffering=0) as f:
+        size = _mapped_size(f, size)
+        f.seek(offset)
+        while offset + read < size:
+            count = f.readinto(view[: min(len(view), size - offset - read)])
+            if not count:
+                break
+            read += count
+    return read
+
+
+def parse_hh_file(
+    filepath: str,
+    ids_in_db: set = None,
+    offset: int = 0,
+    size: int = None,
+    stats: ParseStats = None,
+    complete_only: bool = False,
+) -> tuple[list, int]:
+    """
+    Streams memory-mapped hand history file and parses hands that are not imported to database yet.
+    Returns list of parsed hands and offset in file to resume parsing from. Hand history text
+    is compressed by compress_hh so parsed hands waiting for import stay small.
+    offset, size: only bytes between them are parsed (used to resume parsing of grown files).
+    stats: if set, time of parsing stages and skipped hands are added to it.
+    complete_only: if True, text after the last separator isn't parsed, it can be a hand that
+    poker client is still writing (used by watch mode), it is parsed from resume offset next time.
+    """
+    with open(filepath, "rb") as f:
+        size = _mapped_size(f, size)
+        if size <= offset:
+            return [], offset
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            resume = resume_offset_in_buffer(mm, offset, size)
+            if complete_only:
+                size = resume
+            hands = _parse_hands(
+                iter_hands_in_buffer(mm, ids_in_db, offset, size, stats), stats
+            )
+            return hands, resume
+
+
+def _parse_hands(hands: Iterator[tuple[int, str]], stats: ParseStats = None) -> list:
+    """Parses (hand id, hand history) pairs, hands that can't be parsed are skipped"""
+    output = []
+    for id, hand in hands:
+        if stats is not None:
+            parse_start = perf_counter()
         parsed_hand = parse_hand(id, hand)
+        if stats is not None:
+            compress_start = perf_counter()
+            stats.add(PARSE_HAND, compress_start - parse_start)
         if parsed_hand is None:
-            lg.debug(f"Empty hand returned: ID: {id}\nHH:\n{hand}")
+            lg.debug("Empty hand returned: ID: %s\nHH:\n%s", id, hand)
             continue
+        parsed_hand[2] = compress_hh(hand)
+        if stats is not None:
+            stats.add(COMPRESS, perf_counter() - compress_start)
         output.append(parsed_hand)
-        hands_to_import += 1
     return output
+
+
+def init_pool_worker(
+    ids_in_db: set, profile: bool = False, complete_only: bool = False
+) -> None:
+    """
+    Initializer for import process pool. Shares IDs stored in database with the worker.
+    profile: if True workers measure parsing stages
+    complete_only: if True workers don't parse text after the last separator, see parse_hh_file
+    """
+    global _pool_ids_in_db, _pool_profile, _pool_complete_only
+    _pool_ids_in_db = ids_in_db
+    _pool_profile = profile
+    _pool_complete_only = complete_only
+
+
+def parse_hh_file_in_pool(
+    file: tuple[str, int, int],
+) -> tuple[list, int, Counter, ParseStats | None]:
+    """
+    Parses (filepath, offset, size) part of file for import process pool workers, only the path
+    is sent to worker and the file is mapped there. Uses IDs set by init_pool_worker.
+    Returns parsed hands, offset to resume parsing from, numbers of skipped hands by reason
+    and stats of parsing stages if profile is enabled, the main process reports them.
+    """
+    filepath, offset, size = file
+    stats = ParseStats() if _pool_profile else None
+    hands, resume = parse_hh_file(
+        filepath, _pool_ids_in_db, offset, size, stats, _pool_complete_only
+    )
+    return hands, resume, skipped.pop(), stats
@@ -1,4 +1,5 @@
 import argparse
+from decimal import Decimal
 
 
 def parser():
@@ -11,6 +12,60 @@ def parser():
         nargs="?",
         help="Import hand history from the specified folder",
     )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of processes parsing files during import",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep importing new hands from the import folder until Ctrl+C",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        dest="watch_interval",
+        type=float,
+        default=1.0,
+        help="Seconds between checks of the import folder in watch mode",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Measure time and throughput of import stages and print summary",
+    )
+    parser.add_argument(
+        "--profile-json",
+        dest="profile_json",
+        help="Save import profile to the specified JSON file",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        dest="profile_cprofile",
+        help="Save cProfile stats of import threads to the specified file",
+    )
+    parser.add_argument(
+        "--rebuild-stats",
+        dest="rebuild_stats",
+        action="store_true",
+        help="Recalculate players' daily stats from all hands in database",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        dest="rebuild_cache",
+        action="store_true",
+        help="Fill column cache with all hands from database",
+    )
+    parser.add_argument(
+        "--check-plans",
+        dest="check_plans",
+        action="store_true",
+        help="Check that report queries use indexes",
+    )
     parser.add_argument(
         "--results",
         dest="results",
@@ -19,6 +74,52 @@ def parser():
         help="Profit/Rake query in the format 'since|before=01/11/2023' or 'between=01/10/2023-20/10/2023'.\
               Or 'cw'/'pw'/'cm'/'pm' for Current/Previous Week/Month",
     )
+    parser.add_argument(
+        "--cards",
+        dest="cards",
+        help="Find hands by cards pattern, e.g. 'AAxx ds', 'rundown ss', 'KQJT', 'AsKs' or 'pair rainbow'",
+    )
+    parser.add_argument(
+        "--game",
+        dest="game",
+        choices=["NLHE", "PLO4"],
+        help="Game of hands found by --cards or exported by --export",
+    )
+    parser.add_argument(
+        "--export",
+        dest="export",
+        help="Export hand histories of player's hands to the specified file, gzip-compressed if it ends with .gz",
+    )
+    parser.add_argument(
+        "--export-period",
+        dest="export_period",
+        default="all",
+        help="Period of exported hands in the same format as --results",
+    )
+    parser.add_argument(
+        "--stake",
+        dest="stake",
+        type=Decimal,
+        help="Big blind of exported hands in dollars, e.g. 0.25",
+    )
+    parser.add_argument(
+        "--ids",
+        dest="ids",
+        type=int,
+        nargs="+",
+        help="Export only hands with these IDs",
+    )
+    parser.add_argument(
+        "--ids-file",
+        dest="ids_file",
+        help="Export only hands with IDs listed in the file, one per line",
+    )
+    parser.add_argument(
+        "--all-players",
+        dest="all_players",
+        action="store_true",
+        help="Export hands of all players, not only of the player",
+    )
     parser.add_argument(
         "--player",
         dest="player",
@@ -31,6 +132,12 @@ def parser():
         const=True,
         help="Show Chart",
     )
+    parser.add_argument(
+        "--headless",
+        dest="headless",
+        action="store_true",
+        help="Only save Chart to file without showing it (no GUI needed)",
+    )
     parser.add_argument(
         "--save",
         dest="save",
@@ -53,3 +160,27 @@ def print_results(profit, rake):
         print("\nMonthly\t\tProfit\t\tRake")
         for key in rake[2].keys():
             print(f"{key}\t\t{profit[2][key]:.0f}\t\t{rake[2][key]:.0f}")
+
+
+def print_hands(hands):
+    """print hands found by cards"""
+    for id, dt, cards in hands:
+        print(f"{id}\t{dt:%Y-%m-%d %H:%M}\t{cards}")
+    print(f"{len(hands)} hands found")
+
+
+def print_profile(profile):
+    """print import profile"""
+    print(f"\n{'Stage':<16}{'Time, s':<16}{'Calls':<16}{'Items':<16}Items/s")
+    for stage, seconds, calls, items, rate in profile.summary():
+        print(f"{stage:<16}{seconds:<16.3f}{calls:<16}{items:<16}{rate:.0f}")
+    data = profile.to_dict()
+    print(
+        f"\nWall time {data['wall_seconds']:.3f} s: {data['hands_imported']} hands"
+        f" ({data['hands_per_second']:.0f} hands/s),"
+        f" {data['bytes_read'] / 2**20:.1f} MB read ({data['bytes_per_second'] / 2**20:.1f} MB/s)"
+    )
+    if data["skipped"]:
+        print("\nSkipped hands")
+        for reason, count in data["skipped"].items():
+            print(f"{reason:<32}{count}")
@@ -1,22 +1,118 @@
+import os
+import atexit
 import logging
+import queue
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FILE = os.path.join("logs", "tracker.log")
+# number of warnings logged for every skip reason, the rest are only counted
+SKIP_WARNINGS = 3
+
+# all loggers put records to one queue, files and console are written by listener thread
+_queue_handler = None
+_listener = None
 
 
 def logger(name: str):
+    """
+    Returns logger with tracker's handlers. Handlers are created once and shared by all loggers,
+    so calling it again for the same name doesn't duplicate output.
+    """
     lg = logging.getLogger(name)
     lg.setLevel(logging.INFO)
-    # create file handler which logs even debug messages
-    fh = logging.FileHandler("logs\\tracker.log")
-    fh.setLevel(logging.DEBUG)
-    # create console handler with a higher log level
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    # create formatter and add it to the handlers
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    # add the handlers to the logger
-    lg.addHandler(fh)
-    lg.addHandler(ch)
+    handler = _setup()
+    if handler not in lg.handlers:
+        lg.addHandler(handler)
     return lg
+
+
+def _setup() -> QueueHandler:
+    """Creates queue handler and starts listener writing records to file and console"""
+    global _queue_handler
+    if _queue_handler is None:
+        # create file handler which logs even debug messages
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        fh = logging.FileHandler(LOG_FILE)
+        fh.setLevel(logging.DEBUG)
+        # create console handler with a higher log level
+        ch = logging.StreamHandler()
+        ch.setLevel(logging.INFO)
+        # create formatter and add it to the handlers
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        )
+        fh.setFormatter(formatter)
+        ch.setFormatter(formatter)
+        _queue_handler = QueueHandler(queue.SimpleQueue())
+        _start_listener(fh, ch)
+        atexit.register(_stop_listener)
+        # forked pool workers don't inherit listener thread, they start their own.
+        # There is no fork on Windows, spawned workers import this module and start listener
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_listener)
+    return _queue_handler
+
+
+def _start_listener(*handlers: logging.Handler) -> None:
+    global _listener
+    _listener = QueueListener(
+        _queue_handler.queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    """Writes records left in queue, called at exit"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_listener() -> None:
+    """Starts listener in forked process, with new queue as the old one can be locked"""
+    _queue_handler.queue = queue.SimpleQueue()
+    _start_listener(*_listener.handlers)
+    # pool workers exit without atexit handlers, multiprocessing runs finalizers instead
+    from multiprocessing import util
+
+    util.Finalize(None, _stop_listener, exitpriority=0)
+
+
+class SkipCounter:
+    """
+    Aggregated warnings about skipped items: skips are counted by reason, only the first
+    SKIP_WARNINGS of every reason are logged one by one, summary is logged by report.
+    Input:
+        lg: logger warnings are written to
+        limit: number of warnings logged for every reason
+    Methods:
+        skip: counts skipped item, logs %-style message if reason is not over limit
+        pop: returns counts since previous pop and resets them
+        report: logs number of skipped items for every reason
+    """
+
+    def __init__(self, lg: logging.Logger, limit: int = SKIP_WARNINGS) -> None:
+        self.lg = lg
+        self.limit = limit
+        self.counts = Counter()
+        # number of warnings logged for every reason, isn't reset by pop
+        self.logged = Counter()
+
+    def skip(self, reason: str, msg: str = None, *args) -> None:
+        self.counts[reason] += 1
+        if self.logged[reason] > self.limit:
+            return
+        self.logged[reason] += 1
+        if self.logged[reason] <= self.limit:
+            self.lg.warning(msg or reason, *args)
+        else:
+            self.lg.warning("More '%s' warnings are suppressed", reason)
+
+    def pop(self) -> Counter:
+        counts, self.counts = self.counts, Counter()
+        return counts
+
+    def report(self, counts: Counter = None) -> None:
+        counts = self.counts if counts is None else counts
+        for reason, count in counts.most_common():
+            self.lg.warning("%d hands skipped: %s", count, reason)
@@ -0,0 +1,294 @@
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from time import perf_counter
+
+from tracker_utils.storage import Storage
+from tracker_utils.column_cache import ColumnCache
+from tracker_utils.hand_parser import (
+    PREFETCH_BLOCK,
+    prefetch_hh_file,
+    parse_hh_file,
+    init_pool_worker,
+    parse_hh_file_in_pool,
+    skipped,
+)
+from tracker_utils.logger import logger
+from tracker_utils.profiler import (
+    ImportProfile,
+    ParseStats,
+    READ,
+    DB_DEDUPE,
+    INSERT,
+    ALREADY_IMPORTED,
+    IN_DATABASE,
+)
+
+lg = logger(__name__)
+
+# number of hands written to database in one transaction
+BATCH_HANDS = 10000
+# number of files waiting between stages
+QUEUE_SIZE = 16
+# end of stage marker
+STOP = None
+
+
+class ImportPipeline:
+    """
+    Staged import of hand history files. Reader thread reads new part of every file ahead
+    of parser, so its pages are in page cache, parse stage parses memory-mapped files in a thread
+    (or passes their paths to a pool of worker processes that map them), and writer imports hands
+    of many files to database in large batches. Stages are connected by bounded queues,
+    so disk reads, parsing and database round-trips overlap and memory stays limited:
+    files are never kept in memory as a whole.
+    Input:
+        db: database hands are imported to
+        ids: IDs of hands stored in database, imported IDs are added to it
+        workers: number of processes parsing files, 1 parses in a thread of this process
+        batch_size: minimal number of hands written to database in one transaction
+        cache: column cache that is updated with imported hands
+        profile: if set, time of stages, bytes read and skipped hands are measured to it
+        manifest: in-memory copy of import manifest, updated with imported files
+        complete_only: if True, text after the last separator of file is left for the next import,
+            it can be a hand that is still written (watch mode)
+    Methods:
+        run: imports files and returns number of imported hands
+    """
+
+    def __init__(
+        self,
+        db: Storage,
+        ids: set,
+        workers: int = 1,
+        batch_size: int = BATCH_HANDS,
+        queue_size: int = QUEUE_SIZE,
+        cache: ColumnCache = None,
+        profile: ImportProfile = None,
+        manifest: dict[str, tuple[int, int, int]] = None,
+        complete_only: bool = False,
+    ) -> None:
+        self.db = db
+        self.cache = cache
+        self.profile = profile
+        self.manifest = manifest
+        self.complete_only = complete_only
+        self.ids = ids
+        self.workers = workers
+        self.batch_size = batch_size
+        self.read_queue = queue.Queue(maxsize=queue_size)
+        self.parsed_queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.error = None
+        # numbers of hands skipped by parser, by reason
+        self.skipped = Counter()
+
+    def run(self, files: list[tuple[str, int, int, int]]) -> int:
+        """
+        Imports (filepath, offset, size, mtime) files, see Tracker._files_to_import.
+        Files are saved to import manifest after their hands are committed.
+        Skipped hands are reported by reason at the end.
+        """
+        stages = [
+            threading.Thread(
+                target=self._run_stage, args=(self._read, files), daemon=True
+            ),
+            threading.Thread(target=self._run_stage, args=(self._parse,), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        try:
+            hands_imported = self._run_stage(self._write)
+        finally:
+            self.stopped.set()
+            for stage in stages:
+                stage.join()
+        if self.error is not None:
+            raise self.error
+        skipped.report(self.skipped)
+        if self.profile is not None:
+            for reason, count in self.skipped.items():
+                self.profile.skip(reason, count)
+        return hands_imported
+
+    def _run_stage(self, stage, *args):
+        """Runs stage, under cProfile if profile asks for it"""
+        if self.profile is None:
+            return stage(*args)
+        return self.profile.profiled(stage, *args)
+
+    def _stage(self, name: str, items: int = 1):
+        """Context manager measuring stage if profile is enabled"""
+        return (
+            nullcontext() if self.profile is None else self.profile.stage(name, items)
+        )
+
+    def _read(self, files: list[tuple[str, int, int, int]]) -> None:
+        """
+        Reader stage: reads new part of every file by blocks ahead of parser (see prefetch_hh_file)
+        and passes the file to parse stage. Bounded queue limits how far reads run ahead.
+        """
+        buffer = bytearray(PREFETCH_BLOCK)
+        try:
+            for file in files:
+                filepath, offset, size, _ = file
+                start = perf_counter()
+                read = prefetch_hh_file(filepath, offset, size, buffer)
+                if self.profile is not None:
+                    # one call per file, items are bytes read
+                    self.profile.add(READ, perf_counter() - start, read)
+                    self.profile.bytes_read += read
+                if not self._put(self.read_queue, file):
+                    return
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            self._put(self.read_queue, STOP)
+
+    def _parse(self) -> None:
+        """Parse stage: parses files read by reader and passes hands with resume offset to writer"""
+        try:
+            if self.workers > 1:
+                self._parse_in_pool()
+                return
+            while (file := self._get(self.read_queue)) is not STOP:
+                filepath, offset, size, _ = file
+                stats = None if self.profile is None else ParseStats()
+                hands, resume = parse_hh_file(
+                    filepath, self.ids, offset, size, stats, self.complete_only
+                )
+                if not self._put(
+                    self.parsed_queue, (file, hands, resume, skipped.pop(), stats)
+                ):
+                    return
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            self._put(self.parsed_queue, STOP)
+
+    def _parse_in_pool(self) -> None:
+        """
+        Parses files in process pool, keeping a limited number of files in flight and their order.
+        Workers get (filepath, offset, size) and map the file themselves, file data isn't pickled.
+        """
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_pool_worker,
+            initargs=(self.ids, self.profile is not None, self.complete_only),
+        ) as pool:
+            in_flight = deque()
+            while (file := self._get(self.read_queue)) is not STOP:
+                filepath, offset, size, _ = file
+                in_flight.append(
+                    (file, pool.submit(parse_hh_file_in_pool, (filepath, offset, size)))
+                )
+                if len(in_flight) >= 2 * self.workers:
+                    file, task = in_flight.popleft()
+                    if not self._put(self.parsed_queue, (file, *task.result())):
+                        return
+            while in_flight:
+                file, task = in_flight.popleft()
+                if not self._put(self.parsed_queue, (file, *task.result())):
+                    return
+
+    def _write(self) -> int:
+        """
+        Writer stage: collects hands of many files and imports them in batches.
+        IDs of batch are added to ids only after the batch is committed, errors of import
+        are raised, so the pipeline stops and nothing is marked as imported.
+        """
+        hands_imported = 0
+        batch, batch_ids, batch_files = [], set(), []
+        while (item := self._get(self.parsed_queue)) is not STOP:
+            (filepath, _, size, mtime), hands, resume, skipped_hands, stats = item
+            self.skipped.update(skipped_hands)
+            if stats is not None:
+                self.profile.merge(stats)
+            batch_size = len(batch)
+            with self._stage(DB_DEDUPE, len(hands)):
+                for hand in hands:
+                    # the same hand can be saved in several files
+                    if hand[0] not in self.ids and hand[0] not in batch_ids:
+                        batch_ids.add(hand[0])
+                        batch.append(hand)
+            if self.profile is not None:
+                self.profile.skip(
+                    ALREADY_IMPORTED, len(hands) - len(batch) + batch_size
+                )
+            # file with unparsed tail is saved with parsed size, so the next import
+            # finds it grown and parses the tail
+            parsed_size = resume if self.complete_only else size
+            batch_files.append((filepath, parsed_size, mtime, resume))
+            if len(batch) >= self.batch_size:
+                hands_imported += self._flush(batch, batch_ids, batch_files)
+                batch, batch_ids, batch_files = [], set(), []
+        if batch_files:
+            hands_imported += self._flush(batch, batch_ids, batch_files)
+        return hands_imported
+
+    def _flush(
+        self,
+        batch: list,
+        batch_ids: set,
+        batch_files: list[tuple[str, int, int, int]],
+    ) -> int:
+        """
+        Imports batch of hands and saves their files to import manifest in the same transaction.
+        In-memory IDs and manifest are updated only after the commit, so failed batch is parsed
+        again by the next import. Cache is marked incomplete until its rows are appended,
+        so interrupted import can't leave it valid without some hands: if process stops between
+        the commit and append_hands, cache stays invalid on disk and Tracker rebuilds it from
+        database when it is opened or before the next import.
+        """
+        cache_valid = self.cache is not None and self.cache.is_valid()
+        if cache_valid:
+            self.cache.set_valid(False)
+        with self._stage(INSERT, len(batch)):
+            try:
+                hands_imported = self.db.import_hands(batch, batch_files)
+            except Exception:
+                # transaction is rolled back, cache still has the same hands as database
+                if cache_valid:
+                    self.cache.set_valid(True)
+                raise
+        self.ids.update(batch_ids)
+        if self.manifest is not None:
+            for filepath, size, mtime, offset in batch_files:
+                self.manifest[filepath] = (size, mtime, offset)
+        if self.profile is not None and hands_imported < len(batch):
+            self.profile.skip(IN_DATABASE, len(batch) - hands_imported)
+        if cache_valid:
+            if hands_imported == len(batch):
+                self.cache.append_hands(batch)
+                self.cache.set_valid(True)
+            else:
+                self.cache.invalidate()
+        lg.debug(f"{hands_imported} hands of {len(batch_files)} files are imported")
+        return hands_imported
+
+    def _put(self, stage_queue: queue.Queue, item) -> bool:
+        """Puts item to queue, waiting for free place. Returns False if pipeline is stopped"""
+        while not self.stopped.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, stage_queue: queue.Queue):
+        """Gets item from queue, waiting for it. Returns STOP if pipeline is stopped"""
+        while not self.stopped.is_set():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return STOP
+
+    def _fail(self, exc: Exception) -> None:
+        """Keeps the first error of stage threads, run raises it after all stages are finished"""
+        lg.error(exc)
+        if self.error is None:
+            self.error = exc
@@ -0,0 +1,171 @@
+import json
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+# import stages in order of summary
+DISCOVERY = "discovery"
+LOAD_IDS = "load IDs"
+# reader stage: file pages read to page cache ahead of parser, apart from split of mapped file
+READ = "read"
+SPLIT = "split"
+ID_DEDUPE = "ID dedupe"
+PARSE_HAND = "parse_hand"
+COMPRESS = "compress"
+DB_DEDUPE = "DB dedupe"
+INSERT = "insert/commit"
+STAGES = (
+    DISCOVERY,
+    LOAD_IDS,
+    READ,
+    SPLIT,
+    ID_DEDUPE,
+    PARSE_HAND,
+    COMPRESS,
+    DB_DEDUPE,
+    INSERT,
+)
+# skip reasons counted by import, parser's reasons are added by SkipCounter
+TOURNAMENT = "tournament"
+ALREADY_IMPORTED = "already imported"
+IN_DATABASE = "already in database"
+
+
+class ParseStats:
+    """
+    Time and number of items of stages measured by parser, and skipped hands by reason.
+    It is small and picklable, so pool workers return it with parsed hands.
+    """
+
+    def __init__(self) -> None:
+        self.times = Counter()
+        self.calls = Counter()
+        self.items = Counter()
+        self.skipped = Counter()
+
+    def add(self, stage: str, seconds: float, items: int = 1) -> None:
+        self.times[stage] += seconds
+        self.calls[stage] += 1
+        self.items[stage] += items
+
+    def merge(self, other: "ParseStats") -> None:
+        self.times.update(other.times)
+        self.calls.update(other.calls)
+        self.items.update(other.items)
+        self.skipped.update(other.skipped)
+
+
+class ImportProfile(ParseStats):
+    """
+    Instrumentation of import: wall time, calls and items of every stage, bytes read,
+    hands imported and skipped hands by reason. Pipeline stages run concurrently, so their
+    times can add up to more than wall time of import.
+    Input:
+        cprofile: if True every pipeline thread is also run under cProfile
+    Methods:
+        stage: context manager measuring block of code as stage
+        add: adds measured time and items of stage
+        merge: adds stats measured by parser
+        profiled: runs function under cProfile if it is enabled
+        summary: returns rows of summary table
+        to_dict: returns all measurements
+        save_json: writes measurements to JSON file
+        save_cprofile: writes cProfile stats of all threads to file
+    """
+
+    def __init__(self, cprofile: bool = False) -> None:
+        super().__init__()
+        self.bytes_read = 0
+        self.hands_imported = 0
+        self.wall = 0.0
+        self.started = perf_counter()
+        self.lock = threading.Lock()
+        self.cprofile = cprofile
+        self.profilers = []
+
+    @contextmanager
+    def stage(self, stage: str, items: int = 1):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, perf_counter() - start, items)
+
+    def add(self, stage: str, seconds: float, items: int = 1) -> None:
+        # stages are measured in different threads
+        with self.lock:
+            super().add(stage, seconds, items)
+
+    def merge(self, other: ParseStats) -> None:
+        with self.lock:
+            super().merge(other)
+
+    def skip(self, reason: str, count: int = 1) -> None:
+        if count == 0:
+            return
+        with self.lock:
+            self.skipped[reason] += count
+
+    def finish(self, hands_imported: int) -> None:
+        self.hands_imported = hands_imported
+        self.wall = perf_counter() - self.started
+
+    def profiled(self, func, *args):
+        """Runs func under its own cProfile profiler if cprofile is enabled"""
+        if not self.cprofile:
+            return func(*args)
+        import cProfile
+
+        profiler = cProfile.Profile()
+        with self.lock:
+            self.profilers.append(profiler)
+        return profiler.runcall(func, *args)
+
+    def summary(self) -> list[tuple[str, float, int, int, float]]:
+        """Rows of (stage, seconds, calls, items, items per second)"""
+        stages = [stage for stage in STAGES if stage in self.times]
+        stages += [stage for stage in self.times if stage not in STAGES]
+        return [
+            (
+                stage,
+                self.times[stage],
+                self.calls[stage],
+                self.items[stage],
+                self.items[stage] / self.times[stage] if self.times[stage] else 0,
+            )
+            for stage in stages
+        ]
+
+    def to_dict(self) -> dict:
+        wall = self.wall or 1e-9
+        return {
+            "wall_seconds": self.wall,
+            "hands_imported": self.hands_imported,
+            "bytes_read": self.bytes_read,
+            "hands_per_second": self.hands_imported / wall,
+            "bytes_per_second": self.bytes_read / wall,
+            "stages": {
+                stage: {
+                    "seconds": seconds,
+                    "calls": calls,
+                    "items": items,
+                    "items_per_second": rate,
+                }
+                for stage, seconds, calls, items, rate in self.summary()
+            },
+            "skipped": {
+                reason: count for reason, count in self.skipped.most_common() if count
+            },
+        }
+
+    def save_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def save_cprofile(self, path: str) -> None:
+        """Saves combined stats of all profiled threads, readable by pstats or snakeviz"""
+        import pstats
+
+        if self.profilers:
+            pstats.Stats(*self.profilers).dump_stats(path)
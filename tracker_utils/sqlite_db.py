@@ -0,0 +1,601 @@
+import json
+import sqlite3
+import numpy as np
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Iterator
+from tracker_utils.calc import (
+    sum_by_weeks,
+    sum_by_month,
+    sum_cents_by_weeks,
+    sum_cents_by_month,
+    to_epoch,
+)
+from tracker_utils.cards import FEATURES, card_features, conditions_sql
+from tracker_utils.hand_parser import compress_hh, decompress_hh
+from tracker_utils.logger import logger
+from tracker_utils.storage import Storage, IdArray
+
+lg = logger("SQLite")
+
+DEFAULT_PATH = "./hands.sqlite"
+# version of tables layout, saved in user_version of database file after tables are created
+SCHEMA_VERSION = 2
+
+
+class sqlite_db(Storage):
+    """
+    Embedded SQLite storage backend, database is a single file opened in WAL mode.
+    Tables have the same layout as PostgreSQL ones, but amounts are stored as integer cents
+    and datetime as UTC epoch seconds. Report sums are calculated from player's hands read by index,
+    there is no daily stats table.
+    Input:
+        clear_tables: if True delete all data in tables.
+        path: database file, created if it doesn't exist
+    Methods: see Storage
+    """
+
+    def __init__(self, clear_tables=False, path: str = None):
+        self.path = path or DEFAULT_PATH
+        self.HANDS_TABLE = "hands"
+        self.HAND_TEXT_TABLE = "hand_text"
+        self.PLAYERS_TABLE = "players"
+        self.HAND_PLAYERS_TABLE = "hand_players"
+        self.MANIFEST_TABLE = "import_manifest"
+        self.STAGING_HANDS_TABLE = "staging_hands"
+        self.STAGING_PLAYERS_TABLE = "staging_players"
+        self.conn = self._connect()
+        self._check_tables(clear_tables)
+
+    ### Service methods:
+    def _connect(self) -> sqlite3.Connection:
+        """Open database file, readers don't block the writer in WAL mode"""
+        lg.debug(f"Opening SQLite database {self.path}...")
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def close(self) -> None:
+        """Close the database"""
+        if self.conn is not None:
+            self.conn.close()
+
+    def _check_tables(self, clear_tables=False) -> None:
+        """
+        Create tables and indexes if they don't exist, it is skipped if database file is marked
+        with current SCHEMA_VERSION. Temporary staging tables are created for every connection.
+        If clear_tables=True delete all data
+        """
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._create_tables()
+        self._create_staging_tables()
+        if clear_tables:
+            self.clear_table()
+            lg.debug("Tables are cleared")
+
+    def _create_tables(self) -> None:
+        """
+        Create tables and indexes, and mark database with SCHEMA_VERSION.
+        Players' rows imported by previous versions get card features.
+        """
+        self.conn.executescript(
+            f"""
+                CREATE TABLE IF NOT EXISTS {self.HANDS_TABLE}
+                (
+                    id INTEGER PRIMARY KEY,
+                    datetime INTEGER,
+                    game TEXT,
+                    blind_level INTEGER,
+                    players_in_hand INTEGER,
+                    total_pot INTEGER,
+                    rake INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS {self.HAND_TEXT_TABLE}
+                (
+                    hand_id INTEGER PRIMARY KEY REFERENCES {self.HANDS_TABLE} (id) ON DELETE CASCADE,
+                    hh BLOB
+                );
+                CREATE TABLE IF NOT EXISTS {self.PLAYERS_TABLE}
+                (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS {self.HAND_PLAYERS_TABLE}
+                (
+                    hand_id INTEGER REFERENCES {self.HANDS_TABLE} (id) ON DELETE CASCADE,
+                    player_id INTEGER REFERENCES {self.PLAYERS_TABLE} (id),
+                    seat INTEGER,
+                    cards TEXT,
+                    bets INTEGER,
+                    result INTEGER,
+                    card_mask INTEGER,
+                    rank_mask INTEGER,
+                    pair_mask INTEGER,
+                    suits INTEGER,
+                    gaps INTEGER,
+                    PRIMARY KEY (hand_id, seat)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS {self.HAND_PLAYERS_TABLE}_player_idx
+                ON {self.HAND_PLAYERS_TABLE} (player_id, hand_id, bets, result);
+                CREATE INDEX IF NOT EXISTS {self.HANDS_TABLE}_datetime_idx
+                ON {self.HANDS_TABLE} (datetime);
+                CREATE TABLE IF NOT EXISTS {self.MANIFEST_TABLE}
+                (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    parsed_offset INTEGER
+                );
+            """
+        )
+        columns = [
+            row[1]
+            for row in self.conn.execute(
+                f"PRAGMA table_info({self.HAND_PLAYERS_TABLE})"
+            )
+        ]
+        if "card_mask" not in columns:
+            for column in FEATURES:
+                self.conn.execute(
+                    f"ALTER TABLE {self.HAND_PLAYERS_TABLE} ADD COLUMN {column} INTEGER"
+                )
+            self._fill_card_features()
+        self.conn.executescript(
+            f"""
+                CREATE INDEX IF NOT EXISTS {self.HAND_PLAYERS_TABLE}_cards_idx
+                ON {self.HAND_PLAYERS_TABLE}
+                (player_id, suits, gaps, pair_mask, card_mask, rank_mask, hand_id, cards)
+                WHERE card_mask IS NOT NULL;
+                PRAGMA user_version={SCHEMA_VERSION};
+            """
+        )
+        lg.debug("Tables are created")
+
+    def _fill_card_features(self) -> None:
+        """Calculate card features of players' rows that have cards but no features"""
+        rows = self.conn.execute(
+            f"SELECT hand_id, seat, cards FROM {self.HAND_PLAYERS_TABLE}"
+            " WHERE cards IS NOT NULL AND card_mask IS NULL"
+        ).fetchall()
+        with self.conn:
+            self.conn.executemany(
+                f"UPDATE {self.HAND_PLAYERS_TABLE}"
+                f" SET ({', '.join(FEATURES)}) = (?, ?, ?, ?, ?)"
+                " WHERE hand_id = ? AND seat = ?",
+                ((*card_features(cards), id, seat) for id, seat, cards in rows),
+            )
+
+    def _create_staging_tables(self) -> None:
+        """Create temporary tables hands are imported through"""
+        self.conn.executescript(
+            f"""
+                CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_HANDS_TABLE}
+                (
+                    id INTEGER,
+                    datetime INTEGER,
+                    game TEXT,
+                    blind_level INTEGER,
+                    players_in_hand INTEGER,
+                    total_pot INTEGER,
+                    rake INTEGER,
+                    hh BLOB
+                );
+                CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_PLAYERS_TABLE}
+                (
+                    hand_id INTEGER,
+                    seat INTEGER,
+                    name TEXT,
+                    cards TEXT,
+                    bets INTEGER,
+                    result INTEGER,
+                    card_mask INTEGER,
+                    rank_mask INTEGER,
+                    pair_mask INTEGER,
+                    suits INTEGER,
+                    gaps INTEGER
+                );
+            """
+        )
+
+    def clear_table(self) -> None:
+        """Delete all data in tables"""
+        with self.conn:
+            for table in (
+                self.HAND_PLAYERS_TABLE,
+                self.HAND_TEXT_TABLE,
+                self.HANDS_TABLE,
+                self.PLAYERS_TABLE,
+                self.MANIFEST_TABLE,
+            ):
+                self.conn.execute(f"DELETE FROM {table}")
+
+    ### Data Methods:
+    def import_hands(
+        self, hands: tuple | list, files: list[tuple[str, int, int, int]] = None
+    ) -> int:
+        """
+        Import multiple parsed hands. Hands and their players are inserted to staging tables
+        by executemany and merged to hands, hand_text, players and hand_players tables in one
+        transaction, hands that are already in DB are skipped. Returns number of imported hands.
+        Errors roll the transaction back and are raised, so failure doesn't look like duplicates.
+        files are saved to import manifest in the same transaction.
+        """
+        if len(hands) == 0:
+            self.update_manifest(files)
+            return 0
+        with self.conn:
+            cur = self.conn.cursor()
+            cur.executemany(
+                f"INSERT INTO {self.STAGING_HANDS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        hand[0],
+                        to_epoch(hand[1]),
+                        *hand[3:8],
+                        hand[2] if isinstance(hand[2], bytes) else compress_hh(hand[2]),
+                    )
+                    for hand in hands
+                ),
+            )
+            cur.executemany(
+                f"INSERT INTO {self.STAGING_PLAYERS_TABLE}"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (hand[0], seat, *hand[i : i + 4], *card_features(hand[i + 1]))
+                    for hand in hands
+                    for seat, i in enumerate(range(8, len(hand), 4), 1)
+                ),
+            )
+            # hands that are already in DB are removed from staging
+            cur.execute(
+                f"DELETE FROM {self.STAGING_HANDS_TABLE}"
+                f" WHERE id IN (SELECT id FROM {self.HANDS_TABLE})"
+            )
+            cur.execute(
+                f"""
+                    INSERT OR IGNORE INTO {self.HANDS_TABLE}
+                    SELECT id, datetime, game, blind_level, players_in_hand, total_pot, rake
+                    FROM {self.STAGING_HANDS_TABLE}
+                """
+            )
+            imported = cur.rowcount
+            cur.execute(
+                f"""
+                    INSERT OR IGNORE INTO {self.HAND_TEXT_TABLE}
+                    SELECT id, hh FROM {self.STAGING_HANDS_TABLE}
+                """
+            )
+            cur.execute(
+                f"""
+                    INSERT OR IGNORE INTO {self.PLAYERS_TABLE} (name)
+                    SELECT DISTINCT name FROM {self.STAGING_PLAYERS_TABLE}
+                    WHERE hand_id IN (SELECT id FROM {self.STAGING_HANDS_TABLE})
+                """
+            )
+            cur.execute(
+                f"""
+                    INSERT OR IGNORE INTO {self.HAND_PLAYERS_TABLE}
+                    SELECT s.hand_id, p.id, s.seat, s.cards, s.bets, s.result,
+                    s.card_mask, s.rank_mask, s.pair_mask, s.suits, s.gaps
+                    FROM {self.STAGING_PLAYERS_TABLE} s
+                    JOIN {self.PLAYERS_TABLE} p ON p.name = s.name
+                    WHERE s.hand_id IN (SELECT id FROM {self.STAGING_HANDS_TABLE})
+                """
+            )
+            cur.execute(f"DELETE FROM {self.STAGING_HANDS_TABLE}")
+            cur.execute(f"DELETE FROM {self.STAGING_PLAYERS_TABLE}")
+            self._update_manifest(cur, files)
+            cur.close()
+        return imported
+
+    def get_rake(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> list[tuple[datetime, Decimal]]:
+        """Return rake for each hand for specified player and period"""
+        return [
+            (datetime.fromtimestamp(ts, timezone.utc), self._rake_share(*amounts))
+            for ts, *amounts in self._player_hands(
+                "hands.rake, hand_players.bets, hands.total_pot",
+                player,
+                start_date,
+                finish_date,
+                "AND hands.rake>0",
+            )
+        ]
+
+    def get_profit(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> list[tuple[datetime, Decimal]]:
+        """Return profit for each hand for specified player and period"""
+        return [
+            (datetime.fromtimestamp(ts, timezone.utc), Decimal(profit).scaleb(-2))
+            for ts, profit in self._player_hands(
+                "hand_players.result - hand_players.bets",
+                player,
+                start_date,
+                finish_date,
+            )
+        ]
+
+    def get_profit_arrays(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The same as get_profit, but returns UTC datetime64[s] array of hands and int64 array
+        of profit in cents, stored values are used as they are
+        """
+        output = np.array(
+            self._player_hands(
+                "hand_players.result - hand_players.bets",
+                player,
+                start_date,
+                finish_date,
+            ),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        return output[:, 0].astype("datetime64[s]"), output[:, 1]
+
+    def get_summary(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        Return profit and rake for specified player and period: totals, sums by ISO weeks (UTC)
+        and by months (UTC). Player's hands are read once, profit is summed in cents by numpy.
+        """
+        rows = self._player_hands(
+            "hand_players.result - hand_players.bets, hands.rake, hand_players.bets, hands.total_pot",
+            player,
+            start_date,
+            finish_date,
+        )
+        if not rows:
+            return (0, {}, {}), (0, {}, {})
+        output = np.array([row[:2] for row in rows], dtype=np.int64)
+        dates, cents = output[:, 0].astype("datetime64[s]"), output[:, 1]
+        profit = (
+            Decimal(int(cents.sum())).scaleb(-2),
+            sum_cents_by_weeks(dates, cents),
+            sum_cents_by_month(dates, cents),
+        )
+        raked = [
+            (datetime.fromtimestamp(row[0], timezone.utc), self._rake_share(*row[2:]))
+            for row in rows
+            if row[2] > 0
+        ]
+        if not raked:
+            return profit, (0, {}, {})
+        rake = (
+            sum(value for _, value in raked),
+            sum_by_weeks(raked),
+            sum_by_month(raked),
+        )
+        return profit, rake
+
+    @staticmethod
+    def _rake_share(rake: int, bets: int, total_pot: int) -> Decimal:
+        """Player's contributed rake in dollars: rake * (player's bets / total pot)"""
+        return Decimal(rake * bets) / total_pot / 100
+
+    def _player_hands(
+        self,
+        columns: str,
+        player: str,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+        fltr: str = "",
+    ) -> list[tuple]:
+        """Returns hands.datetime and columns for player's hands with bets in period"""
+        sql, params = self._player_hands_sql(
+            columns, player, start_date, finish_date, fltr
+        )
+        return self.conn.execute(sql, params).fetchall()
+
+    def _player_hands_sql(
+        self,
+        columns: str,
+        player: str,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+        fltr: str = "",
+    ) -> tuple[str, list]:
+        """Generate query of player's hands and its parameters. Period includes start_date and excludes finish_date"""
+        params = [player]
+        date_fltr = ""
+        if start_date:
+            date_fltr += f" AND {self.HANDS_TABLE}.datetime >= ?"
+            params.append(to_epoch(start_date))
+        if finish_date:
+            date_fltr += f" AND {self.HANDS_TABLE}.datetime < ?"
+            params.append(to_epoch(finish_date))
+        sql = (
+            f"SELECT {self.HANDS_TABLE}.datetime, {columns} FROM {self.HAND_PLAYERS_TABLE}"
+            f" JOIN {self.HANDS_TABLE} ON {self.HANDS_TABLE}.id = {self.HAND_PLAYERS_TABLE}.hand_id"
+            f" WHERE {self.HAND_PLAYERS_TABLE}.player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = ?)"
+            f" AND {self.HAND_PLAYERS_TABLE}.bets>0 {fltr}{date_fltr}"
+        )
+        return sql, params
+
+    def check_query_plans(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> dict[str, list[str]]:
+        """
+        Runs EXPLAIN QUERY PLAN for report queries. Returns tables that every query
+        reads by full scan, empty lists mean all reports use indexes.
+        """
+        queries = {
+            "rake": self._player_hands_sql(
+                "hands.rake", player, start_date, finish_date, "AND hands.rake>0"
+            ),
+            "profit": self._player_hands_sql(
+                "hand_players.result", player, start_date, finish_date
+            ),
+            "cards": self._cards_sql(
+                [("suits", "in", (22,))], player, start_date, finish_date
+            ),
+        }
+        output = {}
+        for name, (sql, params) in queries.items():
+            plan = self.conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            output[name] = [
+                detail.split()[1] for *_, detail in plan if detail.startswith("SCAN ")
+            ]
+        return output
+
+    def find_hands(
+        self,
+        player: str,
+        conditions: list[tuple],
+        game: str = None,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+    ) -> list[tuple[int, datetime, str]]:
+        """
+        Return (hand id, datetime, cards) of player's hands with known cards matching conditions
+        of cards.parse_pattern, ordered by datetime
+        """
+        sql, params = self._cards_sql(conditions, player, start_date, finish_date, game)
+        return [
+            (id, datetime.fromtimestamp(ts, timezone.utc), cards)
+            for id, ts, cards in self.conn.execute(sql, params)
+        ]
+
+    def _cards_sql(
+        self,
+        conditions: list[tuple],
+        player: str,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+        game: str = None,
+    ) -> tuple[str, list]:
+        """Generate query of find_hands and its parameters"""
+        params = [player]
+        fltr = ""
+        if game:
+            fltr += f" AND {self.HANDS_TABLE}.game = ?"
+            params.append(game)
+        if start_date:
+            fltr += f" AND {self.HANDS_TABLE}.datetime >= ?"
+            params.append(to_epoch(start_date))
+        if finish_date:
+            fltr += f" AND {self.HANDS_TABLE}.datetime < ?"
+            params.append(to_epoch(finish_date))
+        sql = (
+            f"SELECT {self.HANDS_TABLE}.id, {self.HANDS_TABLE}.datetime, {self.HAND_PLAYERS_TABLE}.cards"
+            f" FROM {self.HAND_PLAYERS_TABLE}"
+            f" JOIN {self.HANDS_TABLE} ON {self.HANDS_TABLE}.id = {self.HAND_PLAYERS_TABLE}.hand_id"
+            f" WHERE {self.HAND_PLAYERS_TABLE}.player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = ?)"
+            f" AND {conditions_sql(conditions, self.HAND_PLAYERS_TABLE)}{fltr}"
+            f" ORDER BY {self.HANDS_TABLE}.datetime"
+        )
+        return sql, params
+
+    def iter_hand_texts(
+        self,
+        player: str = None,
+        game: str = None,
+        blind_level: int = None,
+        ids: list[int] = None,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+        batch_size: int = 2000,
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Yields (hand id, hand history) of hands matching all filters that are set, ordered by datetime.
+        SQLite cursor steps through result rows, they are fetched batch_size at a time.
+        """
+        fltr, params = "", []
+        if player is not None:
+            fltr += (
+                f" AND h.id IN (SELECT hand_id FROM {self.HAND_PLAYERS_TABLE}"
+                f" WHERE player_id = (SELECT id FROM {self.PLAYERS_TABLE} WHERE name = ?))"
+            )
+            params.append(player)
+        if game is not None:
+            fltr += " AND h.game = ?"
+            params.append(game)
+        if blind_level is not None:
+            fltr += " AND h.blind_level = ?"
+            params.append(blind_level)
+        if ids is not None:
+            fltr += " AND h.id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(ids)))
+        if start_date:
+            fltr += " AND h.datetime >= ?"
+            params.append(to_epoch(start_date))
+        if finish_date:
+            fltr += " AND h.datetime < ?"
+            params.append(to_epoch(finish_date))
+        cur = self.conn.execute(
+            f"SELECT h.id, t.hh FROM {self.HANDS_TABLE} h"
+            f" JOIN {self.HAND_TEXT_TABLE} t ON t.hand_id = h.id"
+            f" WHERE 1{fltr} ORDER BY h.datetime, h.id",
+            params,
+        )
+        try:
+            while batch := cur.fetchmany(batch_size):
+                for id, hh in batch:
+                    yield id, decompress_hh(hh)
+        finally:
+            cur.close()
+
+    def get_hand_texts(self, ids) -> dict[int, str]:
+        """Returns hand history text of hands with given IDs, hands that are not in DB are missing"""
+        cur = self.conn.execute(
+            f"SELECT hand_id, hh FROM {self.HAND_TEXT_TABLE}"
+            " WHERE hand_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(ids)),),
+        )
+        return {id: decompress_hh(hh) for id, hh in cur.fetchall()}
+
+    def get_all_ids(self, compact: bool = False) -> set[int] | IdArray:
+        """
+        Return the IDs of all hands in database.
+        compact: if True IDs are returned as IdArray (8 bytes per ID)
+        """
+        if compact:
+            cur = self.conn.execute(f"SELECT id FROM {self.HANDS_TABLE} ORDER BY id")
+            return IdArray(row[0] for row in cur)
+        cur = self.conn.execute(f"SELECT id FROM {self.HANDS_TABLE}")
+        return {row[0] for row in cur}
+
+    def iter_hand_players(self, batch_size: int = 100000) -> Iterator[list[tuple]]:
+        """
+        Yields batches of (hand id, epoch seconds, game, blind level, player name, bets, result,
+        hand rake, total pot) rows for every player with bets in every hand, amounts in cents
+        """
+        cur = self.conn.execute(
+            f"SELECT h.id, h.datetime, h.game, h.blind_level, p.name, hp.bets, hp.result,"
+            f" h.rake, h.total_pot FROM {self.HAND_PLAYERS_TABLE} hp"
+            f" JOIN {self.HANDS_TABLE} h ON h.id = hp.hand_id"
+            f" JOIN {self.PLAYERS_TABLE} p ON p.id = hp.player_id"
+            " WHERE hp.bets>0 ORDER BY h.id, hp.seat"
+        )
+        while batch := cur.fetchmany(batch_size):
+            yield batch
+
+    def get_manifest(self) -> dict[str, tuple[int, int, int]]:
+        """Return size, mtime (ns) and parsed offset for every imported file"""
+        cur = self.conn.execute(
+            f"SELECT path, size, mtime_ns, parsed_offset FROM {self.MANIFEST_TABLE}"
+        )
+        return {row[0]: row[1:] for row in cur.fetchall()}
+
+    def update_manifest(self, files: list[tuple[str, int, int, int]]) -> None:
+        """Save (path, size, mtime (ns), parsed offset) of imported files"""
+        if not files:
+            return
+        with self.conn:
+            self._update_manifest(self.conn, files)
+
+    def _update_manifest(self, cur, files: list[tuple[str, int, int, int]]) -> None:
+        """Writes manifest rows of files, transaction is committed by caller"""
+        if files:
+            cur.executemany(
+                f"INSERT OR REPLACE INTO {self.MANIFEST_TABLE} VALUES (?, ?, ?, ?)",
+                files,
+            )
@@ -0,0 +1,255 @@
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from datetime import datetime, date, time, timezone
+from decimal import Decimal
+from typing import Iterator
+
+import numpy as np
+
+from tracker_utils.calc import to_arrays
+from tracker_utils.config import read_config
+from tracker_utils.logger import logger
+
+lg = logger("Storage")
+
+POSTGRESQL = "postgresql"
+SQLITE = "sqlite"
+
+
+class IdArray:
+    """
+    Compact set of hand IDs: sorted array of 64-bit ints, membership is checked by binary search.
+    IDs added after creation are kept in a small set that is merged into the array when it passes
+    threshold (update checks it, import pipeline calls update once per committed batch),
+    so the set doesn't grow with imports and lookups stay binary searches.
+    Input:
+        sorted_ids: IDs in ascending order
+    Methods:
+        add, update: add IDs
+        merge: moves added IDs to sorted array when there are enough of them
+    """
+
+    # added IDs are merged when there are more of them than this or 1/16 of the array
+    MERGE_MIN = 4096
+
+    def __init__(self, sorted_ids=()) -> None:
+        self.ids = array("q", sorted_ids)
+        self.added = set()
+
+    def __contains__(self, id: int) -> bool:
+        # set is read before array, merge replaces them in the opposite order
+        if id in self.added:
+            return True
+        ids = self.ids
+        i = bisect_left(ids, id)
+        return i < len(ids) and ids[i] == id
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.added)
+
+    def add(self, id: int) -> None:
+        if id not in self:
+            self.added.add(id)
+
+    def update(self, ids) -> None:
+        for id in ids:
+            self.add(id)
+        self.merge()
+
+    def merge(self, force: bool = False) -> None:
+        """
+        Merges added IDs into sorted array if they pass threshold (or if force is True).
+        New array is built aside and replaces the old one before the set is cleared,
+        so lookups from other threads never miss an ID.
+        """
+        if not self.added:
+            return
+        if not force and len(self.added) < max(self.MERGE_MIN, len(self.ids) // 16):
+            return
+        added = self.added
+        merged = np.union1d(
+            np.frombuffer(self.ids, dtype=np.int64),
+            np.fromiter(added, dtype=np.int64, count=len(added)),
+        )
+        self.ids = array("q", merged.tobytes())
+        self.added = set()
+
+
+class Storage(ABC):
+    """
+    Interface of hand storage used by Tracker. Backends keep parsed hands, players' results,
+    compressed hand histories and import manifest, and answer report queries.
+    Backend is selected by 'backend' option of [storage] section in config.ini, see open_storage.
+    Methods:
+        close: close connection with DB
+        import_hands: imports multiple parsed hands, returns number of imported hands
+        get_rake: returns rake for each hand for the indicated period
+        get_profit: returns profit/loss for each hand for the indicated period
+        get_profit_arrays: the same as get_profit as numpy arrays of dates and cents
+        get_summary: returns total, weekly and monthly profit and rake for the indicated period
+        get_daily_summary: the same as get_summary for periods aligned to UTC days
+        rebuild_daily_stats: recalculates daily stats, if backend keeps them
+        check_query_plans: returns tables that report queries can't read by index
+        get_hand_texts: returns hand history text of hands with given IDs
+        find_hands: returns player's hands with cards matching card pattern conditions
+        iter_hand_texts: yields hand history text of hands matching filters, for export
+        get_all_ids: returns all IDs for hands stored in DB, optionally as compact IdArray
+        iter_hand_players: yields rows of players with bets in all hands, in batches
+        get_manifest: returns size, mtime and parsed offset of every imported file
+        update_manifest: saves size, mtime and parsed offset of imported files
+        clear_table: deletes all data
+    """
+
+    @abstractmethod
+    def close(self) -> None:
+        """Close the connection to database"""
+
+    @abstractmethod
+    def import_hands(
+        self, hands: tuple | list, files: list[tuple[str, int, int, int]] = None
+    ) -> int:
+        """
+        Import multiple parsed hands, hands that already exist are skipped. Returns number of
+        imported hands. (path, size, mtime (ns), parsed offset) of files the hands were parsed from
+        are saved to import manifest in the same transaction. Errors roll it back and are raised.
+        """
+
+    @abstractmethod
+    def get_rake(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> list[tuple[datetime, Decimal]]:
+        """Return rake for each hand for specified player and period"""
+
+    @abstractmethod
+    def get_profit(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> list[tuple[datetime, Decimal]]:
+        """Return profit for each hand for specified player and period"""
+
+    def get_profit_arrays(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The same as get_profit, but returns UTC datetime64[s] array of hands and int64 array
+        of profit in cents
+        """
+        return to_arrays(self.get_profit(player, start_date, finish_date))
+
+    @abstractmethod
+    def get_summary(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        Return profit and rake for specified player and period: totals, sums by ISO weeks (UTC)
+        and by months (UTC)
+        """
+
+    def get_daily_summary(
+        self, player: str, start_date: date = None, finish_date: date = None
+    ) -> tuple[
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+        tuple[Decimal, dict[Decimal], dict[Decimal]],
+    ]:
+        """
+        The same as get_summary for period [start_date, finish_date) in UTC days.
+        Backends without daily stats answer it from hands.
+        """
+        start_date, finish_date = (
+            datetime.combine(day, time(), timezone.utc) if day else None
+            for day in (start_date, finish_date)
+        )
+        return self.get_summary(player, start_date, finish_date)
+
+    def rebuild_daily_stats(self) -> None:
+        """Recalculate daily stats from all hands, backends without daily stats have nothing to do"""
+        lg.debug("Storage doesn't keep daily stats")
+
+    @abstractmethod
+    def check_query_plans(
+        self, player: str, start_date: datetime = None, finish_date: datetime = None
+    ) -> dict[str, list[str]]:
+        """Returns tables that every report query reads without index"""
+
+    @abstractmethod
+    def get_hand_texts(self, ids) -> dict[int, str]:
+        """Returns hand history text of hands with given IDs, hands that are not in DB are missing"""
+
+    @abstractmethod
+    def find_hands(
+        self,
+        player: str,
+        conditions: list[tuple],
+        game: str = None,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+    ) -> list[tuple[int, datetime, str]]:
+        """
+        Return (hand id, datetime, cards) of player's hands with known cards matching conditions
+        of cards.parse_pattern, ordered by datetime
+        """
+
+    @abstractmethod
+    def iter_hand_texts(
+        self,
+        player: str = None,
+        game: str = None,
+        blind_level: int = None,
+        ids: list[int] = None,
+        start_date: datetime = None,
+        finish_date: datetime = None,
+        batch_size: int = 2000,
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Yields (hand id, hand history) of hands matching all filters that are set, ordered by datetime.
+        Hands are streamed batch_size at a time, so memory doesn't depend on number of hands.
+        """
+
+    @abstractmethod
+    def get_all_ids(self, compact: bool = False) -> set[int] | IdArray:
+        """Return the IDs of all hands in database, optionally as IdArray"""
+
+    @abstractmethod
+    def iter_hand_players(self, batch_size: int = 100000) -> Iterator[list[tuple]]:
+        """
+        Yields batches of (hand id, epoch seconds, game, blind level, player name, bets, result,
+        hand rake, total pot) rows for every player with bets in every hand, amounts in cents
+        """
+
+    @abstractmethod
+    def get_manifest(self) -> dict[str, tuple[int, int, int]]:
+        """Return size, mtime (ns) and parsed offset for every imported file"""
+
+    @abstractmethod
+    def update_manifest(self, files: list[tuple[str, int, int, int]]) -> None:
+        """Save (path, size, mtime (ns), parsed offset) of imported files"""
+
+    @abstractmethod
+    def clear_table(self) -> None:
+        """Delete all data in tables"""
+
+
+def open_storage(clear_tables: bool = False) -> Storage:
+    """
+    Connects to storage backend selected in [storage] section of config.ini:
+    backend=postgresql (default, connection parameters in [postgresql] section)
+    or backend=sqlite (database file in 'path' option).
+    """
+    try:
+        config = read_config(section="storage")
+    except Exception:
+        config = {}
+    backend = config.get("backend", POSTGRESQL)
+    # backends are imported on demand, sqlite doesn't need PostgreSQL driver
+    if backend == POSTGRESQL:
+        from tracker_utils.db import tracker_db
+
+        return tracker_db(clear_tables=clear_tables)
+    if backend == SQLITE:
+        from tracker_utils.sqlite_db import sqlite_db
+
+        return sqlite_db(clear_tables=clear_tables, path=config.get("path"))
+    raise Exception(f"Unknown storage backend '{backend}' in config.ini")
@@ -1,21 +1,46 @@
 import os
 from decimal import Decimal
-from datetime import datetime
-import matplotlib.pyplot as plt
+from datetime import datetime, timezone
+from time import perf_counter
+import numpy as np
 from typing import Literal
 
-from tracker_utils.db import tracker_db
+from tracker_utils.storage import Storage, open_storage
+from tracker_utils.cards import parse_pattern
+from tracker_utils.column_cache import ColumnCache, open_cache
 from tracker_utils.calc import (
     period_to_dates,
     cumulate_profit,
-    sum_by_weeks,
-    sum_by_month,
+    is_day_start,
+    downsample,
 )
-from tracker_utils.hand_parser import parse_file
+from tracker_utils.profiler import ImportProfile, LOAD_IDS, DISCOVERY
 from tracker_utils.logger import logger
 
 PERIODS = Literal["cw", "pw", "cm", "pm"]
 OUTPUT_DIR = r"./charts/"
+# maximum number of points drawn on chart, longer curves are downsampled
+CHART_POINTS = 4000
+
+
+def import_offset(
+    filepath: str, stat: os.stat_result, manifest: dict[str, tuple[int, int, int]]
+) -> int | None:
+    """
+    Returns offset where parsing of file starts, None if file hasn't changed since previous import.
+    Grown files are parsed from the offset where previous import stopped, otherwise file
+    was rewritten and is parsed from start.
+    """
+    if filepath not in manifest:
+        return 0
+    imported_size, imported_mtime, imported_offset = manifest[filepath]
+    # unchanged file
+    if stat.st_size == imported_size and stat.st_mtime_ns == imported_mtime:
+        return None
+    # grown file
+    if stat.st_size > imported_size:
+        return imported_offset
+    return 0
 
 
 class Tracker:
@@ -25,36 +50,143 @@ class Tracker:
         player: Player name, for whom rake and profit will be calculated.
         clear_tables: If True delete all records in database.
         chart: If True the Won/Loss graph will be shown and saved after calling get_profit.
+        headless: If True the graph is only saved to file, it is drawn by Agg without GUI.
     Methods:
         import_hh: Imports all Hand History files from specified path to database.
         get_rake: Calculate contributed rake.
         get_profit: Calculate profit.
+        get_results: Calculate profit and rake together.
+        find_hands: Search player's hands by pattern of cards.
+        export_hh: Write hand histories matching filters to file.
+        import_files: Imports parts of files, used by watch mode.
+        rebuild_cache: Fill column cache with all hands from database.
+        close: Close database connection if it was opened.
+    Database is connected (and column cache is opened) on first use, so commands that don't
+    need them start fast.
     """
 
-    def __init__(self, player="0xferr", clear_tables=False, chart=False) -> None:
+    def __init__(
+        self, player="0xferr", clear_tables=False, chart=False, headless=False
+    ) -> None:
         self.lg = logger(__name__)
-        self.db = tracker_db(clear_tables=clear_tables)
+        self.clear_tables = clear_tables
+        self._db = None
+        self._cache = None
+        self._cache_opened = False
         self.chart = chart
+        self.headless = headless
         self.player = player
+        if clear_tables:
+            # tables are cleared right away, not on first use
+            self.db
 
-    def import_hh(self, path: str) -> int:
+    @property
+    def db(self) -> Storage:
+        """Storage backend, connected on first use"""
+        if self._db is None:
+            self._db = open_storage(clear_tables=self.clear_tables)
+        return self._db
+
+    @property
+    def cache(self) -> ColumnCache | None:
+        """
+        Optional column cache of reports data, see [cache] section of config.ini.
+        It is opened on first use, and cleared or rebuilt to match database.
+        """
+        if not self._cache_opened:
+            self._cache_opened = True
+            self._cache = open_cache()
+            if self._cache is not None:
+                if self.clear_tables:
+                    self._cache.clear()
+                elif not self._cache.is_valid():
+                    self._cache.rebuild(self.db)
+        return self._cache
+
+    def close(self) -> None:
+        """Closes database connection if it was opened"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def import_hh(
+        self, path: str, workers: int = 1, profile: ImportProfile = None
+    ) -> int:
         """
         imports all Hand History files from specified path to database.
+        Files that haven't changed since previous import are skipped, grown files are parsed
+        from the offset where previous import stopped.
+        Files are read, parsed and written to database by pipeline stages running concurrently,
+        hands of many files are written in one batch.
+        workers: if more than 1, files are parsed in a pool of worker processes,
+        and parsed hands are written to database by this process only.
+        profile: if set, time and throughput of import stages are measured to it.
+        """
+        start = perf_counter()
+        ids = self.db.get_all_ids(compact=True)
+        loaded = perf_counter()
+        files = self._files_to_import(path, self.db.get_manifest())
+        if profile is not None:
+            profile.add(LOAD_IDS, loaded - start, len(ids))
+            profile.add(DISCOVERY, perf_counter() - loaded, len(files))
+        return self.import_files(files, ids, workers, profile)
+
+    def import_files(
+        self,
+        files: list[tuple[str, int, int, int]],
+        ids: set,
+        workers: int = 1,
+        profile: ImportProfile = None,
+        manifest: dict[str, tuple[int, int, int]] = None,
+        complete_only: bool = False,
+    ) -> int:
+        """
+        Imports (filepath, offset, size, mtime) parts of files, hands with IDs in ids are skipped.
+        IDs of imported hands are added to ids. If manifest is set, it is updated together with
+        import manifest in database, so callers can keep it in memory between imports.
+        Column cache that misses some hands (e.g. some hands of batch were already in database)
+        is rebuilt before and after import, so it isn't left out of date.
+        complete_only: if True, the last block of every file is imported only when the next hand
+        follows it, so a hand that is still written isn't imported (watch mode).
+        """
+        # parser and pipeline are loaded only for import
+        from tracker_utils.pipeline import ImportPipeline
+
+        self._refresh_cache()
+        hands_imported = ImportPipeline(
+            self.db,
+            ids,
+            workers,
+            cache=self.cache,
+            profile=profile,
+            manifest=manifest,
+            complete_only=complete_only,
+        ).run(files)
+        self._refresh_cache()
+        if profile is not None:
+            profile.finish(hands_imported)
+        self.lg.info(f"Hands imported {hands_imported}")
+        return hands_imported
+
+    def _files_to_import(
+        self, path: str, manifest: dict[str, tuple[int, int, int]]
+    ) -> list[tuple[str, int, int, int]]:
+        """
+        Returns (filepath, offset, size, mtime) of Hand History files in specified folder and its subfolders
+        that are new or changed since previous import. Offset is where parsing of the file starts.
         """
-        ids = self.db.get_all_ids()
-        hands_imported = 0
+        output = []
         for subdir, dirs, files in os.walk(path):
             self.lg.debug(f"importing {subdir + os.sep}")
             for file in files:
-                filepath = subdir + os.sep + file
-                if file.endswith(".txt"):
-                    with open(filepath, "r") as f:
-                        hh = f.read()
-                        res = parse_file(hh, ids)
-                        if res:
-                            hands_imported += self.db.import_hands(res)
-        self.lg.info(f"Hands imported {hands_imported}")
-        return hands_imported
+                if not file.endswith(".txt"):
+                    continue
+                filepath = os.path.abspath(subdir + os.sep + file)
+                stat = os.stat(filepath)
+                offset = import_offset(filepath, stat, manifest)
+                if offset is not None:
+                    output.append((filepath, offset, stat.st_size, stat.st_mtime_ns))
+        return output
 
     def get_rake(
         self,
@@ -71,13 +203,7 @@ class Tracker:
         """
         if period:
             start_date, end_date = period_to_dates(period)
-        result = self.db.get_rake(self.player, start_date, end_date)
-        if not result:
-            return 0, {}, {}
-        total_rake = sum(map(lambda x: x[1], result))
-        weekly = sum_by_weeks(result)
-        monthly = sum_by_month(result)
-        return total_rake, weekly, monthly
+        return self._summary(start_date, end_date)[1]
 
     def get_profit(
         self,
@@ -92,37 +218,157 @@ class Tracker:
         end_date: indicate until what date the rake is calculated
         IMPORTANT! if predefined_period is set, start and end dates will be overwritten
         """
+        return self.get_results(period, start_date, end_date)[0]
+
+    def get_results(
+        self,
+        period: PERIODS = None,
+        start_date: datetime = None,
+        end_date: datetime = None,
+    ) -> tuple[
+        [Decimal, dict[Decimal], dict[Decimal]], [Decimal, dict[Decimal], dict[Decimal]]
+    ]:
+        """
+        Calculate profit/loss and contributed rake in one pass. Returns profit and rake
+        in the same format as get_profit and get_rake do. Arguments are the same as well.
+        """
         if period:
             start_date, end_date = period_to_dates(period)
-        result = self.db.get_profit(self.player, start_date, end_date)
-        if not result:
-            return 0, {}, {}
-        total_profit = sum(map(lambda x: x[1], result))
-        weekly = sum_by_weeks(result)
-        monthly = sum_by_month(result)
+        profit, rake = self._summary(start_date, end_date)
         if self.chart:
-            self._draw_chart(result)
-        return total_profit, weekly, monthly
-
-    def _draw_chart(self, data) -> None:
-        """
-        It draws chart based on provided data, and saves it to file.
-        """
-        sorted_res = sorted(data, key=lambda x: x[0])
-        dates, values = zip(*sorted_res)
-        sum_profit = cumulate_profit(values)
-        hands = [i for i in range(len(values))]
-        plt.figure(figsize=(19.2, 10.8))
-        plt.plot(hands, sum_profit, linestyle="-", color="g")
-        plt.title("Profit")
-        plt.xlabel("Hands")
-        plt.ylabel("Profit, $")
-        plt.xlim(xmin=0)
-        plt.grid(True)
+            source = self.cache if self._cache_ready() else self.db
+            dates, cents = source.get_profit_arrays(self.player, start_date, end_date)
+            if len(dates):
+                self._draw_chart(dates, cents)
+        return profit, rake
+
+    def find_hands(
+        self,
+        pattern: str,
+        game: str = None,
+        period: PERIODS = None,
+        start_date: datetime = None,
+        end_date: datetime = None,
+    ) -> list[tuple[int, datetime, str]]:
+        """
+        Search player's hands with known cards by card pattern, e.g. 'AAxx ds' or 'rundown ss'
+        (see cards.parse_pattern). Returns (hand id, datetime, cards) ordered by datetime.
+        Pattern is matched by indexed card features in database, raises ValueError if it is wrong.
+        game: NLHE or PLO4, all games if not set
+        period, start_date, end_date: the same as in get_results
+        """
+        if period:
+            start_date, end_date = period_to_dates(period)
+        return self.db.find_hands(
+            self.player, parse_pattern(pattern), game, start_date, end_date
+        )
+
+    def export_hh(
+        self,
+        path: str,
+        all_players: bool = False,
+        game: str = None,
+        stake: int = None,
+        ids: list[int] = None,
+        period: PERIODS = None,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        compress: bool = None,
+    ) -> int:
+        """
+        Export hand histories of player's hands to file, in the same format as poker client
+        writes them. Hands are streamed from database to file, so any number of hands can be exported.
+        Returns number of exported hands.
+        all_players: if True hands of all players are exported
+        game: NLHE or PLO4, stake: big blind in cents, ids: only hands with these IDs
+        period, start_date, end_date: the same as in get_results
+        compress: gzip output, by default if path ends with .gz
+        """
+        # export writer is loaded only for export
+        from tracker_utils.export import write_hands
+
+        if period:
+            start_date, end_date = period_to_dates(period)
+        hands = self.db.iter_hand_texts(
+            None if all_players else self.player,
+            game,
+            stake,
+            ids,
+            start_date,
+            end_date,
+        )
+        count = write_hands(hands, path, compress)
+        self.lg.info(f"Hands exported {count}")
+        return count
+
+    def _summary(self, start_date: datetime = None, end_date: datetime = None):
+        """
+        Returns profit and rake from column cache if it is enabled, from daily stats
+        if period is aligned to UTC days, otherwise they are calculated from hands.
+        """
+        if self._cache_ready():
+            return self.cache.get_summary(self.player, start_date, end_date)
+        if is_day_start(start_date) and is_day_start(end_date):
+            start_date = (
+                start_date.astimezone(timezone.utc).date() if start_date else None
+            )
+            end_date = end_date.astimezone(timezone.utc).date() if end_date else None
+            return self.db.get_daily_summary(self.player, start_date, end_date)
+        return self.db.get_summary(self.player, start_date, end_date)
+
+    def _cache_ready(self) -> bool:
+        """True if column cache is enabled and contains all hands"""
+        return self.cache is not None and self.cache.is_valid()
+
+    def _refresh_cache(self) -> None:
+        """Rebuilds column cache if it is enabled and misses some hands"""
+        if self.cache is not None and not self.cache.is_valid():
+            self.lg.warning("Cache is out of date, it is rebuilt from database")
+            self.cache.rebuild(self.db)
+
+    def rebuild_cache(self) -> None:
+        """Fills column cache with all hands from database"""
+        if self.cache is None:
+            self.lg.error(
+                "Cache is not enabled, set its folder in [cache] section of config.ini"
+            )
+            return
+        self.cache.rebuild(self.db)
+
+    def _draw_chart(self, dates: np.ndarray, cents: np.ndarray) -> None:
+        """
+        It draws chart based on provided data (datetime64 and profit in cents arrays), and saves it to file.
+        Curves longer than CHART_POINTS are downsampled. In headless mode figure is rendered by Agg
+        and only saved, otherwise it is also shown.
+        """
+        order = np.argsort(dates, kind="stable")
+        sum_profit = cumulate_profit(cents[order]) / 100
+        hands = downsample(sum_profit, CHART_POINTS)
+        dates = dates[order[[0, -1]]].astype(datetime)
+        # matplotlib is slow to import, it is loaded only for charts
+        if self.headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            fig = Figure(figsize=(19.2, 10.8))
+            FigureCanvasAgg(fig)
+        else:
+            import matplotlib.pyplot as plt
+
+            fig = plt.figure(figsize=(19.2, 10.8))
+        ax = fig.add_subplot()
+        ax.plot(hands, sum_profit[hands], linestyle="-", color="g")
+        ax.set_title("Profit")
+        ax.set_xlabel("Hands")
+        ax.set_ylabel("Profit, $")
+        ax.set_xlim(xmin=0)
+        ax.grid(True)
         file_name = (
             f"chart_{dates[0].year}-{dates[0].month}-{dates[0].day}"
             f"_to_{dates[-1].year}-{dates[-1].month}-{dates[-1].day}.png"
         )
-        plt.savefig(OUTPUT_DIR + file_name)
-        plt.show()
-        plt.close()
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        fig.savefig(OUTPUT_DIR + file_name)
+        if not self.headless:
+            plt.show()
+            plt.close(fig)
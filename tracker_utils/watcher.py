@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+
+from tracker_utils.tracker import Tracker, import_offset
+from tracker_utils.logger import logger
+
+lg = logger(__name__)
+
+# seconds between checks of folder
+POLL_INTERVAL = 1.0
+# file is imported when it wasn't modified for this time, so the last hand is written completely
+SETTLE_TIME = 1.0
+
+# inotify events, see inotify(7)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    Minimal inotify(7) binding by ctypes, Linux only. Watches folder and its subfolders
+    and returns paths of files that were created or modified.
+    Input:
+        path: folder to watch
+    Methods:
+        read: waits for events up to timeout, returns changed files (None if events were lost)
+        close: closes inotify instance
+    """
+
+    def __init__(self, path: str) -> None:
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}
+        self._add_tree(path)
+
+    def _add_tree(self, path: str) -> None:
+        for subdir, dirs, files in os.walk(path):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(subdir), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {subdir}")
+            self.folders[wd] = subdir
+
+    def read(self, timeout: float) -> set[str] | None:
+        changed = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, pos)
+            name = data[pos + EVENT.size : pos + EVENT.size + length].rstrip(b"\0")
+            pos += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self.folders:
+                continue
+            path = os.path.join(self.folders[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # new folder, e.g. month folder, its files are found by scan
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                    changed.add(path)
+            else:
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def open_inotify(path: str) -> Inotify | None:
+    """Returns Inotify watching path, None if inotify isn't available"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return Inotify(path)
+    except (OSError, AttributeError) as error:
+        lg.warning(f"inotify isn't available, folder is polled: {error}")
+        return None
+
+
+class Watcher:
+    """
+    Watch mode: imports new hands while poker client writes hand history files.
+    IDs of hands and import manifest are loaded once and kept in memory. Changed files
+    are found by inotify events (or by stat of files in folder, if inotify isn't available),
+    and only bytes appended since previous import are read. File is imported when it wasn't
+    modified for SETTLE_TIME, and only hands followed by separator are parsed, so hand that
+    is being written isn't imported: the last hand of file waits for the next hand
+    (or for a regular import, that parses whole files).
+    Input:
+        tracker: Tracker hands are imported by
+        path: folder of hand history files
+        workers: number of processes parsing files
+        interval: seconds between checks of folder
+        settle: seconds file has to be unmodified before import
+        inotify: if False folder is always polled
+    Methods:
+        run: watches folder until interrupted, calls on_import after every import of new hands,
+            failed import is logged and retried
+        check: imports changed files once, returns number of imported hands
+    """
+
+    def __init__(
+        self,
+        tracker: Tracker,
+        path: str,
+        workers: int = 1,
+        interval: float = POLL_INTERVAL,
+        settle: float = SETTLE_TIME,
+        inotify: bool = True,
+    ) -> None:
+        self.tracker = tracker
+        self.path = path
+        self.workers = workers
+        self.interval = interval
+        self.settle = settle
+        self.ids = tracker.db.get_all_ids(compact=True)
+        self.manifest = tracker.db.get_manifest()
+        self.inotify = open_inotify(path) if inotify else None
+        # changed files waiting for import
+        self.pending = set()
+        # (size, mtime) of files when they were imported, manifest keeps parsed size of file
+        # with unfinished last hand, so it would look changed on every scan
+        self.checked = {}
+        self._scan()
+
+    def run(self, on_import=None, rounds: int = None) -> None:
+        """Watches folder, rounds limits number of checks (until interrupted if None)"""
+        lg.info(
+            f"Watching {self.path} ({'inotify' if self.inotify else 'polling'}),"
+            " press Ctrl+C to stop"
+        )
+        try:
+            while rounds is None or rounds > 0:
+                if self.pending:
+                    try:
+                        hands_imported = self.check()
+                    except Exception as exc:
+                        # files stay pending, import is retried on the next round
+                        lg.error(f"Import failed, it is retried: {exc}")
+                        hands_imported = 0
+                    if hands_imported and on_import is not None:
+                        on_import(hands_imported)
+                self._wait()
+                if rounds is not None:
+                    rounds -= 1
+        except KeyboardInterrupt:
+            lg.info("Watch mode is stopped")
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+
+    def check(self) -> int:
+        """
+        Imports pending files that are settled, returns number of imported hands.
+        If import fails, its files stay pending and the error is raised.
+        """
+        files = []
+        now = time.time_ns()
+        for filepath in list(self.pending):
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                self.pending.discard(filepath)
+                continue
+            # file is still written
+            if now - stat.st_mtime_ns < self.settle * 1e9:
+                continue
+            self.pending.discard(filepath)
+            offset = self._import_offset(filepath, stat)
+            if offset is not None:
+                files.append((filepath, offset, stat.st_size, stat.st_mtime_ns))
+        if not files:
+            return 0
+        try:
+            hands_imported = self.tracker.import_files(
+                files,
+                self.ids,
+                self.workers,
+                manifest=self.manifest,
+                complete_only=True,
+            )
+        except Exception:
+            # manifest has only committed batches, the rest of files is imported again
+            self.pending.update(file[0] for file in files)
+            raise
+        for filepath, _, size, mtime in files:
+            self.checked[filepath] = (size, mtime)
+        return hands_imported
+
+    def _import_offset(self, filepath: str, stat: os.stat_result) -> int | None:
+        """The same as tracker.import_offset, None for file that hasn't changed since check"""
+        if self.checked.get(filepath) == (stat.st_size, stat.st_mtime_ns):
+            return None
+        return import_offset(filepath, stat, self.manifest)
+
+    def _wait(self) -> None:
+        """Waits for changed files: inotify events or the next poll of folder"""
+        if self.inotify is None:
+            time.sleep(self.interval)
+            self._scan()
+            return
+        changed = self.inotify.read(self.interval)
+        if changed is None:
+            # events were lost
+            self._scan()
+            return
+        for path in changed:
+            if os.path.isdir(path):
+                self._scan(path)
+            elif path.endswith(".txt"):
+                self.pending.add(os.path.abspath(path))
+
+    def _scan(self, path: str = None) -> None:
+        """Adds files that changed since previous import to pending, only stat is read"""
+        for subdir, dirs, files in os.walk(path or self.path):
+            for file in files:
+                if not file.endswith(".txt"):
+                    continue
+                filepath = os.path.abspath(os.path.join(subdir, file))
+                try:
+                    stat = os.stat(filepath)
+                except FileNotFoundError:
+                    continue
+                if self._import_offset(filepath, stat) is not None:
+                    self.pending.add(filepath)